@@ -0,0 +1,30 @@
+import argparse
+import os
+from services.analysis_store_service import DATABASE
+from services.batch_analysis_service import run_batch_analysis
+from services.sentiment_service import run_sentiment_scoring
+
+def main():
+    parser = argparse.ArgumentParser(description='Precomputes the text analysis of every review into the review_analysis table.')
+    parser.add_argument('--database', default=DATABASE, help='Path to the SQLite database')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes, each with its own spaCy model')
+    parser.add_argument('--chunk-size', type=int, default=2000, help='Reviews per worker task (and per write transaction)')
+    parser.add_argument('--batch-size', type=int, default=256, help='Reviews per nlp.pipe batch inside a worker')
+    parser.add_argument('--rebuild', action='store_true', help='Drop stored results and checkpoints and analyze everything again')
+    parser.add_argument('--analysis-cache', metavar='PATH', help='SQLite file in which the workers share analyses of repeated review texts')
+    parser.add_argument('--sentiment-only', action='store_true', help='Only score the sentiment columns used by the search filters (no spaCy)')
+    args = parser.parse_args()
+
+    if not args.sentiment_only:
+        print(f"Analyzing reviews in {args.database} with {args.workers} worker(s)...")
+        count = run_batch_analysis(args.database, workers=args.workers, chunk_size=args.chunk_size,
+                                   batch_size=args.batch_size, rebuild=args.rebuild,
+                                   analysis_cache=args.analysis_cache)
+        print(f"Done, {count} reviews analyzed")
+
+    print(f"Scoring review sentiment in {args.database}...")
+    count = run_sentiment_scoring(args.database, workers=args.workers)
+    print(f"Done, {count} reviews scored")
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,28 @@
-from flask import Flask, render_template, request, send_file, abort, jsonify
-from services.visualization_service import generate_top_authors_svg, create_top_genres_chart, create_top_publishers_chart, create_top_developers_chart, VisualizationService
-from services.db_service import cached_get_reviews, get_total_reviews_count, get_review_by_id, get_games_list, get_unique_genres
-from services.text_analysis_service import TextAnalysisService
-import sqlite3
+import hashlib
+import io
+from flask import Flask, render_template, request, send_file, abort, jsonify, url_for
+from services.visualization_service import generate_top_authors_svg, create_top_genres_chart, create_top_publishers_chart, create_top_developers_chart, VisualizationService, WORD_CLOUD_FORMATS
+from services.db_service import cached_get_reviews, get_reviews_page, get_review_by_id, get_games_list, get_unique_genres, count_cache
+from services.analysis_store_service import get_review_analyses
+from services.connection_service import clear_table_checks, get_read_connection
+from services.chart_cache_service import chart_cache
+from services.aggregate_service import get_data_version
+from services.analysis_cache_service import ANALYSIS_CACHE_PATH
+from services.text_analysis_service import text_analysis_service
 
 app = Flask(__name__)
 visualizer = VisualizationService()
-text_analysis_service = TextAnalysisService()
+
+# Unranked result sets larger than this are reported as "10,000+" instead of counted exactly
+COUNT_LIMIT = 10000
+# search.html only shows the named entities of each review
+SEARCH_ANALYSIS_FEATURES = ('entities',)
+# Word cloud URLs carry the data version, so browsers may keep the images this long
+WORD_CLOUD_MAX_AGE = 86400
+
+# Analyses computed on demand are shared between the server's worker processes;
+# the file is only opened by the first lookup of each worker thread
+text_analysis_service.cache.open_disk_tier(ANALYSIS_CACHE_PATH)
 
 # Add built-in functions to Jinja2 context
 app.jinja_env.globals.update(
@@ -27,6 +43,7 @@ def search():
     scoring_method = request.args.get('scoring_method', 'tfidf')
     selected_game = request.args.get('game_id', '')
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', '')
     
     # New filters
     date_from = request.args.get('date_from', '')
@@ -35,13 +52,16 @@ def search():
     min_funny = request.args.get('min_funny', type=int)
     received_free = request.args.get('received_free') == 'true'
     early_access = request.args.get('early_access') == 'true'
+    min_polarity = request.args.get('min_polarity', type=float)
+    sort = request.args.get('sort', '')
     
     # Get all games for the dropdown
     games_list = get_games_list()
     
-    # Get reviews with all filters
-    reviews = cached_get_reviews(
+    # Get one page of reviews with all filters, together with the total count
+    results = get_reviews_page(
         page=page,
+        cursor=cursor,
         keyword=keyword,
         filter_option=filter_option,
         scoring_method=scoring_method,
@@ -51,35 +71,28 @@ def search():
         min_playtime=min_playtime,
         min_funny=min_funny,
         received_free=received_free,
-        early_access=early_access
+        early_access=early_access,
+        min_polarity=min_polarity,
+        sort=sort,
+        count_limit=COUNT_LIMIT
     )
+    reviews = results.reviews
     
     # Add text analysis including named entities for each review
-    for review in reviews:
-        if 'content' in review:
-            review['analysis'] = text_analysis_service.analyze_text(review['content'])
+    # (read from the precomputed review_analysis table, computed on demand if missing)
+    for review, analysis in zip(reviews, get_review_analyses(reviews, features=SEARCH_ANALYSIS_FEATURES)):
+        review['analysis'] = analysis
     
     # Calculate total pages
-    total_reviews = get_total_reviews_count(
-        keyword=keyword,
-        filter_option=filter_option,
-        game_id=selected_game,
-        date_from=date_from,
-        date_to=date_to,
-        min_playtime=min_playtime,
-        min_funny=min_funny,
-        received_free=received_free,
-        early_access=early_access
-    )
-    
     per_page = 20
-    total_pages = (total_reviews + per_page - 1) // per_page
+    total_pages = (results.total + per_page - 1) // per_page
     
     scoring_methods = [
         {'id': 'tfidf', 'name': 'TF-IDF', 'description': 'Zaawansowane wyszukiwanie uwzględniające częstość słów'},
         {'id': 'cosine', 'name': 'Cosine', 'description': 'Podobieństwo cosinusowe między dokumentami'},
         {'id': 'word2vec', 'name': 'Word2Vec', 'description': 'Wyszukiwanie semantyczne z wykorzystaniem embeddings'},
-        {'id': 'jaccard', 'name': 'Jaccard', 'description': 'Proste porównanie na podstawie wspólnych słów'}
+        {'id': 'jaccard', 'name': 'Jaccard', 'description': 'Proste porównanie na podstawie wspólnych słów'},
+        {'id': 'semantic', 'name': 'Semantic', 'description': 'Wyszukiwanie semantyczne w całym korpusie, bez dopasowania słów kluczowych'}
     ]
     
     return render_template('search.html',
@@ -87,6 +100,9 @@ def search():
                          games=games_list,
                          current_page=page,
                          total_pages=total_pages,
+                         next_cursor=results.next_cursor,
+                         total_reviews=results.total,
+                         total_is_estimate=results.total_is_estimate,
                          search_params={
                              'keyword': keyword,
                              'filter_option': filter_option,
@@ -97,10 +113,40 @@ def search():
                              'min_playtime': min_playtime,
                              'min_funny': min_funny,
                              'received_free': received_free,
-                             'early_access': early_access
+                             'early_access': early_access,
+                             'min_polarity': min_polarity,
+                             'sort': sort
                          },
                          scoring_methods=scoring_methods)
 
+@app.route('/api/reviews', methods=['GET'])
+def api_reviews():
+    """JSON page of reviews; pass the returned next_cursor back to get the following page."""
+    results = get_reviews_page(
+        page=max(1, request.args.get('page', 1, type=int)),
+        per_page=max(1, min(request.args.get('per_page', 20, type=int), 100)),
+        cursor=request.args.get('cursor', ''),
+        keyword=request.args.get('keyword', ''),
+        filter_option=request.args.get('filter_option', 'all'),
+        scoring_method=request.args.get('scoring_method', 'tfidf'),
+        game_id=request.args.get('game_id', ''),
+        date_from=request.args.get('date_from', ''),
+        date_to=request.args.get('date_to', ''),
+        min_playtime=request.args.get('min_playtime', type=int),
+        min_funny=request.args.get('min_funny', type=int),
+        received_free=request.args.get('received_free') == 'true',
+        early_access=request.args.get('early_access') == 'true',
+        min_polarity=request.args.get('min_polarity', type=float),
+        sort=request.args.get('sort', ''),
+        count_limit=COUNT_LIMIT
+    )
+    return jsonify({
+        'reviews': results.reviews,
+        'next_cursor': results.next_cursor,
+        'total': results.total,
+        'total_is_estimate': results.total_is_estimate
+    })
+
 @app.route('/visualizations')
 def visualizations():
     top_genres = create_top_genres_chart()
@@ -110,32 +156,61 @@ def visualizations():
     # Get unique genres for the filter dropdown
     genres = get_unique_genres()
     
-    # Generate word cloud from all reviews
-    word_cloud = visualizer.generate_word_cloud(visualizer.get_all_reviews_text())
+    # Word cloud of all reviews; rendering it here also warms the cache for the image request
+    word_cloud_url = word_cloud_image_url() if visualizer.get_word_cloud() else None
     
     return render_template('visualizations.html',
                          top_genres=top_genres,
                          top_publishers=top_publishers,
                          top_developers=top_developers,
-                         word_cloud_image=word_cloud,
+                         word_cloud_url=word_cloud_url,
                          genres=genres)
 
 @app.route('/update_word_cloud')
 def update_word_cloud():
     genre = request.args.get('genre', '')
-    if genre:
-        text = visualizer.get_reviews_text_by_genre(genre)
-    else:
-        text = visualizer.get_all_reviews_text()
-    
-    word_cloud = visualizer.generate_word_cloud(text)
-    return jsonify({'word_cloud': word_cloud})
+    image_format = request.args.get('format', 'png')
+    if image_format not in WORD_CLOUD_FORMATS:
+        abort(400)
+    return jsonify({'word_cloud_url': word_cloud_image_url(genre, image_format)})
+
+def word_cloud_image_url(genre='', image_format='png'):
+    return url_for('word_cloud_image', image_format=image_format, genre=genre or None, v=get_data_version())
+
+@app.route('/word_cloud.<image_format>')
+def word_cloud_image(image_format):
+    if image_format not in WORD_CLOUD_FORMATS:
+        abort(404)
+    image = visualizer.get_word_cloud(request.args.get('genre', ''), image_format)
+    if not image:
+        abort(404)
+    # Without aggregates there is no data version in the URL, so clients revalidate every time
+    return send_file(
+        io.BytesIO(image),
+        mimetype=WORD_CLOUD_FORMATS[image_format],
+        etag=hashlib.sha1(image).hexdigest(),
+        max_age=WORD_CLOUD_MAX_AGE if get_data_version() else 0,
+        conditional=True
+    )
 
 @app.route('/clear-cache')
 def clear_cache():
     cached_get_reviews.cache_clear()
+    chart_cache.clear()
+    text_analysis_service.cache.clear()
+    # Notice indexes and tables built since the last check (FTS, aggregates, term frequencies)
+    clear_table_checks()
     return "Cache został wyczyszczony!"
 
+@app.route('/cache-stats')
+def cache_stats():
+    return jsonify({
+        'search_results': cached_get_reviews.cache_info(),
+        'result_counts': count_cache.stats(),
+        'charts': chart_cache.stats(),
+        'text_analysis': text_analysis_service.cache.stats()
+    })
+
 @app.route('/review/<int:review_id>')
 def review_detail(review_id):
     review = get_review_by_id(review_id)
@@ -145,9 +220,8 @@ def review_detail(review_id):
 
 @app.route('/games')
 def show_games():
-    # Connect to the database
-    conn = sqlite3.connect('data/steam_reviews_with_authors.db')
-    cursor = conn.cursor()
+    # Shared read-only connection of this thread
+    cursor = get_read_connection().cursor()
 
     # Get filter values from request
     name_filter = request.args.get('name', '')
@@ -201,8 +275,7 @@ def show_games():
     cursor.execute("SELECT DISTINCT genre FROM games ORDER BY genre")
     genres = [row[0] for row in cursor.fetchall()]
 
-    # Close the connection
-    conn.close()
+    cursor.close()
 
     return render_template('games.html', 
                          games=games,
@@ -0,0 +1,128 @@
+import argparse
+from services.search_index_service import DATABASE, build_fts_index
+from services.tfidf_index_service import MODEL_DIR
+
+def main():
+    parser = argparse.ArgumentParser(description='Builds the offline search indexes for the reviews database.')
+    parser.add_argument('--database', default=DATABASE, help='Path to the SQLite database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    fts_parser = subparsers.add_parser('fts', help='Full-text (FTS5) index over review content')
+    fts_parser.add_argument('--rebuild', action='store_true', help='Drop and recreate the index')
+
+    tfidf_parser = subparsers.add_parser('tfidf', help='Corpus-wide TF-IDF model and document-term matrix')
+    tfidf_parser.add_argument('--model-dir', default=MODEL_DIR, help='Directory for the saved model files')
+    tfidf_parser.add_argument('--batch-size', type=int, default=10000, help='Reviews read per batch')
+
+    word2vec_parser = subparsers.add_parser('word2vec', help='Corpus-wide Word2Vec model and review vector matrix')
+    word2vec_parser.add_argument('--model-dir', default=MODEL_DIR, help='Directory for the saved model files')
+    word2vec_parser.add_argument('--batch-size', type=int, default=10000, help='Reviews read per batch')
+    word2vec_parser.add_argument('--min-count', type=int, default=5, help='Ignore words rarer than this')
+    word2vec_parser.add_argument('--workers', type=int, default=4, help='Training threads')
+
+    ann_parser = subparsers.add_parser('ann', help='Approximate nearest-neighbour index over the Word2Vec review vectors')
+    ann_parser.add_argument('--model-dir', default=MODEL_DIR, help='Directory with the Word2Vec index, also used for the output')
+    ann_parser.add_argument('--lists', type=int, default=None, help='Number of k-means lists (default: 4 * sqrt(n))')
+    ann_parser.add_argument('--iterations', type=int, default=20, help='k-means iterations')
+    ann_parser.add_argument('--sample-size', type=int, default=100000, help='Vectors used to train the k-means quantizer')
+
+    jaccard_parser = subparsers.add_parser('jaccard', help='Precomputed review word sets for Jaccard scoring')
+    jaccard_parser.add_argument('--model-dir', default=MODEL_DIR, help='Directory for the saved index files')
+    jaccard_parser.add_argument('--batch-size', type=int, default=10000, help='Reviews read per batch')
+
+    duplicates_parser = subparsers.add_parser('duplicates', help='Near-duplicate review groups (MinHash LSH over the Jaccard index)')
+    duplicates_parser.add_argument('--model-dir', default=MODEL_DIR, help='Directory with the Jaccard index')
+    duplicates_parser.add_argument('--threshold', type=float, default=0.8, help='Minimum estimated Jaccard similarity')
+    duplicates_parser.add_argument('--num-perm', type=int, default=128, help='MinHash permutations')
+    duplicates_parser.add_argument('--bands', type=int, default=32, help='LSH bands (must divide --num-perm)')
+
+    compact_parser = subparsers.add_parser('compact', help='Merge the incremental updates (delta segments) into the search indexes')
+    compact_parser.add_argument('--model-dir', default=MODEL_DIR, help='Directory with the saved index files')
+
+    subparsers.add_parser('aggregates', help='Recompute the materialized review counts used by the dashboard')
+
+    terms_parser = subparsers.add_parser('terms', help='Corpus-wide term frequencies per genre for the word clouds')
+    terms_parser.add_argument('--batch-size', type=int, default=10000, help='Reviews read per batch')
+    terms_parser.add_argument('--terms-per-genre', type=int, default=1000, help='Most frequent terms kept per genre')
+
+    lexicon_parser = subparsers.add_parser('lexicon', help='Game titles and studio names for the gaming entity matcher')
+    lexicon_parser.add_argument('--output', default=None, help='Lexicon file (default: data/gaming_lexicon.tsv)')
+
+    args = parser.parse_args()
+
+    if args.command == 'fts':
+        print(f"Building FTS index in {args.database}...")
+        count = build_fts_index(args.database, rebuild=args.rebuild)
+        print(f"Indexed {count} reviews")
+    elif args.command == 'tfidf':
+        from services.tfidf_index_service import TfidfIndex
+        print(f"Fitting TF-IDF model over {args.database}...")
+        index = TfidfIndex.build(args.database, batch_size=args.batch_size)
+        index.save(args.model_dir)
+        print(f"Saved {index.matrix.shape[0]} x {index.matrix.shape[1]} matrix to {args.model_dir}")
+    elif args.command == 'word2vec':
+        from services.word2vec_index_service import Word2VecIndex
+        print(f"Training Word2Vec over {args.database}...")
+        index = Word2VecIndex.build(args.database, batch_size=args.batch_size,
+                                    min_count=args.min_count, workers=args.workers)
+        index.save(args.model_dir)
+        print(f"Saved {len(index.wv.key_to_index)} word vectors and a {index.vectors.shape[0]} x "
+              f"{index.vectors.shape[1]} review matrix to {args.model_dir}")
+    elif args.command == 'jaccard':
+        from services.jaccard_index_service import TokenSetIndex
+        print(f"Tokenizing reviews in {args.database}...")
+        index = TokenSetIndex.build(args.database, batch_size=args.batch_size)
+        index.save(args.model_dir)
+        print(f"Saved token sets of {len(index.review_ids)} reviews ({len(index.indices)} tokens) to {args.model_dir}")
+    elif args.command == 'duplicates':
+        from services.jaccard_index_service import TokenSetIndex, find_near_duplicates, save_duplicate_groups
+        if args.num_perm % args.bands:
+            parser.error("--bands must divide --num-perm")
+        index = TokenSetIndex.load(args.model_dir)
+        if index is None:
+            parser.error("Jaccard index not found, run `python build_indexes.py jaccard` first")
+        index = index.compact()
+        print(f"Computing MinHash signatures for {len(index.review_ids)} reviews...")
+        signatures = index.minhash_signatures(num_perm=args.num_perm)
+        groups = find_near_duplicates(signatures, index.review_ids, threshold=args.threshold, bands=args.bands)
+        save_duplicate_groups(groups, args.database)
+        print(f"Found {len(groups)} groups covering {sum(len(group) for group in groups)} reviews")
+    elif args.command == 'ann':
+        from services.ann_index_service import IVFIndex
+        from services.word2vec_index_service import Word2VecIndex
+        word2vec_index = Word2VecIndex.load(args.model_dir)
+        if word2vec_index is None:
+            parser.error("Word2Vec index not found, run `python build_indexes.py word2vec` first")
+        print(f"Clustering {len(word2vec_index.vectors)} review vectors...")
+        index = IVFIndex.build(word2vec_index.vectors, n_lists=args.lists,
+                               n_iter=args.iterations, sample_size=args.sample_size)
+        index.save(args.model_dir)
+        print(f"Saved {len(index.centroids)} lists covering {len(index.list_rows)} reviews to {args.model_dir}")
+    elif args.command == 'compact':
+        from services.index_update_service import compact_search_indexes
+        compacted = compact_search_indexes(args.model_dir)
+        print(f"Compacted: {', '.join(compacted)}" if compacted else "No pending updates")
+    elif args.command == 'aggregates':
+        from services.aggregate_service import refresh_aggregates
+        from services.connection_service import connect_writable
+        print(f"Refreshing review aggregates in {args.database}...")
+        con = connect_writable(args.database)
+        try:
+            with con:
+                refresh_aggregates(con)
+        finally:
+            con.close()
+        print("Done")
+    elif args.command == 'terms':
+        from services.term_frequency_service import build_term_frequencies
+        print(f"Counting review terms in {args.database}...")
+        count = build_term_frequencies(args.database, terms_per_genre=args.terms_per_genre, batch_size=args.batch_size)
+        print(f"Saved term frequencies of the whole corpus and {max(count - 1, 0)} genres")
+    elif args.command == 'lexicon':
+        from services.gaming_lexicon_service import LEXICON_PATH, export_catalog_lexicon
+        path = args.output or LEXICON_PATH
+        counts = export_catalog_lexicon(args.database, path)
+        print(f"Wrote {', '.join(f'{count} {label}' for label, count in sorted(counts.items()))} phrases to {path}")
+
+if __name__ == '__main__':
+    main()
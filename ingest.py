@@ -0,0 +1,41 @@
+import argparse
+import os
+from services.connection_service import DATABASE
+from services.index_update_service import MODEL_DIR
+
+def main():
+    parser = argparse.ArgumentParser(description='Loads Steam review dumps (CSV or JSON Lines, optionally gzipped) into the reviews database.')
+    parser.add_argument('paths', nargs='+', help='Dump files to ingest')
+    parser.add_argument('--database', default=DATABASE, help='Path to the SQLite database')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='Records per write transaction')
+    parser.add_argument('--model-dir', default=MODEL_DIR, help='Directory with the search indexes to update')
+    parser.add_argument('--skip-indexes', action='store_true', help='Do not update the search indexes')
+    parser.add_argument('--analyze', action='store_true', help='Run the NLP analysis for the new reviews afterwards')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes for the sentiment scoring and --analyze')
+    args = parser.parse_args()
+
+    from services.ingest_service import ingest_files
+    result = ingest_files(args.paths, args.database, chunk_size=args.chunk_size)
+    print(f"Read {result.records} records: {result.reviews} reviews written, "
+          f"{result.duplicates} duplicates merged, {result.skipped} without a review id skipped")
+
+    if not args.skip_indexes and result.reviews:
+        from services.index_update_service import update_search_indexes
+        print("Updating search indexes...")
+        updated = update_search_indexes(result.review_ids, args.database, args.model_dir)
+        print(f"Updated: {', '.join(updated) if updated else 'no indexes built'}")
+
+    if args.analyze and result.reviews:
+        from services.batch_analysis_service import run_batch_analysis
+        # Only reviews without an up-to-date stored analysis are processed
+        count = run_batch_analysis(args.database, workers=args.workers)
+        print(f"Analyzed {count} reviews")
+
+    if result.reviews:
+        from services.sentiment_service import run_sentiment_scoring
+        # New and edited reviews have NULL sentiment columns until scored
+        count = run_sentiment_scoring(args.database, workers=args.workers)
+        print(f"Scored the sentiment of {count} reviews")
+
+if __name__ == '__main__':
+    main()
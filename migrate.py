@@ -0,0 +1,55 @@
+import argparse
+from services.connection_service import DATABASE
+
+def main():
+    parser = argparse.ArgumentParser(description='Schema migrations and index management for the reviews database.')
+    parser.add_argument('--database', default=DATABASE, help='Path to the SQLite database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    upgrade_parser = subparsers.add_parser('upgrade', help='Apply pending migrations and refresh planner statistics')
+    upgrade_parser.add_argument('--no-analyze', action='store_true', help='Skip ANALYZE after migrating')
+    upgrade_parser.add_argument('--vacuum', action='store_true', help='Compact the database file afterwards')
+
+    subparsers.add_parser('status', help='Show the schema version and pending migrations')
+    subparsers.add_parser('analyze', help='Refresh planner statistics (ANALYZE)')
+    subparsers.add_parser('explain', help='Show EXPLAIN QUERY PLAN of the canonical application queries')
+
+    args = parser.parse_args()
+
+    from services import migration_service
+
+    if args.command == 'upgrade':
+        applied = migration_service.run_migrations(args.database, analyze=not args.no_analyze,
+                                                  vacuum=args.vacuum)
+        if applied:
+            print(f"Applied migrations: {', '.join(map(str, applied))}")
+        else:
+            print("Database is up to date")
+
+    elif args.command == 'status':
+        pending = migration_service.pending_migrations(args.database)
+        latest = migration_service.MIGRATIONS[-1][0]
+        print(f"Latest migration: {latest}, pending: {len(pending)}")
+        for number, description in pending:
+            print(f"  {number}: {description}")
+
+    elif args.command == 'analyze':
+        con = migration_service.connect_writable(args.database)
+        try:
+            migration_service.analyze_database(con)
+        finally:
+            con.close()
+        print("Planner statistics refreshed")
+
+    elif args.command == 'explain':
+        report = migration_service.explain_queries(args.database)
+        for name, steps, full_scans in report:
+            marker = "FULL SCAN" if full_scans else "ok"
+            print(f"\n[{marker}] {name}")
+            for step in steps:
+                print(f"    {step}")
+        scanned = [name for name, _, full_scans in report if full_scans]
+        print(f"\n{len(report) - len(scanned)} of {len(report)} queries use indexes only")
+
+if __name__ == '__main__':
+    main()
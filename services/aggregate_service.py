@@ -0,0 +1,171 @@
+import json
+import sqlite3
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+from .connection_service import DATABASE, get_read_connection, table_exists
+
+# Materialized review counts, so the dashboard reads a few rows instead of
+# grouping every review on each page load. kind -> (table, key column)
+AGGREGATE_TABLES = {
+    'game': ('agg_reviews_by_game', 'app_id'),
+    'author': ('agg_reviews_by_author', 'author_id'),
+    'day': ('agg_reviews_by_day', 'day'),
+    'genre': ('agg_reviews_by_genre', 'genre'),
+    'publisher': ('agg_reviews_by_publisher', 'publisher'),
+    'developer': ('agg_reviews_by_developer', 'developer')
+}
+# Game-level aggregates rolled up through the games table
+GAME_ROLLUPS = ('genre', 'publisher', 'developer')
+STATE_TABLE = 'aggregate_state'
+SECONDS_PER_DAY = 86400
+
+def create_aggregate_tables(con: sqlite3.Connection):
+    for kind, (table, key) in AGGREGATE_TABLES.items():
+        key_type = 'TEXT' if kind in GAME_ROLLUPS else 'INTEGER'
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {key} {key_type} PRIMARY KEY,
+                review_count INTEGER NOT NULL,
+                positive_count INTEGER NOT NULL
+            )
+        """)
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_count ON {table} (review_count DESC, {key})")
+    # data_version changes whenever any aggregate does (used to invalidate rendered charts)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            data_version INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    con.execute(f"INSERT OR IGNORE INTO {STATE_TABLE} (id, data_version, updated_at) VALUES (1, 0, ?)", (time.time(),))
+
+def bump_data_version(con: sqlite3.Connection):
+    con.execute(f"UPDATE {STATE_TABLE} SET data_version = data_version + 1, updated_at = ?", (time.time(),))
+
+def _refresh_rollups(con: sqlite3.Connection):
+    for kind in GAME_ROLLUPS:
+        table, key = AGGREGATE_TABLES[kind]
+        con.execute(f"DELETE FROM {table}")
+        # Same semantics as joining every review to games and grouping
+        con.execute(f"""
+            INSERT INTO {table} ({key}, review_count, positive_count)
+            SELECT g.{key}, SUM(a.review_count), SUM(a.positive_count)
+            FROM {AGGREGATE_TABLES['game'][0]} a
+            JOIN games g ON g.app_id = a.app_id
+            WHERE g.{key} IS NOT NULL AND g.{key} != ''
+            GROUP BY g.{key}
+        """)
+
+def refresh_aggregates(con: sqlite3.Connection):
+    """Recomputes every aggregate from the reviews table (call inside a transaction)."""
+    create_aggregate_tables(con)
+    sources = {
+        'game': "app_id",
+        'author': "author_id",
+        'day': f"timestamp_created / {SECONDS_PER_DAY}"
+    }
+    for kind, expression in sources.items():
+        table, key = AGGREGATE_TABLES[kind]
+        con.execute(f"DELETE FROM {table}")
+        con.execute(f"""
+            INSERT INTO {table} ({key}, review_count, positive_count)
+            SELECT {expression}, COUNT(*), COALESCE(SUM(is_positive = 1), 0)
+            FROM reviews
+            WHERE {expression} IS NOT NULL
+            GROUP BY {expression}
+        """)
+    _refresh_rollups(con)
+    bump_data_version(con)
+
+def fetch_review_keys(con: sqlite3.Connection, review_ids: Sequence[int]) -> List[tuple]:
+    """(app_id, author_id, timestamp_created, is_positive) of the given reviews that exist."""
+    return con.execute(
+        "SELECT app_id, author_id, timestamp_created, is_positive FROM reviews "
+        "WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(review_ids)),)
+    ).fetchall()
+
+def apply_review_changes(con: sqlite3.Connection, before: List[tuple], after: List[tuple]):
+    """
+    Incrementally updates the aggregates for a batch of written reviews, given
+    their fetch_review_keys rows before and after the write. Cost depends on
+    the batch only, not on the size of the corpus.
+    """
+    deltas = {kind: Counter() for kind in AGGREGATE_TABLES}
+    positive = {kind: Counter() for kind in AGGREGATE_TABLES}
+    for rows, sign in ((before, -1), (after, 1)):
+        for app_id, author_id, timestamp, is_positive in rows:
+            keys = {
+                'game': app_id,
+                'author': author_id,
+                'day': timestamp // SECONDS_PER_DAY if timestamp is not None else None
+            }
+            for kind, key in keys.items():
+                if key is not None:
+                    deltas[kind][key] += sign
+                    positive[kind][key] += sign * (is_positive == 1)
+
+    # Roll game deltas up through every games row of the game
+    game_deltas = {app_id: count for app_id, count in deltas['game'].items() if count or positive['game'][app_id]}
+    if game_deltas:
+        games = con.execute(
+            f"SELECT app_id, {', '.join(GAME_ROLLUPS)} FROM games WHERE app_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(game_deltas)),)
+        ).fetchall()
+        for app_id, *values in games:
+            for kind, key in zip(GAME_ROLLUPS, values):
+                if key:
+                    deltas[kind][key] += deltas['game'][app_id]
+                    positive[kind][key] += positive['game'][app_id]
+
+    changed = False
+    for kind, (table, key) in AGGREGATE_TABLES.items():
+        rows = [(k, count, positive[kind][k]) for k, count in deltas[kind].items() if count or positive[kind][k]]
+        if not rows:
+            continue
+        changed = True
+        con.executemany(f"""
+            INSERT INTO {table} ({key}, review_count, positive_count) VALUES (?, ?, ?)
+            ON CONFLICT({key}) DO UPDATE SET
+                review_count = review_count + excluded.review_count,
+                positive_count = positive_count + excluded.positive_count
+        """, rows)
+        con.execute(f"DELETE FROM {table} WHERE review_count <= 0")
+    if changed:
+        bump_data_version(con)
+
+def aggregates_available(database: str = DATABASE) -> bool:
+    """Checks (cached for a while, see table_exists) whether the aggregate tables exist."""
+    return table_exists(STATE_TABLE, database)
+
+def get_top_counts(kind: str, limit: int = 10, database: str = DATABASE) -> Optional[List[Dict[str, Any]]]:
+    """
+    Top `limit` keys of an aggregate by review count, as dicts with 'name' and
+    'review_count'. Reads `limit` rows of the count index. Returns None if
+    the aggregates were not built.
+    """
+    if not aggregates_available(database):
+        return None
+    table, key = AGGREGATE_TABLES[kind]
+    cur = get_read_connection(database).cursor()
+    cur.row_factory = sqlite3.Row
+    try:
+        cur.execute(f"""
+            SELECT {key} as name, review_count
+            FROM {table}
+            ORDER BY review_count DESC, {key}
+            LIMIT ?
+        """, (limit,))
+        return [dict(row) for row in cur.fetchall()]
+    finally:
+        cur.close()
+
+def get_data_version(database: str = DATABASE) -> int:
+    """Version stamp of the aggregates; 0 if they were not built."""
+    if not aggregates_available(database):
+        return 0
+    row = get_read_connection(database).execute(f"SELECT data_version FROM {STATE_TABLE}").fetchone()
+    return row[0] if row else 0
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from .cache_service import LRUCache
+
+ANALYSIS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Shared on-disk tier of the web application's worker processes
+ANALYSIS_CACHE_PATH = 'data/analysis_cache.db'
+# Rows kept in the shared on-disk tier; the oldest are pruned beyond this
+DISK_CACHE_MAX_ENTRIES = 500000
+DISK_PRUNE_INTERVAL = 1000  # writes between size checks
+# Part of every key, so results of an older analysis version are never served
+CACHE_VERSION = 2
+CACHE_TABLE = 'analysis_cache'
+
+def encode_analysis(analysis: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(analysis, separators=(',', ':')).encode('utf-8'))
+
+def decode_analysis(blob: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+def analysis_key(kind: str, text: str, features: Iterable[str] = (), version: str = '') -> str:
+    """
+    Hash of the exact text with the analysis kind and requested features.
+    The text is not normalized further: results include character offsets
+    and case-sensitive counts, so only identical strings may share them.
+    `version` identifies other inputs the result depends on (e.g. the gaming
+    lexicon), so results computed from an older one are not served.
+    """
+    payload = f"{CACHE_VERSION}\0{kind}\0{','.join(sorted(features))}\0{version}\0{text or ''}"
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+class AnalysisCache:
+    """
+    Memoizes text analysis results by content hash: an in-process LRU over
+    encoded results, optionally backed by a SQLite file that several worker
+    processes share. Values are stored encoded, so every lookup returns a
+    fresh copy that callers may modify.
+    """
+
+    def __init__(self, max_bytes: int = ANALYSIS_CACHE_MAX_BYTES):
+        self.memory = LRUCache(max_bytes, sizeof=lambda blob: len(blob) + 96)
+        self.disk_path = None
+        self.disk_max_entries = DISK_CACHE_MAX_ENTRIES
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.disk_errors = 0
+        self.computed = 0
+
+    def open_disk_tier(self, path: str, max_entries: int = DISK_CACHE_MAX_ENTRIES):
+        """
+        Shares results through the SQLite file at `path`. The file (created if
+        missing) is only opened on the first lookup, by each thread.
+        """
+        self.disk_path = path
+        self.disk_max_entries = max_entries
+        self._local = threading.local()
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _disk_connection(self) -> Optional[sqlite3.Connection]:
+        """The calling thread's connection to the disk tier, or None if it is disabled."""
+        path = self.disk_path
+        if path is None:
+            return None
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            try:
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                con = sqlite3.connect(path, timeout=5)
+                con.execute("PRAGMA journal_mode = WAL")
+                con.execute("PRAGMA synchronous = NORMAL")
+                with con:
+                    con.execute(f"""
+                        CREATE TABLE IF NOT EXISTS {CACHE_TABLE} (
+                            key TEXT PRIMARY KEY,
+                            value BLOB NOT NULL,
+                            created_at REAL NOT NULL
+                        ) WITHOUT ROWID
+                    """)
+                    con.execute(f"CREATE INDEX IF NOT EXISTS idx_{CACHE_TABLE}_created ON {CACHE_TABLE} (created_at)")
+            except (OSError, sqlite3.Error) as e:
+                print(f"Warning: analysis cache {path} unavailable, using memory only: {e}")
+                self.disk_path = None
+                return None
+            self._local.con = con
+        return con
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        con = self._disk_connection()
+        if con is None:
+            return None
+        try:
+            row = con.execute(f"SELECT value FROM {CACHE_TABLE} WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            self._count('disk_errors')
+            return None
+        if row is None:
+            self._count('disk_misses')
+            return None
+        self._count('disk_hits')
+        return row[0]
+
+    def _disk_put(self, key: str, blob: bytes):
+        con = self._disk_connection()
+        if con is None:
+            return
+        try:
+            with con:
+                con.execute(
+                    f"INSERT OR IGNORE INTO {CACHE_TABLE} (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, blob, time.time())
+                )
+            with self._lock:
+                self._writes += 1
+                prune = self._writes % DISK_PRUNE_INTERVAL == 0
+            if prune:
+                self._disk_prune(con)
+        except sqlite3.Error:
+            self._count('disk_errors')
+
+    def _disk_prune(self, con: sqlite3.Connection):
+        excess = con.execute(f"SELECT COUNT(*) FROM {CACHE_TABLE}").fetchone()[0] - self.disk_max_entries
+        if excess > 0:
+            with con:
+                con.execute(f"""
+                    DELETE FROM {CACHE_TABLE} WHERE key IN (
+                        SELECT key FROM {CACHE_TABLE} ORDER BY created_at LIMIT ?
+                    )
+                """, (excess,))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        blob = self.memory.get(key)
+        if blob is None:
+            blob = self._disk_get(key)
+            if blob is None:
+                return None
+            self.memory.put(key, blob)
+        return decode_analysis(blob)
+
+    def put(self, key: str, result: Dict[str, Any]):
+        blob = encode_analysis(result)
+        self._count('computed')
+        self.memory.put(key, blob)
+        self._disk_put(key, blob)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
+
+    def clear(self):
+        """Empties this process's memory tier; the shared disk tier is kept."""
+        self.memory.clear()
+
+    def clear_disk(self):
+        """Deletes every result of the shared disk tier, for all processes using it."""
+        con = self._disk_connection()
+        if con is not None:
+            try:
+                with con:
+                    con.execute(f"DELETE FROM {CACHE_TABLE}")
+            except sqlite3.Error:
+                self._count('disk_errors')
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.memory.stats()
+        lookups = stats['hits'] + stats['misses']
+        with self._lock:
+            stats.update({
+                'disk_tier': self.disk_path,
+                'disk_hits': self.disk_hits,
+                'disk_misses': self.disk_misses,
+                'disk_errors': self.disk_errors,
+                'computed': self.computed
+            })
+        # Share of lookups answered by either tier
+        stats['overall_hit_rate'] = round((stats['hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,90 @@
+import hashlib
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional
+
+from .analysis_cache_service import decode_analysis
+from .connection_service import DATABASE, get_read_connection, table_exists
+from .gaming_lexicon_service import get_gaming_lexicon
+from .text_analysis_service import text_analysis_service
+
+ANALYSIS_TABLE = 'review_analysis'
+
+# One compressed JSON blob of TextAnalysisService.analyze_text per review.
+# content_hash detects reviews whose text changed after they were analyzed,
+# lexicon_version those whose entities came from another gaming lexicon.
+CREATE_ANALYSIS_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {ANALYSIS_TABLE} (
+        review_id INTEGER PRIMARY KEY,
+        content_hash TEXT NOT NULL,
+        analysis BLOB NOT NULL,
+        lexicon_version TEXT NOT NULL DEFAULT ''
+    )
+"""
+
+def content_hash(text: str) -> str:
+    """Stable hash of a review text."""
+    return hashlib.sha1((text or "").encode('utf-8')).hexdigest()
+
+def add_lexicon_version_column(con: sqlite3.Connection):
+    """
+    Adds lexicon_version to analysis tables created before it. Their rows get
+    '' and are analyzed again unless no lexicon file is in use.
+    """
+    if not con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (ANALYSIS_TABLE,)).fetchone():
+        return
+    columns = {row[1] for row in con.execute(f"PRAGMA table_info({ANALYSIS_TABLE})")}
+    if 'lexicon_version' not in columns:
+        con.execute(f"ALTER TABLE {ANALYSIS_TABLE} ADD COLUMN lexicon_version TEXT NOT NULL DEFAULT ''")
+
+def analysis_store_available(database: str = DATABASE) -> bool:
+    """Checks (cached for a while, see table_exists) whether the analysis table exists."""
+    return table_exists(ANALYSIS_TABLE, database)
+
+def load_stored_analyses(reviews: List[Dict[str, Any]], database: str = DATABASE) -> Dict[int, Dict[str, Any]]:
+    """
+    Returns {review_id: analysis} for the reviews that have an up-to-date
+    stored analysis: of the same text, made with the current gaming lexicon.
+    Each review dict needs 'id' and 'content'.
+    """
+    if not reviews or not analysis_store_available(database):
+        return {}
+
+    hashes = {review['id']: content_hash(review['content']) for review in reviews}
+    placeholders = ", ".join("?" * len(hashes))
+    try:
+        rows = get_read_connection(database).execute(
+            f"SELECT review_id, content_hash, lexicon_version, analysis FROM {ANALYSIS_TABLE} "
+            f"WHERE review_id IN ({placeholders})",
+            list(hashes)
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return {}
+
+    lexicon_version = get_gaming_lexicon().version
+    return {
+        review_id: decode_analysis(blob)
+        for review_id, stored_hash, stored_version, blob in rows
+        if hashes.get(review_id) == stored_hash and stored_version == lexicon_version
+    }
+
+def get_review_analyses(reviews: List[Dict[str, Any]], database: str = DATABASE,
+                        features: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Analyses for the given reviews, in order. Stored results are used where
+    available; reviews analyzed after the last batch run are computed on demand,
+    limited to `features` (see TextAnalysisService.analyze_text) if given.
+    """
+    stored = load_stored_analyses(reviews, database)
+    missing = [review for review in reviews if review['id'] not in stored]
+    computed = iter(text_analysis_service.analyze_many(
+        (review['content'] for review in missing), features=features
+    ))
+    return [
+        stored[review['id']] if review['id'] in stored else next(computed)
+        for review in reviews
+    ]
+
+def get_review_analysis(review_id: int, content: str, database: str = DATABASE,
+                        features: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    return get_review_analyses([{'id': review_id, 'content': content}], database, features)[0]
@@ -0,0 +1,162 @@
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .index_update_service import files_signature, save_array
+
+MODEL_DIR = 'data/search_models'
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+    """Index of the most similar centroid for every (normalized) vector."""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), batch_size):
+        block = np.asarray(vectors[start:start + batch_size], dtype=np.float32)
+        labels[start:start + batch_size] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+def spherical_kmeans(vectors: np.ndarray, n_clusters: int, n_iter: int = 20, seed: int = 0) -> np.ndarray:
+    """
+    k-means on the unit sphere (cosine similarity), returns normalized
+    centroids. Empty clusters are re-seeded with random points.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].astype(np.float32)
+    for _ in range(n_iter):
+        labels = _assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=n_clusters)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+    return centroids.astype(np.float32)
+
+class IVFIndex:
+    """
+    Inverted-file index over normalized vectors: a k-means coarse quantizer
+    splits the rows into lists, and a query only scans the lists whose
+    centroids are closest to it (n_probe), so retrieval is sublinear.
+
+    Rows of list i are list_rows[list_offsets[i]:list_offsets[i + 1]]; they
+    refer to rows of the vector matrix the index was built over.
+    """
+
+    def __init__(self, centroids: np.ndarray, list_offsets: np.ndarray, list_rows: np.ndarray, n_vectors: int):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.n_vectors = n_vectors
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, n_lists: int = None, n_iter: int = 20,
+              sample_size: int = 100000, seed: int = 0) -> 'IVFIndex':
+        """
+        Trains the quantizer on a sample of the non-zero vectors and assigns
+        every vector to its list. Zero vectors (reviews without known words)
+        are left out.
+        """
+        indexed_rows = np.flatnonzero(np.any(vectors, axis=1))
+        if n_lists is None:
+            n_lists = max(1, int(4 * np.sqrt(len(indexed_rows))))
+        n_lists = max(1, min(n_lists, len(indexed_rows)))
+
+        rng = np.random.default_rng(seed)
+        sample_rows = indexed_rows
+        if len(sample_rows) > sample_size:
+            sample_rows = np.sort(rng.choice(indexed_rows, sample_size, replace=False))
+        if len(sample_rows):
+            centroids = spherical_kmeans(np.asarray(vectors[sample_rows], dtype=np.float32), n_lists, n_iter, seed)
+        else:
+            centroids = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+
+        labels = _assign(vectors[indexed_rows], centroids) if len(indexed_rows) else np.empty(0, dtype=np.int64)
+        order = np.argsort(labels, kind='stable')
+        list_rows = indexed_rows[order]
+        list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=len(centroids)), out=list_offsets[1:])
+        return cls(centroids, list_offsets, list_rows, len(vectors))
+
+    @staticmethod
+    def signature(model_dir: str = MODEL_DIR) -> tuple:
+        """Changes whenever the saved index is rewritten."""
+        return files_signature(os.path.join(model_dir, name) for name in (
+            'ann_centroids.npy', 'ann_offsets.npy', 'ann_rows.npy', 'ann_size.npy'
+        ))
+
+    def save(self, model_dir: str = MODEL_DIR):
+        os.makedirs(model_dir, exist_ok=True)
+        save_array(os.path.join(model_dir, 'ann_centroids.npy'), self.centroids)
+        save_array(os.path.join(model_dir, 'ann_offsets.npy'), self.list_offsets)
+        save_array(os.path.join(model_dir, 'ann_rows.npy'), self.list_rows)
+        save_array(os.path.join(model_dir, 'ann_size.npy'), np.array([self.n_vectors], dtype=np.int64))
+
+    @classmethod
+    def load(cls, model_dir: str = MODEL_DIR, mmap: bool = True) -> Optional['IVFIndex']:
+        """Loads a saved index. Returns None if it was never built."""
+        centroids_path = os.path.join(model_dir, 'ann_centroids.npy')
+        if not os.path.exists(centroids_path):
+            return None
+
+        mmap_mode = 'r' if mmap else None
+        centroids = np.load(centroids_path)
+        list_offsets = np.load(os.path.join(model_dir, 'ann_offsets.npy'))
+        list_rows = np.load(os.path.join(model_dir, 'ann_rows.npy'), mmap_mode=mmap_mode)
+        n_vectors = int(np.load(os.path.join(model_dir, 'ann_size.npy'))[0])
+        return cls(centroids, list_offsets, list_rows, n_vectors)
+
+    def update(self, vectors: np.ndarray, keep: np.ndarray, order: np.ndarray) -> 'IVFIndex':
+        """
+        Index over a vector matrix updated with merge_review_ids (keep, order):
+        surviving rows are renumbered and only the new rows are assigned to
+        the existing centroids.
+        """
+        if not len(self.centroids):
+            return IVFIndex.build(vectors)
+
+        n_kept = int(keep.sum())
+        new_positions = np.empty(len(order), dtype=np.int64)
+        new_positions[order] = np.arange(len(order))
+        old_to_new = np.full(len(keep), -1, dtype=np.int64)
+        old_to_new[keep] = new_positions[:n_kept]
+
+        labels = np.repeat(np.arange(len(self.centroids)), np.diff(self.list_offsets))
+        rows = old_to_new[np.asarray(self.list_rows)]
+        kept = rows >= 0
+        added_rows = np.sort(new_positions[n_kept:])
+        added_rows = added_rows[np.any(vectors[added_rows], axis=1)] if len(added_rows) else added_rows
+        added_labels = _assign(vectors[added_rows], self.centroids) if len(added_rows) else np.empty(0, dtype=np.int64)
+
+        labels = np.concatenate([labels[kept], added_labels])
+        rows = np.concatenate([rows[kept], added_rows])
+        sort = np.argsort(labels, kind='stable')
+        list_offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=len(self.centroids)), out=list_offsets[1:])
+        return IVFIndex(self.centroids, list_offsets, rows[sort], len(vectors))
+
+    def search(self, vectors: np.ndarray, query_vector: np.ndarray, k: int,
+               n_probe: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k rows of `vectors` by cosine similarity to the
+        normalized query vector. Returns (rows, similarities), best first.
+        """
+        if not len(self.centroids) or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        n_probe = min(n_probe, len(self.centroids))
+        centroid_scores = self.centroids @ query_vector
+        probed = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        rows = np.concatenate([
+            self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in probed
+        ])
+        if not len(rows):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        rows.sort()  # sequential access into a memory-mapped matrix
+        similarities = np.asarray(vectors[rows], dtype=np.float32) @ query_vector
+        k = min(k, len(rows))
+        best = np.argpartition(-similarities, k - 1)[:k]
+        best = best[np.argsort(-similarities[best], kind='stable')]
+        return rows[best], similarities[best]
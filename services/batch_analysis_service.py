@@ -0,0 +1,204 @@
+import json
+import multiprocessing
+import sqlite3
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .analysis_cache_service import encode_analysis
+from .analysis_store_service import (
+    ANALYSIS_TABLE, CREATE_ANALYSIS_TABLE, DATABASE, add_lexicon_version_column, content_hash
+)
+from .connection_service import connect_writable
+from .gaming_lexicon_service import get_gaming_lexicon
+from .text_analysis_service import text_analysis_service
+
+SUMMARY_TABLE = 'review_nlp_summary'
+CHECKPOINT_TABLE = 'analysis_checkpoints'
+JOB_NAME = 'review_analysis'
+
+# Per-review aggregates of the full analysis, small enough to query directly
+CREATE_SUMMARY_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (
+        review_id INTEGER PRIMARY KEY,
+        polarity REAL,
+        subjectivity REAL,
+        intensity REAL,
+        word_count INTEGER,
+        entity_count INTEGER,
+        entity_counts TEXT,
+        pos_counts TEXT
+    )
+"""
+
+CREATE_CHECKPOINT_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+        job TEXT PRIMARY KEY,
+        last_review_id INTEGER NOT NULL,
+        processed INTEGER NOT NULL,
+        updated_at REAL NOT NULL
+    )
+"""
+
+def summarize_analysis(analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduces an analyze_text result to the columns of the summary table."""
+    entities = analysis.get('named_entities', {})
+    sentiment = analysis.get('sentiment', {})
+    return {
+        'polarity': sentiment.get('polarity', 0.0),
+        'subjectivity': sentiment.get('subjectivity', 0.0),
+        'intensity': sentiment.get('intensity', {}).get('value', 0.0),
+        'word_count': analysis.get('word_count', 0),
+        'entity_count': sum(len(items) for items in entities.values()),
+        'entity_counts': json.dumps({label: len(items) for label, items in entities.items()}),
+        'pos_counts': json.dumps(analysis.get('summary_stats', {}).get('pos_counts', {}))
+    }
+
+def analyze_chunk(chunk: Tuple[int, List[Tuple[int, str, str]], int]) -> Tuple[int, List[tuple], List[tuple]]:
+    """
+    Worker task: analyzes a chunk of (review_id, content, content_hash) rows with
+    a single nlp.pipe pass. Returns (last_scanned_id, analysis_rows, summary_rows).
+    """
+    last_id, rows, batch_size = chunk
+    analyses = text_analysis_service.analyze_many((content for _, content, _ in rows), batch_size=batch_size)
+    lexicon_version = get_gaming_lexicon().version
+    analysis_rows, summary_rows = [], []
+    for (review_id, content, digest), analysis in zip(rows, analyses):
+        summary = summarize_analysis(analysis)
+        analysis_rows.append((review_id, digest, lexicon_version, encode_analysis(analysis)))
+        summary_rows.append((
+            review_id, summary['polarity'], summary['subjectivity'], summary['intensity'],
+            summary['word_count'], summary['entity_count'], summary['entity_counts'], summary['pos_counts']
+        ))
+    return last_id, analysis_rows, summary_rows
+
+def _init_worker(analysis_cache: Optional[str] = None):
+    # Load the spaCy model once per worker process, before the first task
+    text_analysis_service.nlp
+    if analysis_cache:
+        text_analysis_service.cache.open_disk_tier(analysis_cache)
+
+def iter_pending_chunks(con: sqlite3.Connection, start_id: int, chunk_size: int,
+                        batch_size: int) -> Iterator[Tuple[int, List[Tuple[int, str, str]], int]]:
+    """
+    Streams reviews after start_id in id order and yields chunks of those
+    without an up-to-date stored analysis (text changed, or analyzed with
+    another gaming lexicon).
+    """
+    lexicon_version = get_gaming_lexicon().version
+    last_id = start_id
+    while True:
+        rows = con.execute(f"""
+            SELECT r.id, r.content, ra.content_hash, ra.lexicon_version
+            FROM reviews r
+            LEFT JOIN {ANALYSIS_TABLE} ra ON ra.review_id = r.id
+            WHERE r.id > ?
+            ORDER BY r.id
+            LIMIT ?
+        """, (last_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        pending = []
+        for review_id, content, stored_hash, stored_version in rows:
+            digest = content_hash(content)
+            if stored_hash != digest or stored_version != lexicon_version:
+                pending.append((review_id, content or "", digest))
+        yield last_id, pending, batch_size
+
+def checkpoint_job() -> str:
+    """
+    Checkpoint key of the job. It includes the gaming lexicon version, so a run
+    resumed after the lexicon changed starts over instead of skipping the
+    reviews the interrupted run analyzed with the old lexicon.
+    """
+    return f"{JOB_NAME}:{get_gaming_lexicon().version}"
+
+def load_checkpoint(con: sqlite3.Connection) -> Tuple[int, int]:
+    row = con.execute(
+        f"SELECT last_review_id, processed FROM {CHECKPOINT_TABLE} WHERE job = ?", (checkpoint_job(),)
+    ).fetchone()
+    return row if row else (-2**63, 0)
+
+def write_results(con: sqlite3.Connection, last_id: int, analysis_rows: List[tuple],
+                  summary_rows: List[tuple], processed: int):
+    """Writes one chunk of results and advances the checkpoint in a single transaction."""
+    with con:
+        con.executemany(
+            f"INSERT OR REPLACE INTO {ANALYSIS_TABLE} (review_id, content_hash, lexicon_version, analysis) VALUES (?, ?, ?, ?)",
+            analysis_rows
+        )
+        con.executemany(
+            f"INSERT OR REPLACE INTO {SUMMARY_TABLE} (review_id, polarity, subjectivity, intensity, "
+            f"word_count, entity_count, entity_counts, pos_counts) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            summary_rows
+        )
+        con.execute(
+            f"INSERT OR REPLACE INTO {CHECKPOINT_TABLE} (job, last_review_id, processed, updated_at) VALUES (?, ?, ?, ?)",
+            (checkpoint_job(), last_id, processed, time.time())
+        )
+
+def run_batch_analysis(database: str = DATABASE, workers: int = 1, chunk_size: int = 2000,
+                       batch_size: int = 256, rebuild: bool = False,
+                       analysis_cache: Optional[str] = None) -> int:
+    """
+    Analyzes every review without an up-to-date stored analysis and writes the
+    full results (review_analysis) and their summaries (review_nlp_summary).
+
+    Chunks are fanned out to `workers` processes, each with its own spaCy model;
+    at most two chunks per worker are in flight so memory stays bounded. Results
+    are written in chunk order together with a checkpoint, so an interrupted run
+    resumes after the last written chunk. With `analysis_cache`, the workers
+    share memoized analyses through that SQLite file, so texts repeated across
+    chunks are analyzed once. Returns the number of analyzed reviews.
+    """
+    con = connect_writable(database)
+    try:
+        with con:
+            if rebuild:
+                con.execute(f"DROP TABLE IF EXISTS {ANALYSIS_TABLE}")
+                con.execute(f"DROP TABLE IF EXISTS {SUMMARY_TABLE}")
+                con.execute(f"DROP TABLE IF EXISTS {CHECKPOINT_TABLE}")
+            con.execute(CREATE_ANALYSIS_TABLE)
+            add_lexicon_version_column(con)
+            con.execute(CREATE_SUMMARY_TABLE)
+            con.execute(CREATE_CHECKPOINT_TABLE)
+
+        start_id, processed = load_checkpoint(con)
+        if processed:
+            print(f"Resuming after review id {start_id} ({processed} already analyzed)")
+        analyzed = 0
+
+        chunks = iter_pending_chunks(con, start_id, chunk_size, batch_size)
+        if workers <= 1:
+            if analysis_cache:
+                text_analysis_service.cache.open_disk_tier(analysis_cache)
+            for chunk in chunks:
+                last_id, analysis_rows, summary_rows = analyze_chunk(chunk)
+                analyzed += len(analysis_rows)
+                write_results(con, last_id, analysis_rows, summary_rows, processed + analyzed)
+                print(f"Analyzed {processed + analyzed} reviews (last id {last_id})")
+        else:
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(analysis_cache,)) as pool:
+                in_flight = deque()
+                for chunk in chunks:
+                    in_flight.append(pool.apply_async(analyze_chunk, (chunk,)))
+                    if len(in_flight) < workers * 2:
+                        continue
+                    last_id, analysis_rows, summary_rows = in_flight.popleft().get()
+                    analyzed += len(analysis_rows)
+                    write_results(con, last_id, analysis_rows, summary_rows, processed + analyzed)
+                    print(f"Analyzed {processed + analyzed} reviews (last id {last_id})")
+                while in_flight:
+                    last_id, analysis_rows, summary_rows = in_flight.popleft().get()
+                    analyzed += len(analysis_rows)
+                    write_results(con, last_id, analysis_rows, summary_rows, processed + analyzed)
+                    print(f"Analyzed {processed + analyzed} reviews (last id {last_id})")
+
+        # Finished: the next run starts from the beginning again and only
+        # picks up new or edited reviews (checkpoints of other lexicons are stale)
+        with con:
+            con.execute(f"DELETE FROM {CHECKPOINT_TABLE} WHERE job = ? OR job LIKE ?", (JOB_NAME, f"{JOB_NAME}:%"))
+        return analyzed
+    finally:
+        con.close()
@@ -0,0 +1,100 @@
+import functools
+import glob
+import os
+import threading
+from typing import Callable, Dict, Union
+
+from .aggregate_service import get_data_version
+from .cache_service import LRUCache
+
+CHART_CACHE_DIR = 'data/chart_cache'
+CHART_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# Extensions of charts rendered as encoded images (bytes) rather than text
+BINARY_EXTENSIONS = ('png', 'webp')
+
+class ChartCache:
+    """
+    Rendered chart fragments (Plotly HTML, SVG) and images keyed on the chart name and
+    the aggregates' data_version, kept in memory and on disk so they survive
+    restarts and are shared between worker processes. A chart is rendered
+    again only after the aggregates change; without built aggregates there is
+    no version to key on and charts are rendered on every call.
+    """
+
+    def __init__(self, cache_dir: str = CHART_CACHE_DIR, max_bytes: int = CHART_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        # (name, ext) -> (data_version, fragment); only the current version is kept
+        self.memory = LRUCache(max_bytes, sizeof=lambda entry: len(entry[1]) + 128)
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+        self.renders = 0
+
+    def _path(self, name: str, version: int, ext: str) -> str:
+        return os.path.join(self.cache_dir, f"{name}-v{version}.{ext}")
+
+    def get_or_render(self, name: str, ext: str, render: Callable[[], Union[str, bytes]]) -> Union[str, bytes]:
+        version = get_data_version()
+        if not version:
+            return render()
+
+        entry = self.memory.get((name, ext))
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        path = self._path(name, version, ext)
+        if os.path.exists(path):
+            if ext in BINARY_EXTENSIONS:
+                with open(path, 'rb') as f:
+                    fragment = f.read()
+            else:
+                with open(path, encoding='utf-8') as f:
+                    fragment = f.read()
+            self.disk_hits += 1
+        else:
+            fragment = render()
+            self.renders += 1
+            self._write(name, version, ext, fragment)
+        self.memory.put((name, ext), (version, fragment))
+        return fragment
+
+    def _write(self, name: str, version: int, ext: str, fragment: Union[str, bytes]):
+        """Stores the fragment atomically and drops the chart's older versions."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(name, version, ext)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        if isinstance(fragment, bytes):
+            with open(tmp_path, 'wb') as f:
+                f.write(fragment)
+        else:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(fragment)
+        os.replace(tmp_path, path)
+        with self._lock:
+            for old_path in glob.glob(os.path.join(self.cache_dir, f"{name}-v*.{ext}")):
+                if old_path != path:
+                    try:
+                        os.remove(old_path)
+                    except OSError:
+                        pass
+
+    def cached(self, name: str, ext: str):
+        """Decorator for a chart function returning its rendered fragment."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper():
+                return self.get_or_render(name, ext, func)
+            return wrapper
+        return decorator
+
+    def clear(self):
+        self.memory.clear()
+        for path in glob.glob(os.path.join(self.cache_dir, '*-v*.*')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.memory.stats(), 'disk_hits': self.disk_hits, 'renders': self.renders}
+
+chart_cache = ChartCache()
@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+
+DATABASE = 'data/steam_reviews_with_authors.db'
+
+# Applied to every connection. mmap and a larger page cache keep hot pages of
+# the review tables in memory; temp_store keeps sorter/GROUP BY temp b-trees off disk.
+CONNECTION_PRAGMAS = (
+    "PRAGMA mmap_size = 268435456",  # 256 MB
+    "PRAGMA cache_size = -65536",    # 64 MB
+    "PRAGMA temp_store = MEMORY"
+)
+# Prepared statements kept per connection (sqlite3 default is 128)
+STATEMENT_CACHE_SIZE = 512
+BUSY_TIMEOUT = 30  # seconds
+# Seconds table_exists answers from memory; tables built later (FTS index,
+# aggregates, term frequencies, ...) are noticed after at most this long
+TABLE_CHECK_TTL = 60
+
+_local = threading.local()
+_wal_checked = set()
+_wal_lock = threading.Lock()
+_table_checks = {}  # (database, table) -> (exists, checked_at)
+
+def _configure(con: sqlite3.Connection) -> sqlite3.Connection:
+    for pragma in CONNECTION_PRAGMAS:
+        con.execute(pragma)
+    return con
+
+def enable_wal(database: str = DATABASE):
+    """
+    Switches the database to WAL journaling (persistent, done once per process)
+    so readers never block batch writers and vice versa. Read-only locations
+    are left as they are.
+    """
+    with _wal_lock:
+        if database in _wal_checked:
+            return
+        _wal_checked.add(database)
+        try:
+            con = sqlite3.connect(database, timeout=BUSY_TIMEOUT)
+            try:
+                con.execute("PRAGMA journal_mode = WAL")
+            finally:
+                con.close()
+        except sqlite3.Error as e:
+            print(f"Warning: could not enable WAL for {database}: {e}")
+
+def connect_readonly(database: str = DATABASE) -> sqlite3.Connection:
+    """New tuned read-only connection (mode=ro), e.g. for streaming in batch jobs."""
+    if not os.path.exists(database):
+        raise sqlite3.OperationalError(f"unable to open database file: {database}")
+    enable_wal(database)
+    uri = f"file:{quote(os.path.abspath(database))}?mode=ro"
+    return _configure(sqlite3.connect(
+        uri, uri=True, timeout=BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE
+    ))
+
+def connect_writable(database: str = DATABASE) -> sqlite3.Connection:
+    """New tuned read-write connection for build, ingest and migration commands."""
+    enable_wal(database)
+    return _configure(sqlite3.connect(
+        database, timeout=BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE
+    ))
+
+def get_read_connection(database: str = DATABASE) -> sqlite3.Connection:
+    """
+    Read-only connection owned by the calling thread, opened on first use and
+    reused for every later query of that thread. Do not close it; close
+    cursors instead.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    con = connections.get(database)
+    if con is None:
+        con = connections[database] = connect_readonly(database)
+    return con
+
+def close_thread_connections():
+    """Closes the calling thread's pooled connections."""
+    for con in getattr(_local, 'connections', {}).values():
+        con.close()
+    _local.connections = {}
+
+def table_exists(name: str, database: str = DATABASE) -> bool:
+    """
+    Whether the database has the table `name`. Answers are cached per
+    database and table for TABLE_CHECK_TTL seconds (see clear_table_checks).
+    """
+    key = (database, name)
+    now = time.monotonic()
+    cached = _table_checks.get(key)
+    if cached is not None and now - cached[1] < TABLE_CHECK_TTL:
+        return cached[0]
+    try:
+        row = get_read_connection(database).execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ).fetchone()
+        exists = row is not None
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        exists = False
+    _table_checks[key] = (exists, now)
+    return exists
+
+def clear_table_checks():
+    """Forgets the cached table_exists answers, e.g. after building a table."""
+    _table_checks.clear()
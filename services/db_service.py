@@ -1,20 +1,99 @@
 from datetime import datetime
+import base64
+import json
+import logging
 import sqlite3
-from typing import List, Dict, Any
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
+import numpy as np
+from .aggregate_service import get_top_counts
+from .cache_service import LRUCache
+from .connection_service import DATABASE, get_read_connection
+from .ingest_service import parse_timestamp
+from .migration_service import schema_up_to_date
 from .search_service import search_service
-from .text_analysis_service import text_analysis_service
+from .analysis_store_service import get_review_analysis
+from .search_index_service import FTS_TABLE, fts_index_available, to_fts_query
 import traceback
 
-DATABASE = 'data/steam_reviews_with_authors.db'
+logger = logging.getLogger(__name__)
+
+# Ranked search results (all matching ids with their scores), so that
+# pages 2..N of the same search are a slice instead of a new scan-and-rank
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+RESULT_CACHE_TTL = 600  # seconds
+# Results ordered by the first top-k partition of a search (10 pages of 20);
+# later pages extend the ordered prefix at least twofold
+RANKED_PREFIX = 200
+
+class RankedResults:
+    """
+    All matches of a ranked search with their scores, ordered lazily: only
+    the prefix that pages have asked for is sorted, by a top-k partition
+    (search_service.top_k), so the first page of a search with n matches
+    costs O(n) instead of a full O(n log n) sort. top_k breaks ties by
+    position, so every longer prefix extends the shorter ones.
+    Results that are already in rank order (semantic retrieval, polarity
+    sort) are passed with ranked=True.
+    """
+
+    def __init__(self, ids: np.ndarray, scores: np.ndarray, ranked: bool = False):
+        self.ids = ids
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.order = None if ranked else np.empty(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Size once fully ordered, so the cache accounting holds as the order grows"""
+        return self.ids.nbytes + self.scores.nbytes + (8 * len(self) if self.order is not None else 0)
+
+    def _ordered_prefix(self, k: int) -> np.ndarray:
+        """Positions of the k best results, extending the sorted prefix when needed."""
+        order = self.order
+        if len(order) < min(k, len(self)):
+            order = search_service.top_k(self.scores, max(k, 2 * len(order), RANKED_PREFIX))
+            self.order = order
+        return order
+
+    def page(self, start: int, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids, scores) of ranks start .. start + count - 1."""
+        if self.order is None:
+            return self.ids[start:start + count], self.scores[start:start + count]
+        positions = self._ordered_prefix(start + count)[start:start + count]
+        return self.ids[positions], self.scores[positions]
+
+    def ranked(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids, scores) of all results in rank order (a full sort when not ranked yet)."""
+        return self.page(0, len(self))
+
+result_cache = LRUCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL, sizeof=lambda result: result.nbytes + 256)
+
+# Match counts of unranked (no keyword) filter combinations, shared by all their pages
+count_cache = LRUCache(1024 * 1024, RESULT_CACHE_TTL, sizeof=lambda count: 128)
+
+def clear_search_caches():
+    result_cache.clear()
+    count_cache.clear()
+
+# Reviews retrieved from the ANN index per semantic query, before filters are applied
+SEMANTIC_CANDIDATES = 1000
+
+# Lowest TextBlob polarity
+MIN_POLARITY = -1.0
 
 def format_timestamp(unix_timestamp):
     """Konwertuje znacznik czasu UNIX na czytelną datę."""
+    if unix_timestamp is None:
+        return ""
     return datetime.utcfromtimestamp(unix_timestamp).strftime('%Y-%m-%d %H:%M:%S')
 
 def build_query_conditions(keyword: str = "", filter_option: str = "all", game_id: str = "", 
                          date_from: str = None, date_to: str = None, min_playtime: int = None,
                          min_funny: int = None, received_free: bool = None, 
-                         early_access: bool = None) -> tuple[str, list]:
+                         early_access: bool = None, min_polarity: float = None,
+                         sort: str = None) -> tuple[str, list]:
     """
     Builds query conditions and parameters for filtering reviews.
     Returns a tuple of (conditions_string, parameters_list)
@@ -24,25 +103,32 @@ def build_query_conditions(keyword: str = "", filter_option: str = "all", game_i
     
     # Base conditions
     if keyword:
-        conditions.append("r.content LIKE ?")
-        params.append(f"%{keyword}%")
+        # Use the FTS5 index when it has been built (see build_indexes.py),
+        # otherwise fall back to a full scan with LIKE
+        fts_query = to_fts_query(keyword) if fts_index_available(DATABASE) else None
+        if fts_query:
+            conditions.append(f"r.id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?)")
+            params.append(fts_query)
+        else:
+            conditions.append("r.content LIKE ?")
+            params.append(f"%{keyword}%")
 
     if filter_option == "positive":
-        conditions.append("r.is_positive = 'Pozytywna'")
+        conditions.append("r.is_positive = 1")
     elif filter_option == "negative":
-        conditions.append("r.is_positive = 'Negatywna'")
+        conditions.append("r.is_positive = 0")
 
     if game_id:
         conditions.append("r.app_id = ?")
         params.append(int(game_id))
 
-    # Date range conditions
+    # Date range conditions (epoch seconds; invalid dates match nothing)
     if date_from:
-        conditions.append("r.timestamp_created >= strftime('%s', ?)")
-        params.append(date_from)
+        conditions.append("r.timestamp_created >= ?")
+        params.append(parse_timestamp(date_from))
     if date_to:
-        conditions.append("r.timestamp_created <= strftime('%s', ?)")
-        params.append(date_to)
+        conditions.append("r.timestamp_created <= ?")
+        params.append(parse_timestamp(date_to))
 
     # Playtime condition
     if min_playtime is not None:
@@ -57,20 +143,307 @@ def build_query_conditions(keyword: str = "", filter_option: str = "all", game_i
     # Boolean filters
     if received_free is not None:
         conditions.append("r.received_for_free = ?")
-        params.append(str(received_free))
+        params.append(int(received_free))
     if early_access is not None:
         conditions.append("r.written_during_early_access = ?")
-        params.append(str(early_access))
+        params.append(int(early_access))
+
+    # Sentiment scores (see sentiment_service); reviews not scored yet are NULL
+    # and neither pass min_polarity nor appear in polarity order. Polarity
+    # order keeps the scored reviews with a range from the lowest polarity,
+    # which (unlike IS NOT NULL) lets the counts seek idx_reviews_polarity.
+    if min_polarity is not None or sort == 'polarity':
+        conditions.append("r.polarity >= ?")
+        params.append(min_polarity if min_polarity is not None else MIN_POLARITY)
 
     return " AND ".join(conditions) if conditions else "1=1", params
 
+REVIEW_SELECT = """
+    SELECT r.*,
+           a.num_games_owned as games_owned,
+           a.num_reviews as total_reviews,
+           a.playtime_forever,
+           a.playtime_last_two_weeks,
+           a.playtime_at_review,
+           g.name as game_name,
+           g.developer as game_developer,
+           g.publisher as game_publisher,
+           g.genre as game_genre,
+           g.tags as game_tags,
+           g.languages as game_languages,
+           g.owners as game_owners
+    FROM reviews r
+    LEFT JOIN authors a ON r.author_id = a.author_id
+    LEFT JOIN games g ON r.app_id = g.app_id
+"""
+
+def build_review_dict(row) -> Dict[str, Any]:
+    """Maps a REVIEW_SELECT row to the review dict used by the templates."""
+    review = dict(row)
+    review['timestamp_created'] = format_timestamp(review['timestamp_created'])
+
+    # Create author dictionary structure
+    review['author'] = {
+        'games_owned': review.get('games_owned', 0),
+        'total_reviews': review.get('total_reviews', 0),
+        'playtime_forever': review.get('playtime_forever', 0),
+        'playtime_last_two_weeks': review.get('playtime_last_two_weeks', 0),
+        'playtime_at_review': review.get('playtime_at_review', 0)
+    }
+
+    # Boolean fields are stored as INTEGER 0/1 (see migration_service)
+    review['is_positive'] = 'Positive' if review.get('is_positive') else 'Negative'
+    review['steam_purchase'] = bool(review.get('steam_purchase'))
+    review['received_for_free'] = bool(review.get('received_for_free'))
+    review['written_during_early_access'] = bool(review.get('written_during_early_access'))
+    return review
+
+def fetch_reviews_by_ids(cur: sqlite3.Cursor, review_ids: List[int]) -> List[Dict[str, Any]]:
+    """Loads full review dicts for the given ids, in the given order."""
+    if not review_ids:
+        return []
+    placeholders = ", ".join("?" * len(review_ids))
+    cur.execute(f"{REVIEW_SELECT} WHERE r.id IN ({placeholders})", list(review_ids))
+    reviews_by_id = {row['id']: build_review_dict(row) for row in cur.fetchall()}
+    return [reviews_by_id[review_id] for review_id in review_ids if review_id in reviews_by_id]
+
+# Unranked browsing orders: sort -> (ORDER BY, keyset column, cursor key).
+# (column, id) of the last row is the keyset cursor of the next page.
+BROWSE_ORDERS = {
+    'date': ("r.timestamp_created DESC, r.id DESC", "timestamp_created", 'ts'),
+    'polarity': ("r.polarity DESC, r.id DESC", "polarity", 'pol')
+}
+BROWSE_ORDER = BROWSE_ORDERS['date'][0]
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    """Opaque, URL-safe page cursor."""
+    payload = json.dumps(position, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Optional[Dict[str, Any]]:
+    """Decodes a cursor from encode_cursor; invalid cursors yield None."""
+    if not cursor:
+        return None
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position = json.loads(payload.decode('utf-8'))
+    except ValueError:
+        return None
+    return position if isinstance(position, dict) else None
+
+def fetch_browse_page(cur: sqlite3.Cursor, conditions: str, params: list, per_page: int,
+                      offset: int = 0, after: Dict[str, Any] = None,
+                      sort: str = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One page of unranked reviews in BROWSE_ORDERS[sort] (newest first by
+    default) with LIMIT pushed into SQL. `after` is a decoded keyset cursor;
+    without it `offset` is used.
+    Returns (reviews, next_cursor); next_cursor is None on the last page.
+    """
+    order, column, key = BROWSE_ORDERS.get(sort) or BROWSE_ORDERS['date']
+    if after is not None and key in after and 'id' in after:
+        conditions = f"({conditions}) AND (r.{column}, r.id) < (?, ?)"
+        params = params + [after[key], after['id']]
+        offset = 0
+
+    # One extra row tells whether there is a next page
+    cur.execute(f"{REVIEW_SELECT} WHERE {conditions} ORDER BY {order} LIMIT ? OFFSET ?",
+                params + [per_page + 1, offset])
+    rows = cur.fetchall()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor({key: rows[-1][column], 'id': rows[-1]['id']})
+
+    reviews = [build_review_dict(row) for row in rows]
+    for review in reviews:
+        review['relevance'] = 0.0  # Default relevance score
+    return reviews, next_cursor
+
+def fetch_ranked_page(cur: sqlite3.Cursor, ranked: RankedResults,
+                      start_idx: int, per_page: int, scoring_method: str) -> List[Dict[str, Any]]:
+    """Materializes full rows for one slice of the ranked results only."""
+    page_ids, page_scores = ranked.page(start_idx, per_page)
+    page_ids = page_ids.tolist()
+    page_scores = dict(zip(page_ids, page_scores.tolist()))
+
+    reviews = fetch_reviews_by_ids(cur, page_ids)
+    method = search_service.normalize_scoring_method(scoring_method)
+    for review in reviews:
+        review['relevance'] = page_scores[review['id']]
+        review['scoring_method'] = method
+    return reviews
+
+def count_filtered_reviews(cur: sqlite3.Cursor, cache_key: tuple, conditions: str, params: list,
+                           count_limit: int = None) -> Tuple[int, bool]:
+    """
+    Number of reviews matching the conditions, cached per filter combination.
+    With count_limit, counting stops after count_limit + 1 rows and the
+    result is (count_limit, True) when there are more ("10,000+").
+    Returns (count, is_lower_bound).
+    """
+    key = (cache_key, count_limit)
+    cached = count_cache.get(key)
+    if cached is not None:
+        return cached
+
+    query = f"""
+        SELECT 1
+        FROM reviews r
+        LEFT JOIN authors a ON r.author_id = a.author_id
+        LEFT JOIN games g ON r.app_id = g.app_id
+        WHERE {conditions}
+    """
+    if count_limit is None:
+        cur.execute(f"SELECT COUNT(*) FROM ({query})", params)
+        result = (cur.fetchone()[0], False)
+    else:
+        cur.execute(f"SELECT COUNT(*) FROM ({query} LIMIT ?)", params + [count_limit + 1])
+        count = cur.fetchone()[0]
+        result = (count_limit, True) if count > count_limit else (count, False)
+
+    count_cache.put(key, result)
+    return result
+
+def normalize_search_key(keyword: str = "", filter_option: str = "all", scoring_method: str = "tfidf",
+                         game_id: str = "", date_from: str = None, date_to: str = None,
+                         min_playtime: int = None, min_funny: int = None,
+                         received_free: bool = None, early_access: bool = None,
+                         min_polarity: float = None, sort: str = None) -> tuple:
+    """
+    Builds the result cache key. Keyword matching and all scorers are
+    case-insensitive, so the keyword is lowercased and its whitespace collapsed.
+    """
+    return (
+        " ".join((keyword or "").lower().split()),
+        filter_option or "all",
+        search_service.normalize_scoring_method(scoring_method),
+        str(game_id or ""),
+        date_from or None,
+        date_to or None,
+        min_playtime,
+        min_funny,
+        received_free,
+        early_access,
+        min_polarity,
+        sort or None
+    )
+
+def rank_reviews(cur: sqlite3.Cursor, keyword: str, scoring_method: str,
+                 conditions: str, params: list) -> RankedResults:
+    """
+    Scores every review matching the conditions. The results are put in
+    descending relevance order page by page (see RankedResults).
+    """
+    # Candidate pass: only what the scorers need
+    cur.execute(f"""
+        SELECT r.id, r.content
+        FROM reviews r
+        LEFT JOIN authors a ON r.author_id = a.author_id
+        LEFT JOIN games g ON r.app_id = g.app_id
+        WHERE {conditions}
+    """, params)
+    candidates = cur.fetchall()
+    candidate_ids = np.array([row[0] for row in candidates], dtype=np.int64)
+    candidate_texts = [row[1] or "" for row in candidates]
+    del candidates
+
+    logger.debug("Calculating relevance scores using %s for keyword: %r", scoring_method, keyword)
+    scores = search_service.score_reviews(keyword, candidate_ids.tolist(), candidate_texts, scoring_method)
+    return RankedResults(candidate_ids, scores)
+
+def rank_semantic(cur: sqlite3.Cursor, keyword: str,
+                  conditions: str, params: list) -> RankedResults:
+    """
+    Retrieves the reviews closest to the keyword from the whole corpus and
+    keeps those matching the (non-keyword) filter conditions, in rank order.
+    """
+    logger.debug("Semantic retrieval of %d candidates for keyword: %r", SEMANTIC_CANDIDATES, keyword)
+    ranked_ids, ranked_scores = search_service.semantic_search(keyword, SEMANTIC_CANDIDATES)
+    if conditions == "1=1" or not len(ranked_ids):
+        return RankedResults(ranked_ids, ranked_scores, ranked=True)
+
+    # Post-filter in chunks to stay under SQLite's bound parameter limit
+    allowed = set()
+    for start in range(0, len(ranked_ids), 500):
+        chunk = ranked_ids[start:start + 500].tolist()
+        placeholders = ", ".join("?" * len(chunk))
+        cur.execute(f"""
+            SELECT r.id
+            FROM reviews r
+            LEFT JOIN authors a ON r.author_id = a.author_id
+            LEFT JOIN games g ON r.app_id = g.app_id
+            WHERE r.id IN ({placeholders}) AND {conditions}
+        """, chunk + params)
+        allowed.update(row[0] for row in cur.fetchall())
+
+    mask = np.fromiter((review_id in allowed for review_id in ranked_ids.tolist()), dtype=bool, count=len(ranked_ids))
+    return RankedResults(ranked_ids[mask], ranked_scores[mask], ranked=True)
+
+def sort_by_polarity(cur: sqlite3.Cursor, ranked: RankedResults) -> RankedResults:
+    """Reorders ranked results by descending polarity; relevance breaks ties."""
+    ranked_ids, ranked_scores = ranked.ranked()
+    polarity = {}
+    for start in range(0, len(ranked_ids), 10000):
+        chunk = ranked_ids[start:start + 10000].tolist()
+        polarity.update(cur.execute(
+            "SELECT id, polarity FROM reviews WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(chunk),)
+        ).fetchall())
+    keys = np.fromiter((polarity.get(review_id) or 0.0 for review_id in ranked_ids.tolist()),
+                       dtype=np.float64, count=len(ranked_ids))
+    order = np.argsort(-keys, kind='stable')
+    return RankedResults(ranked_ids[order], ranked_scores[order], ranked=True)
+
+def get_ranked_results(cur: sqlite3.Cursor, keyword: str, filter_option: str, scoring_method: str,
+                       game_id: str, date_from: str, date_to: str, min_playtime: int, min_funny: int,
+                       received_free: bool, early_access: bool, min_polarity: float = None,
+                       sort: str = None) -> RankedResults:
+    """
+    Ranked results of a keyword search, served from result_cache when
+    possible. With sort='polarity' the matches are ordered by polarity instead
+    of relevance.
+    """
+    cache_key = normalize_search_key(
+        keyword, filter_option, scoring_method, game_id, date_from, date_to,
+        min_playtime, min_funny, received_free, early_access, min_polarity, sort
+    )
+    ranked = result_cache.get(cache_key)
+    if ranked is not None:
+        logger.debug("Ranked results served from cache")
+        return ranked
+
+    if cache_key[2] == 'semantic' and search_service.semantic_search_available():
+        # No keyword prefilter: the keyword is the semantic query
+        conditions, params = build_query_conditions(
+            "", filter_option, game_id, date_from, date_to,
+            min_playtime, min_funny, received_free, early_access, min_polarity, sort
+        )
+        ranked = rank_semantic(cur, keyword, conditions, params)
+    else:
+        conditions, params = build_query_conditions(
+            keyword, filter_option, game_id, date_from, date_to,
+            min_playtime, min_funny, received_free, early_access, min_polarity, sort
+        )
+        ranked = rank_reviews(cur, keyword, scoring_method, conditions, params)
+    if sort == 'polarity':
+        ranked = sort_by_polarity(cur, ranked)
+    result_cache.put(cache_key, ranked)
+    return ranked
+
 def cached_get_reviews(page: int = 1, per_page: int = 20, keyword: str = "", 
                       filter_option: str = "all", scoring_method: str = "tfidf",
                       game_id: str = "", date_from: str = None, date_to: str = None,
                       min_playtime: int = None, min_funny: int = None,
-                      received_free: bool = None, early_access: bool = None) -> List[Dict[str, Any]]:
+                      received_free: bool = None, early_access: bool = None,
+                      min_polarity: float = None, sort: str = None) -> List[Dict[str, Any]]:
     """
     Pobiera recenzje z bazy danych z uwzględnieniem wszystkich filtrów jednocześnie.
+
+    Ranking only needs ids and content: scores for all candidates are computed
+    as a vector and the ranked id list is kept in result_cache, so every page of
+    the same search is a slice. Full rows with their joins are loaded only for
+    the requested page.
     """
     start_idx = (page - 1) * per_page
     end_idx = start_idx + per_page
@@ -78,77 +451,28 @@ def cached_get_reviews(page: int = 1, per_page: int = 20, keyword: str = "",
     # Build query conditions
     conditions, params = build_query_conditions(
         keyword, filter_option, game_id, date_from, date_to,
-        min_playtime, min_funny, received_free, early_access
+        min_playtime, min_funny, received_free, early_access, min_polarity, sort
     )
 
-    # Base query with all necessary fields
-    query = f"""
-        SELECT r.*, 
-               a.num_games_owned as games_owned,
-               a.num_reviews as total_reviews,
-               a.playtime_forever,
-               a.playtime_at_review,
-               g.name as game_name,
-               g.developer as game_developer,
-               g.publisher as game_publisher,
-               g.genre as game_genre,
-               g.tags as game_tags,
-               g.languages as game_languages,
-               g.owners as game_owners
-        FROM reviews r
-        LEFT JOIN authors a ON r.author_id = a.author_id
-        LEFT JOIN games g ON r.app_id = g.app_id
-        WHERE {conditions}
-    """
-
-    print(f"\nDebug: Query conditions: {conditions}")
-    print(f"Debug: Query parameters: {params}")
+    logger.debug("Query conditions: %s; parameters: %s", conditions, params)
     
-    con = sqlite3.connect(DATABASE)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
+    cur = get_read_connection(DATABASE).cursor()
+    cur.row_factory = sqlite3.Row
     
     try:
-        # Execute query
-        cur.execute(query, params)
-        columns = [col[0] for col in cur.description]
-        all_reviews = [dict(zip(columns, row)) for row in cur.fetchall()]
-
-        # Format timestamps and initialize relevance scores
-        for review in all_reviews:
-            review['timestamp_created'] = format_timestamp(review['timestamp_created'])
-            review['relevance'] = 0.0  # Default relevance score
-            
-            # Create author dictionary structure
-            review['author'] = {
-                'games_owned': review.get('games_owned', 0),
-                'total_reviews': review.get('total_reviews', 0),
-                'playtime_forever': review.get('playtime_forever', 0),
-                'playtime_last_two_weeks': review.get('playtime_last_two_weeks', 0),
-                'playtime_at_review': review.get('playtime_at_review', 0)
-            }
-            
-            # Convert boolean fields
-            def convert_text_to_bool(value):
-                if value is None:
-                    return False
-                return str(value).lower() in ('true', '1', 't', 'y', 'yes')
-                
-            review['steam_purchase'] = convert_text_to_bool(review.get('steam_purchase'))
-            review['received_for_free'] = convert_text_to_bool(review.get('received_for_free'))
-            review['written_during_early_access'] = convert_text_to_bool(review.get('written_during_early_access'))
-
-        # If keyword provided, calculate relevancy scores and sort ALL reviews
-        if keyword and all_reviews:
-            print(f"Debug: Calculating relevance scores using {scoring_method} for keyword: '{keyword}'")
-            all_reviews = search_service.search_reviews(keyword, all_reviews, scoring_method)
-            print(f"Debug: After global sorting, first review score: {all_reviews[0]['relevance'] if all_reviews else 0.0}")
-        
-        # Apply pagination to the globally sorted results
-        paginated_reviews = all_reviews[start_idx:end_idx]
-        print(f"Debug: Returning page {page} ({len(paginated_reviews)} reviews)")
-        
-        return paginated_reviews
+        if not keyword:
+            # No ranking needed, let SQLite paginate
+            reviews, _ = fetch_browse_page(cur, conditions, params, per_page, offset=start_idx, sort=sort)
+            logger.debug("Returning page %d (%d reviews)", page, len(reviews))
+            return reviews
+
+        ranked = get_ranked_results(
+            cur, keyword, filter_option, scoring_method, game_id, date_from, date_to,
+            min_playtime, min_funny, received_free, early_access, min_polarity, sort
+        )
+        reviews = fetch_ranked_page(cur, ranked, start_idx, per_page, scoring_method)
+        logger.debug("Returning page %d (%d reviews)", page, len(reviews))
+        return reviews
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
@@ -156,67 +480,116 @@ def cached_get_reviews(page: int = 1, per_page: int = 20, keyword: str = "",
         return []
     finally:
         cur.close()
-        con.close()
+
+# Same interface as functools.lru_cache, used by the /clear-cache route
+cached_get_reviews.cache_clear = clear_search_caches
+cached_get_reviews.cache_info = result_cache.stats
+
+class ReviewsPage(NamedTuple):
+    reviews: List[Dict[str, Any]]
+    next_cursor: Optional[str]
+    total: int
+    total_is_estimate: bool
+
+def get_reviews_page(page: int = 1, per_page: int = 20, cursor: str = None, keyword: str = "",
+                     filter_option: str = "all", scoring_method: str = "tfidf",
+                     game_id: str = "", date_from: str = None, date_to: str = None,
+                     min_playtime: int = None, min_funny: int = None,
+                     received_free: bool = None, early_access: bool = None,
+                     min_polarity: float = None, sort: str = None,
+                     count_limit: int = None) -> ReviewsPage:
+    """
+    Returns one page of results together with the total number of matches,
+    using a single connection and a single pass over the matching reviews.
+
+    Ranked (keyword) searches page through the cached ranked id list, whose
+    length is the total; their cursor is the next page number. Without a
+    keyword the page is read with keyset pagination on (timestamp_created, id),
+    or (polarity, id) with sort='polarity',
+    so following next_cursor costs the same on every page, and the total comes
+    from a cached count (capped at count_limit when given, see
+    count_filtered_reviews).
+    """
+    position = decode_cursor(cursor)
+
+    cur = get_read_connection(DATABASE).cursor()
+    cur.row_factory = sqlite3.Row
+    try:
+        if keyword:
+            if position and isinstance(position.get('page'), int):
+                page = position['page']
+            start_idx = (page - 1) * per_page
+            ranked = get_ranked_results(
+                cur, keyword, filter_option, scoring_method, game_id, date_from, date_to,
+                min_playtime, min_funny, received_free, early_access, min_polarity, sort
+            )
+            reviews = fetch_ranked_page(cur, ranked, start_idx, per_page, scoring_method)
+            total = len(ranked)
+            next_cursor = encode_cursor({'page': page + 1}) if start_idx + per_page < total else None
+            return ReviewsPage(reviews, next_cursor, total, False)
+
+        conditions, params = build_query_conditions(
+            "", filter_option, game_id, date_from, date_to,
+            min_playtime, min_funny, received_free, early_access, min_polarity, sort
+        )
+        after = position if position and 'id' in position else None
+        reviews, next_cursor = fetch_browse_page(cur, conditions, params, per_page,
+                                                 offset=(page - 1) * per_page, after=after, sort=sort)
+        # Counts do not depend on the scoring method
+        cache_key = normalize_search_key(
+            "", filter_option, "", game_id, date_from, date_to,
+            min_playtime, min_funny, received_free, early_access, min_polarity, sort
+        )
+        total, total_is_estimate = count_filtered_reviews(cur, cache_key, conditions, params, count_limit)
+        return ReviewsPage(reviews, next_cursor, total, total_is_estimate)
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        traceback.print_exc()
+        return ReviewsPage([], None, 0, False)
+    finally:
+        cur.close()
 
 def get_total_reviews_count(keyword: str = "", filter_option: str = "all", 
                           game_id: str = "", date_from: str = None, 
                           date_to: str = None, min_playtime: int = None,
                           min_funny: int = None, received_free: bool = None,
-                          early_access: bool = None) -> int:
+                          early_access: bool = None, scoring_method: str = "tfidf",
+                          min_polarity: float = None, sort: str = None) -> int:
     """
     Zwraca całkowitą liczbę recenzji spełniających wszystkie warunki filtrowania.
+    Served from the same caches as the result pages, so after a page has been
+    loaded this does not query the matching reviews again.
     """
-    # Build query conditions
-    conditions, params = build_query_conditions(
-        keyword, filter_option, game_id, date_from, date_to,
-        min_playtime, min_funny, received_free, early_access
-    )
-
-    query = f"""
-        SELECT COUNT(*)
-        FROM reviews r
-        LEFT JOIN authors a ON r.author_id = a.author_id
-        LEFT JOIN games g ON r.app_id = g.app_id
-        WHERE {conditions}
-    """
-    
-    con = sqlite3.connect(DATABASE)
-    cur = con.cursor()
-    
+    cur = get_read_connection(DATABASE).cursor()
     try:
-        cur.execute(query, params)
-        return cur.fetchone()[0]
+        if keyword:
+            ranked = get_ranked_results(
+                cur, keyword, filter_option, scoring_method, game_id, date_from, date_to,
+                min_playtime, min_funny, received_free, early_access, min_polarity, sort
+            )
+            return len(ranked)
+
+        conditions, params = build_query_conditions(
+            "", filter_option, game_id, date_from, date_to,
+            min_playtime, min_funny, received_free, early_access, min_polarity, sort
+        )
+        # Counts do not depend on the scoring method
+        cache_key = normalize_search_key(
+            "", filter_option, "", game_id, date_from, date_to,
+            min_playtime, min_funny, received_free, early_access, min_polarity, sort
+        )
+        return count_filtered_reviews(cur, cache_key, conditions, params)[0]
     finally:
         cur.close()
-        con.close()
 
 def get_review_by_id(review_id: int) -> Dict[str, Any]:
     """
     Pobiera szczegółowe informacje o recenzji na podstawie jej ID.
     """
-    query = """
-        SELECT r.*, 
-               a.num_games_owned as games_owned,
-               a.num_reviews as total_reviews,
-               a.playtime_forever,
-               a.playtime_last_two_weeks,
-               a.playtime_at_review,
-               g.name as game_name,
-               g.developer as game_developer,
-               g.publisher as game_publisher,
-               g.genre as game_genre,
-               g.tags as game_tags,
-               g.languages as game_languages,
-               g.owners as game_owners
-        FROM reviews r
-        LEFT JOIN authors a ON r.author_id = a.author_id
-        LEFT JOIN games g ON r.app_id = g.app_id
-        WHERE r.id = ?
-    """
+    query = f"{REVIEW_SELECT} WHERE r.id = ?"
     
-    con = sqlite3.connect(DATABASE)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
+    cur = get_read_connection(DATABASE).cursor()
+    cur.row_factory = sqlite3.Row
     
     try:
         print(f"Executing query: {query}")
@@ -226,29 +599,10 @@ def get_review_by_id(review_id: int) -> Dict[str, Any]:
         if result is None:
             return None
             
-        review = dict(result)
-        review['timestamp_created'] = format_timestamp(review['timestamp_created'])
+        review = build_review_dict(result)
         
-        # Add text analysis
-        review['text_stats'] = text_analysis_service.analyze_text(review['content'])
-        
-        # Convert boolean fields
-        def convert_text_to_bool(value):
-            if value is None:
-                return False
-            return str(value).lower() in ('true', '1', 't', 'y', 'yes')
-            
-        review['steam_purchase'] = convert_text_to_bool(review.get('steam_purchase'))
-        review['received_for_free'] = convert_text_to_bool(review.get('received_for_free'))
-        review['written_during_early_access'] = convert_text_to_bool(review.get('written_during_early_access'))
-        
-        review['author'] = {
-            'games_owned': review.get('games_owned', 0),
-            'total_reviews': review.get('total_reviews', 0),
-            'playtime_forever': review.get('playtime_forever', 0),
-            'playtime_last_two_weeks': review.get('playtime_last_two_weeks', 0),
-            'playtime_at_review': review.get('playtime_at_review', 0)
-        }
+        # Add text analysis (precomputed by analyze_reviews.py when available)
+        review['text_stats'] = get_review_analysis(review['id'], review['content'])
         
         return review
         
@@ -258,7 +612,6 @@ def get_review_by_id(review_id: int) -> Dict[str, Any]:
         return None
     finally:
         cur.close()
-        con.close()
 
 def get_games_list():
     """
@@ -271,8 +624,7 @@ def get_games_list():
         ORDER BY name
     """
     
-    con = sqlite3.connect(DATABASE)
-    cur = con.cursor()
+    cur = get_read_connection(DATABASE).cursor()
     
     try:
         print(f"Executing query: {query}")
@@ -286,7 +638,6 @@ def get_games_list():
         return []
     finally:
         cur.close()
-        con.close()
 
 def calculate_relevance(query_text: str, reviews: List[Dict[str, Any]]) -> List[float]:
     """
@@ -323,9 +674,8 @@ def calculate_relevance(query_text: str, reviews: List[Dict[str, Any]]) -> List[
 # FUNKCJE DLA LLM'a w celu weryfikacji działania aplikacji
 def execute_query(query: str) -> List[Dict[str, Any]]:
     print(f"Connecting to database at: {DATABASE}")
-    con = sqlite3.connect(DATABASE)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
+    cur = get_read_connection(DATABASE).cursor()
+    cur.row_factory = sqlite3.Row
     
     try:
         print(f"Executing query: {query}")
@@ -339,11 +689,9 @@ def execute_query(query: str) -> List[Dict[str, Any]]:
         return []
     finally:
         cur.close()
-        con.close()
 
 def get_table_info():
-    con = sqlite3.connect(DATABASE)
-    cur = con.cursor()
+    cur = get_read_connection(DATABASE).cursor()
     try:
         print("Getting table schema...")
         cur.execute("SELECT * FROM reviews LIMIT 1")
@@ -356,7 +704,6 @@ def get_table_info():
         return []
     finally:
         cur.close()
-        con.close()
 
 def get_top_genres():
     query = """
@@ -368,7 +715,10 @@ def get_top_genres():
     ORDER BY review_count DESC
     LIMIT 10
     """
-    result = execute_query(query)
+    # Materialized counts (see aggregate_service); live query until they are built
+    result = get_top_counts('genre', 10)
+    if result is None:
+        result = execute_query(query)
     print("Top Genres Data:", result)
     return result
 
@@ -382,7 +732,10 @@ def get_top_publishers():
     ORDER BY review_count DESC
     LIMIT 10
     """
-    result = execute_query(query)
+    # Materialized counts (see aggregate_service); live query until they are built
+    result = get_top_counts('publisher', 10)
+    if result is None:
+        result = execute_query(query)
     print("Top Publishers Data:", result)
     return result
 
@@ -396,22 +749,23 @@ def get_top_developers():
     ORDER BY review_count DESC
     LIMIT 10
     """
-    result = execute_query(query)
+    # Materialized counts (see aggregate_service); live query until they are built
+    result = get_top_counts('developer', 10)
+    if result is None:
+        result = execute_query(query)
     print("Top Developers Data:", result)
     return result
 
 def get_unique_genres():
     """Get list of unique genres from the database."""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
+    cursor = get_read_connection(DATABASE).cursor()
     cursor.execute("SELECT DISTINCT genre FROM games WHERE genre IS NOT NULL ORDER BY genre")
     genres = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    cursor.close()
     return genres
 
 def test_query():
-    con = sqlite3.connect(DATABASE)
-    cur = con.cursor()
+    cur = get_read_connection(DATABASE).cursor()
     try:
         print("\nTesting simple query...")
         cur.execute("SELECT COUNT(*) FROM reviews")
@@ -429,9 +783,11 @@ def test_query():
         return 0
     finally:
         cur.close()
-        con.close()
 
 # Call test query
 test_query()
 
+if not schema_up_to_date(get_read_connection(DATABASE)):
+    print("Warning: database schema is out of date, run `python migrate.py upgrade`")
+
 get_table_info()
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from wordcloud import STOPWORDS
+
+from .connection_service import DATABASE, connect_readonly
+
+# Game titles and studio names recognized as entities, one "LABEL<TAB>phrase"
+# per line ('#' starts a comment). Written by `build_indexes.py lexicon` and
+# may be extended by hand.
+LEXICON_PATH = 'data/gaming_lexicon.tsv'
+
+# Built-in gaming vocabulary: platforms, gaming terms and genre abbreviations
+BUILTIN_TERMS = {
+    'GAMING_TERM': (
+        'steam', 'valve', 'epic games', 'gog', 'origin',
+        'dlc', 'expansion', 'patch', 'update',
+        'fps', 'rpg', 'mmo', 'rts', 'moba'
+    )
+}
+
+# Prices and version numbers, found anywhere in the text, including inside
+# words ("patchv1.2" has the version v1.2); lexicon phrases match whole words.
+PRICE_VERSION_PATTERN = re.compile(
+    r"\$\d+(?:\.\d{2})?|\d+(?:\.\d{2})?\$"
+    r"|v\d+\.\d+(?:\.\d+)?",
+    re.IGNORECASE
+)
+# Words matched against the lexicon trie
+WORD_PATTERN = re.compile(r"\w+")
+PATTERN_LABEL = 'GAMING_TERM'
+# Catalog labels. Many titles are ordinary words ("Inside", "Home"), so these
+# match only with the capitalization of the catalog, and single-word titles
+# that are stopwords or numbers ("It", "10") are not matched at all.
+CASE_SENSITIVE_LABELS = ('GAME', 'DEVELOPER')
+_END = object()  # trie key marking the end of a phrase
+
+_lexicon = None
+_lexicon_lock = threading.Lock()
+
+def phrase_words(phrase: str, case_sensitive: bool = False) -> Tuple[str, ...]:
+    """Words of a phrase (lowercased unless case_sensitive); punctuation between them is ignored when matching."""
+    words = WORD_PATTERN.findall(phrase)
+    return tuple(words) if case_sensitive else tuple(word.lower() for word in words)
+
+def is_common_word(words: Tuple[str, ...]) -> bool:
+    """Single stopword or number, too common in prose to be taken for a title."""
+    return len(words) == 1 and (words[0].lower() in STOPWORDS or words[0].isdigit())
+
+class GamingLexicon:
+    """
+    Matches gaming vocabulary, game titles and studio names in a text with
+    one regex scan and a word trie, so the cost does not grow with the
+    number of phrases. Matching is leftmost-longest; the gaming vocabulary
+    is matched case-insensitively, catalog titles and studio names
+    (CASE_SENSITIVE_LABELS) with their own capitalization.
+    """
+
+    def __init__(self, phrases: Iterable[Tuple[str, str]] = (), version: str = ''):
+        self.trie = {}  # lowercased words
+        self.cased_trie = {}  # words as written, for CASE_SENSITIVE_LABELS
+        self.size = 0
+        # Identifies the lexicon file the phrases came from (see load_lexicon)
+        self.version = version
+        for label, terms in BUILTIN_TERMS.items():
+            for term in terms:
+                self.add(label, term)
+        for label, phrase in phrases:
+            self.add(label, phrase)
+
+    def add(self, label: str, phrase: str):
+        case_sensitive = label in CASE_SENSITIVE_LABELS
+        words = phrase_words(phrase, case_sensitive)
+        if not words or (case_sensitive and is_common_word(words)):
+            return
+        node = self.cased_trie if case_sensitive else self.trie
+        for word in words:
+            node = node.setdefault(word, {})
+        if _END not in node:
+            self.size += 1
+        node[_END] = label
+
+    def find(self, text: str) -> List[Tuple[str, int, int]]:
+        """(label, start, end) of every match, in text order."""
+        text = text or ""
+        matches = [(PATTERN_LABEL, match.start(), match.end()) for match in PRICE_VERSION_PATTERN.finditer(text)]
+        # (start, end, lowercased word, word); words overlapping a price or version break phrases with None
+        words = []
+        k = 0
+        for match in WORD_PATTERN.finditer(text):
+            start, end = match.span()
+            while k < len(matches) and matches[k][2] <= start:
+                k += 1
+            if k < len(matches) and matches[k][1] < end:
+                words.append((start, end, None, None))
+            else:
+                words.append((start, end, match.group().lower(), match.group()))
+
+        i = 0
+        while i < len(words):
+            # Longest phrase of either trie; a catalog entry wins a tie
+            best = max(self._longest(self.cased_trie, words, i, 3), self._longest(self.trie, words, i, 2),
+                       key=lambda found: found[1])
+            label, j = best
+            if label is None:
+                i += 1
+                continue
+            matches.append((label, words[i][0], words[j - 1][1]))
+            i = j
+        matches.sort(key=lambda match: match[1])
+        return matches
+
+    @staticmethod
+    def _longest(trie: dict, words: list, i: int, key: int) -> Tuple[Optional[str], int]:
+        """(label, end word index) of the longest phrase of `trie` starting at word i, or (None, i)."""
+        node = trie
+        best = (None, i)
+        j = i
+        while j < len(words) and words[j][key] in node:
+            node = node[words[j][key]]
+            j += 1
+            if _END in node:
+                best = (node[_END], j)
+        return best
+
+def iter_lexicon_file(path: str) -> Iterator[Tuple[str, str]]:
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            label, _, phrase = line.partition('\t')
+            if phrase:
+                yield label.strip().upper(), phrase.strip()
+
+def load_lexicon(path: Optional[str] = LEXICON_PATH) -> GamingLexicon:
+    """
+    Built-in vocabulary plus the phrases of the lexicon file, if it exists.
+    The lexicon's version is a hash of the file's contents.
+    """
+    if not path or not os.path.exists(path):
+        return GamingLexicon()
+    with open(path, 'rb') as f:
+        version = hashlib.sha1(f.read()).hexdigest()
+    return GamingLexicon(iter_lexicon_file(path), version)
+
+def get_gaming_lexicon() -> GamingLexicon:
+    """Shared lexicon, loaded on first use (once per process)"""
+    global _lexicon
+    if _lexicon is None:
+        with _lexicon_lock:
+            if _lexicon is None:
+                _lexicon = load_lexicon()
+    return _lexicon
+
+def export_catalog_lexicon(database: str = DATABASE, path: str = LEXICON_PATH) -> Dict[str, int]:
+    """
+    Writes the game names (GAME) and developers/publishers (DEVELOPER) of the
+    games table to the lexicon file, keeping lines with other labels that
+    were added by hand. Returns the number of phrases per label.
+    """
+    generated = ('GAME', 'DEVELOPER')
+    kept = [entry for entry in iter_lexicon_file(path) if entry[0] not in generated] if os.path.exists(path) else []
+
+    con = connect_readonly(database)
+    try:
+        entries = {}
+        for label, query in (
+            ('GAME', "SELECT name FROM games"),
+            ('DEVELOPER', "SELECT developer FROM games UNION SELECT publisher FROM games")
+        ):
+            for (phrase,) in con.execute(query):
+                if phrase and phrase.strip():
+                    entries.setdefault(phrase.strip(), label)
+    finally:
+        con.close()
+
+    lines = kept + sorted((label, phrase) for phrase, label in entries.items())
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("# LABEL<TAB>phrase; GAME and DEVELOPER lines are regenerated from the games table\n")
+        for label, phrase in lines:
+            f.write(f"{label}\t{phrase}\n")
+    os.replace(tmp_path, path)
+    return dict(Counter(label for label, _ in lines))
@@ -0,0 +1,181 @@
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .connection_service import DATABASE, connect_readonly
+
+MODEL_DIR = 'data/search_models'
+
+def save_array(path: str, array: np.ndarray):
+    """
+    np.save through a temporary file and an atomic rename, so processes that
+    have the previous file memory-mapped keep reading the old version.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+def delta_path(model_dir: str, name: str) -> str:
+    """File of an index's delta segment: the rows added or replaced since the base was written."""
+    return os.path.join(model_dir, f"{name}_delta.npz")
+
+def save_delta(path: str, **arrays: np.ndarray):
+    """Writes a delta segment as one .npz file, replaced atomically like save_array."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+def load_delta(path: str, base_path: str) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Arrays of a delta segment, or None when there is none. A delta older than
+    its base (written by a rebuild or compaction) is already part of the base
+    and is ignored.
+    """
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(base_path):
+        return None
+    with np.load(path) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+def remove_delta(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+def files_signature(paths: Iterable[str]) -> Tuple:
+    """(path, mtime, size) of the existing files, to notice when an index was rewritten."""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def check_rows(name: str, expected: int, *counts: int):
+    """
+    Raises ValueError when arrays loaded for an index disagree on their
+    lengths, e.g. because the index was being rewritten while it was read.
+    """
+    if any(count != expected for count in counts):
+        raise ValueError(f"{name} index files are inconsistent (being rewritten?)")
+
+def score_with_delta(index, query: str, review_ids: Sequence[int], texts: Sequence[str] = None) -> np.ndarray:
+    """
+    Scores reviews with an index's delta segment where it holds them (newer
+    rows replace base rows) and with the base segment otherwise.
+    """
+    delta = index.delta
+    if delta is None or not len(delta.review_ids):
+        return index.score_segment(query, review_ids, texts)
+    ids = np.asarray(review_ids, dtype=np.int64)
+    _, in_delta = delta.lookup_rows(ids)
+    scores = np.zeros(len(ids), dtype=np.float32)
+    for mask, segment in ((in_delta, delta), (~in_delta, index)):
+        positions = np.flatnonzero(mask)
+        if len(positions):
+            segment_texts = [texts[i] for i in positions] if texts is not None else None
+            scores[positions] = segment.score_segment(query, ids[positions], segment_texts)
+    return scores
+
+def merge_review_ids(old_ids: np.ndarray, new_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Merges sorted unique new_ids into the sorted row ids of an index.
+    Rows are laid out as old rows that are kept, followed by the new rows,
+    then permuted by `order` into id order. Returns (keep, order, merged_ids),
+    where keep masks the old rows not replaced by a new one.
+    """
+    keep = np.ones(len(old_ids), dtype=bool)
+    if len(old_ids) and len(new_ids):
+        rows = np.minimum(np.searchsorted(old_ids, new_ids), len(old_ids) - 1)
+        replaced = old_ids[rows] == new_ids
+        keep[rows[replaced]] = False
+    ids = np.concatenate([np.asarray(old_ids)[keep], new_ids]).astype(np.int64)
+    order = np.argsort(ids, kind='stable')
+    return keep, order, ids[order]
+
+def iter_texts_by_id(review_ids: np.ndarray, database: str = DATABASE, batch_size: int = 10000) -> Iterator[str]:
+    """Review texts in review_ids order (empty for missing reviews), read in batches."""
+    con = connect_readonly(database)
+    try:
+        for start in range(0, len(review_ids), batch_size):
+            batch = review_ids[start:start + batch_size].tolist()
+            rows = dict(con.execute(
+                "SELECT id, content FROM reviews WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(batch),)
+            ).fetchall())
+            for review_id in batch:
+                yield rows.get(review_id) or ""
+    finally:
+        con.close()
+
+def update_search_indexes(review_ids, database: str = DATABASE, model_dir: str = MODEL_DIR,
+                          batch_size: int = 10000) -> List[str]:
+    """
+    Brings every built search index up to date for the given (new or changed)
+    reviews: only their texts are vectorized/tokenized with the existing
+    models, and they are merged into each index's delta segment, which the
+    search merges with the base at query time. The base files (and the ANN
+    lists over the Word2Vec base) are not rewritten; compact_search_indexes
+    folds the deltas in. Vocabularies, IDF weights and k-means centroids stay
+    as trained; rebuild with build_indexes.py to refit them. Returns the names
+    of the updated indexes.
+    """
+    from .jaccard_index_service import TokenSetIndex
+    from .tfidf_index_service import TfidfIndex
+    from .word2vec_index_service import Word2VecIndex
+
+    review_ids = np.unique(np.asarray(review_ids, dtype=np.int64))
+    updated = []
+    if not len(review_ids):
+        return updated
+
+    tfidf_index = TfidfIndex.load(model_dir)
+    if tfidf_index is not None:
+        tfidf_index.update(review_ids, iter_texts_by_id(review_ids, database, batch_size), batch_size).save_delta(model_dir)
+        updated.append('tfidf')
+
+    jaccard_index = TokenSetIndex.load(model_dir)
+    if jaccard_index is not None:
+        jaccard_index.update(review_ids, iter_texts_by_id(review_ids, database, batch_size)).save_delta(model_dir)
+        updated.append('jaccard')
+
+    word2vec_index = Word2VecIndex.load(model_dir)
+    if word2vec_index is not None:
+        word2vec_index.update(review_ids, iter_texts_by_id(review_ids, database, batch_size), batch_size).save_delta(model_dir)
+        updated.append('word2vec')
+    return updated
+
+def compact_search_indexes(model_dir: str = MODEL_DIR) -> List[str]:
+    """
+    Merges the delta segment of every built search index into its base and
+    rewrites the base files; the ANN lists get the merged rows assigned to
+    their existing centroids. Reads whole indexes, so run it offline (e.g.
+    nightly). Returns the names of the compacted indexes.
+    """
+    from .ann_index_service import IVFIndex
+    from .jaccard_index_service import TokenSetIndex
+    from .tfidf_index_service import TfidfIndex
+    from .word2vec_index_service import Word2VecIndex
+
+    compacted = []
+    for name, index_class in (('tfidf', TfidfIndex), ('jaccard', TokenSetIndex)):
+        index = index_class.load(model_dir)
+        if index is not None and index.delta is not None:
+            index.compact().save(model_dir)
+            compacted.append(name)
+
+    word2vec_index = Word2VecIndex.load(model_dir)
+    if word2vec_index is not None and word2vec_index.delta is not None:
+        ann_index = IVFIndex.load(model_dir)
+        keep, order, _ = merge_review_ids(word2vec_index.review_ids, word2vec_index.delta.review_ids)
+        new_index = word2vec_index.compact()
+        new_index.save(model_dir, save_model=False)
+        compacted.append('word2vec')
+        if ann_index is not None and ann_index.n_vectors == len(word2vec_index.vectors):
+            ann_index.update(new_index.vectors, keep, order).save(model_dir)
+            compacted.append('ann')
+    return compacted
@@ -0,0 +1,350 @@
+import csv
+import gzip
+import json
+import sqlite3
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .aggregate_service import apply_review_changes, fetch_review_keys
+from .connection_service import DATABASE, connect_writable
+
+# Typed representation of review fields that source dumps deliver as text
+TRUE_VALUES = ('true', '1', 't', 'y', 'yes')
+POSITIVE_LABELS = ('pozytywna', 'positive', 'recommended')
+NEGATIVE_LABELS = ('negatywna', 'negative', 'not recommended')
+
+def parse_bool(value) -> Optional[int]:
+    """'True'/'False'-style text (or a bool) as INTEGER 0/1; empty values stay NULL."""
+    if value is None or value == '':
+        return None
+    return 1 if str(value).strip().lower() in TRUE_VALUES else 0
+
+def parse_sentiment(value) -> Optional[int]:
+    """Review verdict ('Pozytywna'/'Negatywna', 'Positive'/'Negative' or a boolean) as 1/0."""
+    if value is None or value == '':
+        return None
+    label = str(value).strip().lower()
+    if label in POSITIVE_LABELS:
+        return 1
+    if label in NEGATIVE_LABELS:
+        return 0
+    return parse_bool(value)
+
+def parse_int(value) -> Optional[int]:
+    """Integer from a number or numeric text; anything else gives None."""
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError, OverflowError):
+            return None
+
+def parse_timestamp(value) -> Optional[int]:
+    """
+    Unix epoch seconds from an epoch number or an ISO date/datetime string.
+    Naive dates are UTC and a bare date means its midnight, as with SQLite's
+    strftime('%s', ...). Unparseable values give None.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip()
+    try:
+        return int(float(text))
+    except (ValueError, OverflowError):
+        pass
+    try:
+        moment = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+# reviews columns stored as INTEGER, with the parser for their source values
+REVIEW_COLUMN_PARSERS = {
+    'is_positive': parse_sentiment,
+    'timestamp_created': parse_timestamp,
+    'received_for_free': parse_bool,
+    'written_during_early_access': parse_bool,
+    'steam_purchase': parse_bool
+}
+
+def normalize_review_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Converts the typed columns of a source review record; other fields are kept as they are."""
+    normalized = dict(row)
+    for column, parser in REVIEW_COLUMN_PARSERS.items():
+        if column in normalized:
+            normalized[column] = parser(normalized[column])
+    return normalized
+
+# Fresh databases get these tables; existing ones keep their schema (see migration_service)
+CREATE_TABLES = (
+    """
+    CREATE TABLE IF NOT EXISTS reviews (
+        id INTEGER PRIMARY KEY,
+        app_id INTEGER,
+        author_id INTEGER,
+        language TEXT,
+        content TEXT,
+        is_positive INTEGER,
+        timestamp_created INTEGER,
+        votes_helpful INTEGER,
+        votes_funny INTEGER,
+        steam_purchase INTEGER,
+        received_for_free INTEGER,
+        written_during_early_access INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS authors (
+        author_id INTEGER PRIMARY KEY,
+        num_games_owned INTEGER,
+        num_reviews INTEGER,
+        playtime_forever INTEGER,
+        playtime_last_two_weeks INTEGER,
+        playtime_at_review INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS games (
+        app_id INTEGER PRIMARY KEY,
+        name TEXT,
+        developer TEXT,
+        publisher TEXT,
+        genre TEXT,
+        tags TEXT,
+        languages TEXT,
+        owners TEXT
+    )
+    """
+)
+
+# Field names of the Steam review dumps that differ from our column names.
+# Nested JSON objects are flattened to dotted names first ("author.steamid").
+FIELD_ALIASES = {
+    'review_id': 'id',
+    'recommendationid': 'id',
+    'review': 'content',
+    'recommended': 'is_positive',
+    'voted_up': 'is_positive',
+    'app_name': 'name',
+    'author.steamid': 'author_id',
+    'author.num_games_owned': 'num_games_owned',
+    'author.num_reviews': 'num_reviews',
+    'author.playtime_forever': 'playtime_forever',
+    'author.playtime_last_two_weeks': 'playtime_last_two_weeks',
+    'author.playtime_at_review': 'playtime_at_review'
+}
+
+CHUNK_SIZE = 50000
+
+class IngestResult(NamedTuple):
+    records: int
+    reviews: int
+    duplicates: int
+    skipped: int
+    review_ids: np.ndarray
+
+def flatten_record(record: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            flat.update(flatten_record(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Streams records from a CSV (with header) or JSON Lines dump, optionally
+    gzip-compressed, with field names mapped to column names. Empty values
+    become None.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    name = path[:-3] if path.endswith('.gz') else path
+    with opener(path, 'rt', encoding='utf-8', newline='') as f:
+        if name.endswith(('.jsonl', '.ndjson', '.json')):
+            records = (flatten_record(json.loads(line)) for line in f if line.strip())
+        else:
+            csv.field_size_limit(2**31 - 1)  # review texts can exceed the 128 KB default
+            records = csv.DictReader(f)
+        for record in records:
+            yield {
+                FIELD_ALIASES.get(key, key): (None if value == '' else value)
+                for key, value in record.items()
+            }
+
+def table_columns(con: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in con.execute(f"PRAGMA table_info({table})").fetchall()]
+
+class TableWriters:
+    """
+    Batched upsert statements for the three tables. Each record only writes
+    the columns it has a field for, so fields missing from a record (e.g. in
+    JSON Lines dumps whose records differ) never overwrite stored values.
+    Statements are built once per combination of columns.
+    """
+
+    def __init__(self, con: sqlite3.Connection):
+        self.review_columns = table_columns(con, 'reviews')
+        self.author_columns = table_columns(con, 'authors')
+        self.game_columns = table_columns(con, 'games')
+        if 'id' not in self.review_columns:
+            raise ValueError("reviews table has no id column")
+        self._statements = {}
+
+    def review_sql(self, columns: Tuple[str, ...]) -> str:
+        # Reviews are upserted on their id; ON CONFLICT ... DO UPDATE (unlike
+        # INSERT OR REPLACE) fires the FTS update trigger
+        updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != 'id')
+        return (
+            f"INSERT INTO reviews ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))}) "
+            + (f"ON CONFLICT(id) DO UPDATE SET {updates}" if updates else "ON CONFLICT(id) DO NOTHING")
+        )
+
+    def author_sql(self, columns: Tuple[str, ...]) -> List[str]:
+        # authors/games need not have a unique key, so update-then-insert-missing
+        fields = [c for c in columns if c != 'author_id']
+        statements = []
+        if fields:
+            statements.append(f"UPDATE authors SET {', '.join(f'{c} = ?' for c in fields)} WHERE author_id = ?")
+        statements.append(
+            f"INSERT INTO authors (author_id{''.join(f', {c}' for c in fields)}) "
+            f"SELECT {', '.join('?' * (len(fields) + 1))} "
+            f"WHERE NOT EXISTS (SELECT 1 FROM authors WHERE author_id = ?)"
+        )
+        return statements
+
+    def game_sql(self, columns: Tuple[str, ...]) -> str:
+        # Review dumps only name the game; existing game metadata is left alone
+        fields = [c for c in columns if c != 'app_id']
+        return (
+            f"INSERT INTO games (app_id{''.join(f', {c}' for c in fields)}) "
+            f"SELECT {', '.join('?' * (len(fields) + 1))} "
+            f"WHERE NOT EXISTS (SELECT 1 FROM games WHERE app_id = ?)"
+        )
+
+    def _statement(self, kind: str, columns: Tuple[str, ...]):
+        key = (kind, columns)
+        if key not in self._statements:
+            self._statements[key] = getattr(self, f"{kind}_sql")(columns)
+        return self._statements[key]
+
+    @staticmethod
+    def group_rows(rows: Iterable[Dict[str, Any]], columns: List[str]) -> Dict[Tuple[str, ...], List[Dict[str, Any]]]:
+        """Rows grouped by the tuple of table columns they have fields for, in table order."""
+        groups = {}
+        for row in rows:
+            present = tuple(c for c in columns if c in row)
+            groups.setdefault(present, []).append(row)
+        return groups
+
+    def write(self, con: sqlite3.Connection, records: List[Dict[str, Any]]):
+        """Upserts one chunk of (deduplicated) records, inside the caller's transaction."""
+        # Fields of the same author or game from several records are merged, later records winning
+        authors, games = {}, {}
+        for record in records:
+            if record.get('author_id') is not None:
+                authors.setdefault(record['author_id'], {}).update(
+                    (c, record[c]) for c in self.author_columns if c in record
+                )
+            if record.get('app_id') is not None:
+                games.setdefault(record['app_id'], {}).update(
+                    (c, record[c]) for c in self.game_columns if c in record
+                )
+
+        if 'app_id' in self.game_columns:
+            for columns, rows in self.group_rows(games.values(), self.game_columns).items():
+                fields = [c for c in columns if c != 'app_id']
+                con.executemany(self._statement('game', columns), (
+                    [row['app_id']] + [row[c] for c in fields] + [row['app_id']] for row in rows
+                ))
+        if 'author_id' in self.author_columns:
+            for columns, rows in self.group_rows(authors.values(), self.author_columns).items():
+                fields = [c for c in columns if c != 'author_id']
+                statements = self._statement('author', columns)
+                if fields:
+                    con.executemany(statements[0], (
+                        [row[c] for c in fields] + [row['author_id']] for row in rows
+                    ))
+                con.executemany(statements[-1], (
+                    [row['author_id']] + [row[c] for c in fields] + [row['author_id']] for row in rows
+                ))
+        for columns, rows in self.group_rows(records, self.review_columns).items():
+            con.executemany(self._statement('review', columns), (
+                [row[c] for c in columns] for row in rows
+            ))
+
+def write_chunk(con: sqlite3.Connection, writers: TableWriters, chunk: Dict[int, Dict[str, Any]]):
+    """Writes one chunk and updates the review aggregates for it in a single transaction."""
+    review_ids = list(chunk)
+    with con:
+        before = fetch_review_keys(con, review_ids)
+        writers.write(con, list(chunk.values()))
+        apply_review_changes(con, before, fetch_review_keys(con, review_ids))
+
+def ingest_files(paths: Sequence[str], database: str = DATABASE, chunk_size: int = CHUNK_SIZE) -> IngestResult:
+    """
+    Streams review dumps into the database chunk by chunk, so memory is
+    bounded by chunk_size. Each chunk is deduplicated on review id (the last
+    record wins) and upserted into reviews, authors and games in one
+    transaction, together with the matching changes to the review aggregates. Returns counts and the ids of the ingested reviews, whose
+    derived artefacts need updating (see update_search_indexes).
+    """
+    from .migration_service import analyze_database, run_migrations
+
+    con = connect_writable(database)
+    # WAL keeps the database consistent with NORMAL; a crash loses at most the last chunk
+    con.execute("PRAGMA synchronous = NORMAL")
+    records_read = duplicates = skipped = 0
+    review_ids = array('q')
+    try:
+        with con:
+            for statement in CREATE_TABLES:
+                con.execute(statement)
+        # Ingest writes typed columns, so the schema must be current
+        run_migrations(database, analyze=False)
+
+        writers = TableWriters(con)
+        for path in paths:
+            print(f"Ingesting {path}...")
+            chunk = {}
+            for record in iter_records(path):
+                records_read += 1
+                review_id = parse_int(record.get('id'))
+                if review_id is None:
+                    skipped += 1
+                    continue
+                record['id'] = review_id
+                if review_id in chunk:
+                    duplicates += 1
+                # Later records win field by field, as the upsert does across chunks
+                chunk.setdefault(review_id, {}).update(normalize_review_row(record))
+                if len(chunk) >= chunk_size:
+                    write_chunk(con, writers, chunk)
+                    review_ids.extend(chunk)
+                    print(f"  {len(review_ids)} reviews written")
+                    chunk = {}
+            if chunk:
+                write_chunk(con, writers, chunk)
+                review_ids.extend(chunk)
+
+        # Sampled statistics are enough after an incremental load
+        con.execute("PRAGMA analysis_limit = 1000")
+        analyze_database(con)
+    finally:
+        con.close()
+
+    ids = np.frombuffer(review_ids, dtype=np.int64) if len(review_ids) else np.empty(0, dtype=np.int64)
+    unique_ids = np.unique(ids)
+    duplicates += len(ids) - len(unique_ids)
+    return IngestResult(records_read, len(unique_ids), duplicates, skipped, unique_ids)
@@ -0,0 +1,316 @@
+import os
+import re
+import zlib
+from array import array
+from collections import defaultdict
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .connection_service import DATABASE, connect_readonly, connect_writable
+from .index_update_service import (
+    check_rows, delta_path, files_signature, load_delta, merge_review_ids, remove_delta,
+    save_array, save_delta, score_with_delta
+)
+
+MODEL_DIR = 'data/search_models'
+DUPLICATES_TABLE = 'review_duplicates'
+
+# Mersenne prime for the MinHash hash family h(x) = (a * x + b) mod p
+MINHASH_PRIME = (1 << 31) - 1
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# Token ids are hashes of the tokens, so there is no vocabulary to store,
+# load into every process or grow with each new review. 30 bits keep the ids
+# below MINHASH_PRIME; collisions only merge a few rare tokens.
+TOKEN_ID_MASK = (1 << 30) - 1
+
+def tokenize(text: str) -> Set[str]:
+    """Lowercased word set used by Jaccard scoring; punctuation is not part of words."""
+    return set(TOKEN_PATTERN.findall((text or "").lower()))
+
+def token_id(token: str) -> int:
+    return zlib.crc32(token.encode('utf-8')) & TOKEN_ID_MASK
+
+def token_ids(text: str) -> Set[int]:
+    """Hashed word set of a text, as stored in the index."""
+    return {token_id(token) for token in tokenize(text)}
+
+def jaccard(set1: Set, set2: Set) -> float:
+    union = len(set1 | set2)
+    return len(set1 & set2) / union if union else 0.0
+
+def append_token_sets(texts: Iterable[str], indices: array, indptr: array):
+    """Appends the sorted token ids of each text as CSR rows."""
+    for text in texts:
+        indices.extend(sorted(token_ids(text)))
+        indptr.append(len(indices))
+
+def gather_positions(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Positions of the CSR ranges starts[i] .. starts[i] + lengths[i] - 1, concatenated."""
+    total = int(lengths.sum())
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return offsets + np.arange(total, dtype=np.int64)
+
+def merge_token_rows(indptr: np.ndarray, indices: np.ndarray, review_ids: np.ndarray, new_indptr: np.ndarray,
+                     new_indices: np.ndarray, new_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Rows of new_ids replace or extend those of review_ids; returns (indptr, indices, ids) in id order."""
+    keep, order, merged_ids = merge_review_ids(review_ids, new_ids)
+    lengths = np.concatenate([np.diff(indptr)[keep], np.diff(new_indptr)])[order]
+    starts = np.concatenate([indptr[:-1][keep], new_indptr[:-1] + len(indices)])[order]
+    tokens = np.concatenate([np.asarray(indices), new_indices])
+    merged_indptr = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=merged_indptr[1:])
+    return merged_indptr, tokens[gather_positions(starts, lengths)].astype(np.int32), merged_ids
+
+class TokenSetIndex:
+    """
+    Binary review x token matrix in CSR form: row i holds the sorted token ids
+    of review_ids[i] (review_ids is sorted). The data array is implicit (all
+    ones), so only indptr and indices are stored.
+
+    The memory-mapped base is only written by build and compact. Reviews
+    added or changed later go to a small delta segment (a TokenSetIndex of
+    its own) whose rows take precedence over the base rows.
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, review_ids: np.ndarray,
+                 delta: Optional['TokenSetIndex'] = None):
+        self.indptr = indptr
+        self.indices = indices
+        self.review_ids = review_ids
+        self.delta = delta
+        self.set_sizes = np.diff(indptr).astype(np.float32)
+
+    @classmethod
+    def build(cls, database: str = DATABASE, batch_size: int = 10000) -> 'TokenSetIndex':
+        """Tokenizes every review once, in a single streaming pass."""
+        indices = array('i')
+        indptr = array('q', [0])
+        ids = array('q')
+
+        con = connect_readonly(database)
+        cur = con.cursor()
+        try:
+            cur.execute("SELECT id, content FROM reviews ORDER BY id")
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                append_token_sets((content for _, content in rows), indices, indptr)
+                ids.extend(review_id for review_id, _ in rows)
+        finally:
+            cur.close()
+            con.close()
+
+        return cls(
+            np.frombuffer(indptr, dtype=np.int64).copy(),
+            np.frombuffer(indices, dtype=np.int32).copy(),
+            np.frombuffer(ids, dtype=np.int64).copy()
+        )
+
+    @staticmethod
+    def signature(model_dir: str = MODEL_DIR) -> tuple:
+        """Changes whenever the saved index (base or delta) is rewritten."""
+        return files_signature(os.path.join(model_dir, name) for name in (
+            'jaccard_indptr.npy', 'jaccard_tokens.npy', 'jaccard_ids.npy', 'jaccard_delta.npz'
+        ))
+
+    def save(self, model_dir: str = MODEL_DIR):
+        """Writes the base arrays, then drops the delta segment. Call on a built or compacted index."""
+        if self.delta is not None:
+            raise ValueError("Compact the index before saving its base")
+        os.makedirs(model_dir, exist_ok=True)
+        save_array(os.path.join(model_dir, 'jaccard_indptr.npy'), self.indptr)
+        save_array(os.path.join(model_dir, 'jaccard_tokens.npy'), self.indices)
+        save_array(os.path.join(model_dir, 'jaccard_ids.npy'), self.review_ids)
+        remove_delta(delta_path(model_dir, 'jaccard'))
+
+    def save_delta(self, model_dir: str = MODEL_DIR):
+        """Writes only the delta segment; the base files are left untouched."""
+        save_delta(delta_path(model_dir, 'jaccard'), indptr=self.delta.indptr,
+                   tokens=self.delta.indices, ids=self.delta.review_ids)
+
+    @classmethod
+    def load(cls, model_dir: str = MODEL_DIR, mmap: bool = True) -> Optional['TokenSetIndex']:
+        """Loads a saved index, memory-mapping the token ids. Returns None if it was never built."""
+        tokens_path = os.path.join(model_dir, 'jaccard_tokens.npy')
+        if not os.path.exists(tokens_path):
+            if os.path.exists(os.path.join(model_dir, 'jaccard_vocabulary.pkl')):
+                print("Warning: Jaccard index uses the old vocabulary format, ignoring it. "
+                      "Run `python build_indexes.py jaccard` to rebuild it.")
+            return None
+
+        mmap_mode = 'r' if mmap else None
+        indptr = np.load(os.path.join(model_dir, 'jaccard_indptr.npy'))
+        indices = np.load(tokens_path, mmap_mode=mmap_mode)
+        ids_path = os.path.join(model_dir, 'jaccard_ids.npy')
+        review_ids = np.load(ids_path)
+        check_rows('Jaccard', len(review_ids), len(indptr) - 1)
+        check_rows('Jaccard', len(indices), int(indptr[-1]))
+
+        delta = None
+        arrays = load_delta(delta_path(model_dir, 'jaccard'), ids_path)
+        if arrays is not None:
+            check_rows('Jaccard delta', len(arrays['ids']), len(arrays['indptr']) - 1)
+            delta = cls(arrays['indptr'], arrays['tokens'], arrays['ids'])
+        return cls(indptr, indices, review_ids, delta)
+
+    def update(self, review_ids: np.ndarray, texts: Iterable[str]) -> 'TokenSetIndex':
+        """
+        Index with the rows of the given sorted, unique review ids replaced or
+        added in the delta segment. Only these texts (in review_ids order) are
+        tokenized and only the delta is merged, so the cost does not depend on
+        the corpus size.
+        """
+        indices = array('i')
+        indptr = array('q', [0])
+        append_token_sets(texts, indices, indptr)
+        new_indptr = np.frombuffer(indptr, dtype=np.int64).copy()
+        new_indices = np.frombuffer(indices, dtype=np.int32).copy()
+        review_ids = np.asarray(review_ids, dtype=np.int64)
+
+        if self.delta is None:
+            delta = TokenSetIndex(new_indptr, new_indices, review_ids)
+        else:
+            delta = TokenSetIndex(*merge_token_rows(self.delta.indptr, self.delta.indices, self.delta.review_ids,
+                                                    new_indptr, new_indices, review_ids))
+        return TokenSetIndex(self.indptr, self.indices, self.review_ids, delta)
+
+    def compact(self) -> 'TokenSetIndex':
+        """Index with the delta segment merged into the base (reads the whole base)."""
+        if self.delta is None:
+            return self
+        return TokenSetIndex(*merge_token_rows(self.indptr, self.indices, self.review_ids,
+                                               self.delta.indptr, self.delta.indices, self.delta.review_ids))
+
+    def lookup_rows(self, review_ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Maps review ids to matrix rows. Returns (rows, found_mask)."""
+        ids = np.asarray(review_ids, dtype=np.int64)
+        if not len(self.review_ids):
+            return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+        rows = np.minimum(np.searchsorted(self.review_ids, ids), len(self.review_ids) - 1)
+        return rows, self.review_ids[rows] == ids
+
+    def count_matches(self, rows: np.ndarray, query_ids: np.ndarray) -> np.ndarray:
+        """Number of query token ids in each of the given rows (|A ∩ B|)."""
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        hits = np.isin(np.asarray(self.indices[gather_positions(starts, lengths)]), query_ids)
+        row_of = np.repeat(np.arange(len(rows)), lengths)
+        return np.bincount(row_of[hits], minlength=len(rows)).astype(np.float32)
+
+    def score(self, query: str, review_ids: Sequence[int], texts: Sequence[str] = None) -> np.ndarray:
+        """Jaccard similarity between the query and the given reviews (see score_segment)."""
+        return score_with_delta(self, query, review_ids, texts)
+
+    def score_segment(self, query: str, review_ids: Sequence[int], texts: Sequence[str] = None) -> np.ndarray:
+        """
+        Jaccard similarity between the query word set and every given review of
+        this segment in one pass: |A ∩ B| is counted over the rows' token ids and
+        |A ∪ B| = |A| + |B| - |A ∩ B|. Reviews newer than the index are scored
+        from their texts when given.
+        """
+        scores = np.zeros(len(review_ids), dtype=np.float32)
+        query_tokens = token_ids(query)
+        if not len(review_ids) or not query_tokens:
+            return scores
+
+        query_ids = np.fromiter(query_tokens, dtype=np.int64, count=len(query_tokens))
+        rows, found = self.lookup_rows(review_ids)
+        if found.any():
+            found_rows = rows[found]
+            intersection = self.count_matches(found_rows, query_ids)
+            union = self.set_sizes[found_rows] + len(query_tokens) - intersection
+            scores[found] = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+        if texts is not None:
+            for i in np.flatnonzero(~found):
+                scores[i] = jaccard(query_tokens, token_ids(texts[i]))
+        return scores
+
+    def minhash_signatures(self, num_perm: int = 128, seed: int = 1, max_block: int = 1 << 20) -> np.ndarray:
+        """
+        MinHash signature of every row as a (n_reviews, num_perm) uint32 matrix.
+        Rows without tokens get the maximum value in every position.
+        """
+        rng = np.random.default_rng(seed)
+        a = rng.integers(1, MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+        b = rng.integers(0, MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+
+        n_rows = len(self.review_ids)
+        signatures = np.full((n_rows, num_perm), MINHASH_PRIME, dtype=np.uint32)
+        row = 0
+        while row < n_rows:
+            # Take as many rows as fit in one block of hashed token ids
+            end = int(np.searchsorted(self.indptr, self.indptr[row] + max(max_block // num_perm, 1), side='right')) - 1
+            end = min(max(end, row + 1), n_rows)
+            start_pos, end_pos = self.indptr[row], self.indptr[end]
+            non_empty = np.flatnonzero(self.set_sizes[row:end] > 0)
+            if end_pos > start_pos and len(non_empty):
+                token_ids = np.asarray(self.indices[start_pos:end_pos], dtype=np.uint64)
+                hashes = (token_ids[:, None] * a + b) % MINHASH_PRIME
+                offsets = self.indptr[row:end][non_empty] - start_pos
+                signatures[row + non_empty] = np.minimum.reduceat(hashes, offsets, axis=0)
+            row = end
+        return signatures
+
+def find_near_duplicates(signatures: np.ndarray, review_ids: np.ndarray, threshold: float = 0.8,
+                         bands: int = 32) -> List[List[int]]:
+    """
+    Groups reviews whose estimated Jaccard similarity is at least `threshold`
+    using MinHash LSH: signatures are split into `bands` bands, rows sharing a
+    band bucket are candidates, and candidates are confirmed against the
+    bucket's first member by signature agreement. Returns groups of review ids
+    (each with at least two members).
+    """
+    n_rows, num_perm = signatures.shape
+    rows_per_band = num_perm // bands
+    parent = np.arange(n_rows)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    non_empty = np.flatnonzero(signatures[:, 0] != MINHASH_PRIME)
+    for band in range(bands):
+        band_values = np.ascontiguousarray(signatures[non_empty, band * rows_per_band:(band + 1) * rows_per_band])
+        buckets = defaultdict(list)
+        for row, key in zip(non_empty.tolist(), map(bytes, band_values)):
+            buckets[key].append(row)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            head = members[0]
+            agreement = (signatures[members[1:]] == signatures[head]).mean(axis=1)
+            for member in np.asarray(members[1:])[agreement >= threshold]:
+                root_head, root_member = find(head), find(int(member))
+                if root_head != root_member:
+                    parent[max(root_head, root_member)] = min(root_head, root_member)
+
+    groups = defaultdict(list)
+    for row in non_empty.tolist():
+        groups[find(row)].append(int(review_ids[row]))
+    return [members for members in groups.values() if len(members) > 1]
+
+def save_duplicate_groups(groups: List[List[int]], database: str = DATABASE):
+    """Stores groups as (review_id, group_id) rows; group_id is the smallest id in the group."""
+    con = connect_writable(database)
+    try:
+        with con:
+            con.execute(f"DROP TABLE IF EXISTS {DUPLICATES_TABLE}")
+            con.execute(f"""
+                CREATE TABLE {DUPLICATES_TABLE} (
+                    review_id INTEGER PRIMARY KEY,
+                    group_id INTEGER NOT NULL
+                )
+            """)
+            con.executemany(
+                f"INSERT INTO {DUPLICATES_TABLE} (review_id, group_id) VALUES (?, ?)",
+                ((review_id, min(group)) for group in groups for review_id in group)
+            )
+            con.execute(f"CREATE INDEX idx_{DUPLICATES_TABLE}_group ON {DUPLICATES_TABLE} (group_id)")
+    finally:
+        con.close()
@@ -0,0 +1,228 @@
+import re
+import sqlite3
+from typing import Callable, List, Tuple
+
+from .aggregate_service import AGGREGATE_TABLES, refresh_aggregates
+from .analysis_store_service import add_lexicon_version_column
+from .connection_service import DATABASE, connect_writable
+from .ingest_service import REVIEW_COLUMN_PARSERS
+from .search_index_service import FTS_TABLE, create_fts_triggers
+from .sentiment_service import add_sentiment_columns
+
+# Composite indexes for the filter combinations of build_query_conditions.
+# The filter indexes end in the browse order (timestamp_created, id), so a filtered
+# page is read in index order and LIMIT stops early instead of sorting.
+FILTER_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_reviews_created ON reviews (timestamp_created, id)",
+    "CREATE INDEX IF NOT EXISTS idx_reviews_app_created ON reviews (app_id, timestamp_created, id)",
+    "CREATE INDEX IF NOT EXISTS idx_reviews_positive_created ON reviews (is_positive, timestamp_created, id)",
+    "CREATE INDEX IF NOT EXISTS idx_reviews_flags_created ON reviews "
+    "(received_for_free, written_during_early_access, timestamp_created, id)",
+    "CREATE INDEX IF NOT EXISTS idx_reviews_funny ON reviews (votes_funny, timestamp_created, id)",
+    # Covers the author join and get_top_authors' GROUP BY
+    "CREATE INDEX IF NOT EXISTS idx_reviews_author ON reviews (author_id)",
+    # Join lookups; playtime_at_review is included so the playtime filter is index-only
+    "CREATE INDEX IF NOT EXISTS idx_authors_author ON authors (author_id, playtime_at_review)",
+    "CREATE INDEX IF NOT EXISTS idx_authors_playtime ON authors (playtime_at_review, author_id)",
+    "CREATE INDEX IF NOT EXISTS idx_games_app ON games (app_id)"
+)
+
+def _create_filter_indexes(con: sqlite3.Connection):
+    for statement in FILTER_INDEXES:
+        con.execute(statement)
+
+def _table_exists(con: sqlite3.Connection, name: str) -> bool:
+    return con.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+def _typed_review_columns(con: sqlite3.Connection):
+    """
+    Rebuilds `reviews` with INTEGER 0/1 booleans, an INTEGER is_positive and
+    INTEGER epoch timestamps, converting the stored text with the ingest
+    parsers. SQLite cannot change a column's type in place, so the table is
+    copied (ids and thus FTS rowids are kept) and its indexes and triggers
+    are recreated.
+    """
+    for column, parser in REVIEW_COLUMN_PARSERS.items():
+        con.create_function(f"parse_{column}", 1, parser, deterministic=True)
+
+    columns = con.execute("PRAGMA table_info(reviews)").fetchall()
+    primary_key = [name for _, name, _, _, _, pk in sorted(columns, key=lambda c: c[5]) if pk]
+    definitions, values = [], []
+    for _, name, column_type, not_null, default, pk in columns:
+        typed = name in REVIEW_COLUMN_PARSERS
+        definition = f'"{name}" {"INTEGER" if typed else column_type}'.rstrip()
+        if len(primary_key) == 1 and pk:
+            definition += " PRIMARY KEY"
+        if not_null:
+            definition += " NOT NULL"
+        if default is not None:
+            definition += f" DEFAULT {default}"
+        definitions.append(definition)
+        values.append(f'parse_{name}("{name}")' if typed else f'"{name}"')
+    if len(primary_key) > 1:
+        definitions.append(f"PRIMARY KEY ({', '.join(primary_key)})")
+
+    con.execute("DROP TABLE IF EXISTS reviews_typed")
+    con.execute(f"CREATE TABLE reviews_typed ({', '.join(definitions)})")
+    con.execute(f"INSERT INTO reviews_typed SELECT {', '.join(values)} FROM reviews")
+    con.execute("DROP TABLE reviews")
+    con.execute("ALTER TABLE reviews_typed RENAME TO reviews")
+
+    _create_filter_indexes(con)
+    if _table_exists(con, FTS_TABLE):
+        create_fts_triggers(con)
+
+def _unique_review_ids(con: sqlite3.Connection):
+    """
+    Makes reviews.id unique, which ingest's upserts (ON CONFLICT(id)) and the
+    review lookups rely on. Databases whose id is the primary key already
+    have this; others get a unique index. Duplicated ids are reported rather
+    than resolved, since choosing which copy to keep needs a person.
+    """
+    columns = con.execute("PRAGMA table_info(reviews)").fetchall()
+    if [name for _, name, _, _, _, pk in columns if pk] == ['id']:
+        return
+    duplicates = con.execute(
+        "SELECT COUNT(*) FROM (SELECT id FROM reviews GROUP BY id HAVING COUNT(*) > 1)"
+    ).fetchone()[0]
+    if duplicates:
+        raise sqlite3.IntegrityError(
+            f"{duplicates} review ids occur more than once in reviews; "
+            f"remove the extra rows before upgrading"
+        )
+    con.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_reviews_id ON reviews (id)")
+
+# (version, description, migration). A migration runs in one transaction and
+# the database's PRAGMA user_version records the last applied version.
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, 'Indexes for the search filters, joins and aggregates', _create_filter_indexes),
+    (2, 'Typed reviews columns: INTEGER booleans, sentiment and timestamps', _typed_review_columns),
+    (3, 'Materialized review counts per game, author, day, genre, publisher and developer', refresh_aggregates),
+    (4, 'Indexed sentiment score columns (polarity, subjectivity, intensity) on reviews', add_sentiment_columns),
+    (5, 'Unique review ids', _unique_review_ids),
+    (6, 'Gaming lexicon version of stored review analyses', add_lexicon_version_column),
+]
+
+def schema_version(con: sqlite3.Connection) -> int:
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+def schema_up_to_date(con: sqlite3.Connection) -> bool:
+    return schema_version(con) >= MIGRATIONS[-1][0]
+
+def pending_migrations(database: str = DATABASE) -> List[Tuple[int, str]]:
+    con = connect_writable(database)
+    try:
+        version = schema_version(con)
+    finally:
+        con.close()
+    return [(number, description) for number, description, _ in MIGRATIONS if number > version]
+
+def run_migrations(database: str = DATABASE, analyze: bool = True, vacuum: bool = False) -> List[int]:
+    """
+    Applies every migration newer than the database's user_version, each in
+    its own transaction, then refreshes the planner statistics (ANALYZE) and
+    optionally compacts the file (VACUUM, needed to reclaim the space freed
+    by table rebuilds). Returns the applied version numbers.
+    """
+    con = connect_writable(database)
+    con.isolation_level = None  # explicit transactions, DDL included
+    applied = []
+    try:
+        version = schema_version(con)
+        for number, description, migration in MIGRATIONS:
+            if number <= version:
+                continue
+            print(f"Applying migration {number}: {description}")
+            con.execute("BEGIN")
+            try:
+                migration(con)
+                con.execute(f"PRAGMA user_version = {int(number)}")
+                con.execute("COMMIT")
+            except sqlite3.Error:
+                con.execute("ROLLBACK")
+                raise
+            applied.append(number)
+        if vacuum:
+            con.execute("VACUUM")
+        if analyze:
+            analyze_database(con)
+    finally:
+        con.close()
+    return applied
+
+def analyze_database(con: sqlite3.Connection):
+    """Collects index statistics so the planner can pick between the composite indexes."""
+    con.execute("ANALYZE")
+    con.execute("PRAGMA optimize")
+
+def canonical_queries() -> List[Tuple[str, str, list]]:
+    """
+    (name, sql, params) for the queries the application runs: browse pages,
+    counts and keyword candidate passes for each filter combination of
+    build_query_conditions, plus the dashboard's aggregate reads.
+    """
+    from .db_service import BROWSE_ORDERS, REVIEW_SELECT, build_query_conditions
+
+    filters = [
+        ('no filters', {}),
+        ('game', {'game_id': '1'}),
+        ('positive', {'filter_option': 'positive'}),
+        ('date range', {'date_from': '2020-01-01', 'date_to': '2020-12-31'}),
+        ('game + date range', {'game_id': '1', 'date_from': '2020-01-01', 'date_to': '2020-12-31'}),
+        ('min playtime', {'min_playtime': 10}),
+        ('min funny', {'min_funny': 5}),
+        ('free + early access', {'received_free': True, 'early_access': False}),
+        ('min polarity', {'min_polarity': 0.5}),
+        ('sorted by polarity', {'sort': 'polarity'}),
+    ]
+    joins = """
+        FROM reviews r
+        LEFT JOIN authors a ON r.author_id = a.author_id
+        LEFT JOIN games g ON r.app_id = g.app_id
+    """
+
+    queries = []
+    for name, options in filters:
+        conditions, params = build_query_conditions(**options)
+        order = BROWSE_ORDERS[options.get('sort', 'date')][0]
+        queries.append((f"browse page, {name}",
+                        f"{REVIEW_SELECT} WHERE {conditions} ORDER BY {order} LIMIT ? OFFSET ?",
+                        params + [21, 0]))
+        queries.append((f"count, {name}",
+                        f"SELECT COUNT(*) FROM (SELECT 1 {joins} WHERE {conditions} LIMIT ?)",
+                        params + [10001]))
+    for name, options in filters[1:3]:
+        conditions, params = build_query_conditions(keyword='great game', **options)
+        queries.append((f"keyword candidates, {name}",
+                        f"SELECT r.id, r.content {joins} WHERE {conditions}", params))
+
+    queries.append(("review by id", f"{REVIEW_SELECT} WHERE r.id = ?", [1]))
+    for kind in ('genre', 'publisher', 'developer', 'author'):
+        table, key = AGGREGATE_TABLES[kind]
+        queries.append((f"top {kind}s", f"""
+            SELECT {key} as name, review_count
+            FROM {table}
+            ORDER BY review_count DESC, {key}
+            LIMIT ?
+        """, [10]))
+    return queries
+
+# Plan steps that read a whole table instead of seeking into an index
+FULL_SCAN = re.compile(r"^SCAN (?!.*(USING (COVERING )?INDEX|VIRTUAL TABLE))\w+")
+
+def explain_queries(database: str = DATABASE) -> List[Tuple[str, List[str], List[str]]]:
+    """
+    EXPLAIN QUERY PLAN of every canonical query.
+    Returns (name, plan_steps, full_scan_steps) per query.
+    """
+    con = connect_writable(database)
+    try:
+        report = []
+        for name, sql, params in canonical_queries():
+            steps = [row[3] for row in con.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+            report.append((name, steps, [step for step in steps if FULL_SCAN.match(step)]))
+        return report
+    finally:
+        con.close()
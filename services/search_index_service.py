@@ -0,0 +1,84 @@
+import re
+import sqlite3
+from typing import Optional
+
+from .connection_service import DATABASE, clear_table_checks, connect_writable, table_exists
+
+FTS_TABLE = 'reviews_fts'
+
+# External-content FTS5 table: the index stores only the tokens, the text itself
+# stays in `reviews` and is looked up through content_rowid.
+CREATE_FTS_TABLE = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        content,
+        content='reviews',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+"""
+
+# Triggers keep the index in sync with every write to `reviews`.
+CREATE_FTS_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON reviews BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON reviews BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF content ON reviews BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END
+    """
+]
+
+def create_fts_triggers(con: sqlite3.Connection):
+    """Creates the triggers that maintain the FTS index on writes to `reviews`."""
+    for statement in CREATE_FTS_TRIGGERS:
+        con.execute(statement)
+
+def build_fts_index(database: str = DATABASE, rebuild: bool = False) -> int:
+    """
+    Creates (or rebuilds) the FTS5 index over reviews.content.
+    Returns the number of indexed reviews.
+    """
+    con = connect_writable(database)
+    try:
+        with con:
+            if rebuild:
+                con.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+            con.execute(CREATE_FTS_TABLE)
+            create_fts_triggers(con)
+            # 'rebuild' re-reads the whole content table, so it is also safe on
+            # an index that already exists but may have drifted.
+            con.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            con.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        count = con.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+    finally:
+        con.close()
+
+    clear_table_checks()
+    return count
+
+def fts_index_available(database: str = DATABASE) -> bool:
+    """Checks (cached for a while, see table_exists) whether the FTS index has been built."""
+    return table_exists(FTS_TABLE, database)
+
+def to_fts_query(keyword: str) -> Optional[str]:
+    """
+    Converts a user keyword into an FTS5 MATCH expression.
+
+    The keyword is matched as a phrase with a prefix on the last token, which is
+    the closest token-based equivalent of the previous `LIKE '%keyword%'`
+    (e.g. "game" still matches "gameplay"). Returns None when the keyword has
+    no indexable tokens, in which case callers should fall back to LIKE.
+    """
+    tokens = re.findall(r'\w+', keyword.lower())
+    if not tokens:
+        return None
+    return '"' + ' '.join(tokens) + '"*'
@@ -1,21 +1,87 @@
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
-from typing import List, Dict, Any, Set
+from typing import List, Dict, Any, Optional, Tuple
 from gensim.models import Word2Vec
 from gensim.utils import simple_preprocess
+from .tfidf_index_service import TfidfIndex, TFIDF_PARAMS
+from .word2vec_index_service import Word2VecIndex, mean_vectors
+from .ann_index_service import IVFIndex
+from .jaccard_index_service import TokenSetIndex, jaccard, token_ids
+
+SCORING_METHODS = ('tfidf', 'cosine', 'word2vec', 'jaccard', 'semantic')
+
+# Inverted lists of the ANN index scanned per semantic query
+SEMANTIC_N_PROBE = 8
 
 class SearchService:
     def __init__(self):
-        """Initialize the search service with TF-IDF vectorizer and Word2Vec model"""
-        self.tfidf_vectorizer = TfidfVectorizer(
-            ngram_range=(1, 3),
-            max_features=10000,
-            sublinear_tf=True
+        """Initialize the search service; precomputed indexes are loaded on first use"""
+        self.tfidf_vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
+        # name -> (signature of the index files, loaded index or None)
+        self._indexes = {}
+
+    def _load_index(self, name: str, signature: tuple, load, missing_warning: str):
+        """
+        Loaded index `name`, reloaded when its files' signature (mtimes and
+        sizes) changed since the last load, so every worker process picks up
+        rebuilt, updated or compacted indexes. An index that fails to load
+        (e.g. caught mid-rewrite) keeps serving the previous version.
+        """
+        cached = self._indexes.get(name)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        try:
+            index = load()
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not load the {name} index: {e}")
+            return cached[1] if cached is not None else None
+        if index is None and (cached is None or cached[1] is not None):
+            print(missing_warning)
+        self._indexes[name] = (signature, index)
+        return index
+
+    def get_tfidf_index(self):
+        """Precomputed corpus TF-IDF index (None if it was not built)"""
+        return self._load_index(
+            'TF-IDF', TfidfIndex.signature(), TfidfIndex.load,
+            "Warning: TF-IDF index not found, falling back to per-request fitting. "
+            "Run `python build_indexes.py tfidf` to build it."
         )
-        self.word2vec_model = None
-        self.review_vectors = {}
-        
+
+    def get_word2vec_index(self):
+        """Corpus Word2Vec model and review vectors (None if they were not built)"""
+        return self._load_index(
+            'Word2Vec', Word2VecIndex.signature(), Word2VecIndex.load,
+            "Warning: Word2Vec index not found, training on the candidate reviews per request. "
+            "Run `python build_indexes.py word2vec` to build it."
+        )
+
+    def get_ann_index(self):
+        """ANN index over the base Word2Vec review vectors (None if missing or stale)"""
+        word2vec_index = self.get_word2vec_index()
+
+        def load():
+            ann_index = IVFIndex.load() if word2vec_index is not None else None
+            if ann_index is not None and ann_index.n_vectors != len(word2vec_index.vectors):
+                print("Warning: ANN index was built for a different Word2Vec matrix, ignoring it. "
+                      "Run `python build_indexes.py ann` to rebuild it.")
+                return None
+            return ann_index
+
+        return self._load_index(
+            'ANN', IVFIndex.signature() + Word2VecIndex.signature(), load,
+            "Warning: ANN index not found, semantic search scans every review vector."
+        )
+
+    def get_jaccard_index(self):
+        """Precomputed review token sets (None if they were not built)"""
+        return self._load_index(
+            'Jaccard', TokenSetIndex.signature(), TokenSetIndex.load,
+            "Warning: Jaccard token index not found, comparing word sets per review. "
+            "Run `python build_indexes.py jaccard` to build it."
+        )
+
     def preprocess_text(self, text: str) -> str:
         """Preprocess text for similarity calculation"""
         if not text:
@@ -29,29 +95,29 @@ class SearchService:
         Jaccard = (A ∩ B) / (A ∪ B) where A and B are sets of words
         Returns value in [0,1] range
         """
-        # Preprocess texts
-        text1 = self.preprocess_text(text1)
-        text2 = self.preprocess_text(text2)
-        
-        # Convert to word sets
-        set1: Set[str] = set(text1.split())
-        set2: Set[str] = set(text2.split())
-        
-        # Calculate intersection and union
-        intersection = len(set1.intersection(set2))
-        union = len(set1.union(set2))
-        
-        # Avoid division by zero
-        if union == 0:
-            return 0.0
-            
-        return float(intersection / union)  # Already in [0,1] range
+        # Same hashed word sets as the precomputed Jaccard index
+        return float(jaccard(token_ids(text1), token_ids(text2)))  # Already in [0,1] range
+
+    def score_with_tfidf_index(self, query: str, reviews: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Score reviews against the precomputed corpus TF-IDF index (no refitting)"""
+        index = self.get_tfidf_index()
+        similarities = index.score(
+            query,
+            [review['id'] for review in reviews],
+            [review['content'] for review in reviews]
+        )
+        for review, score in zip(reviews, similarities):
+            review['relevance'] = float(score)
+        return reviews
 
     def calculate_tfidf_similarity(self, query: str, reviews: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Calculate TF-IDF based similarity scores"""
         if not reviews:
             return []
 
+        if self.get_tfidf_index() is not None:
+            return self.score_with_tfidf_index(query, reviews)
+
         # Prepare texts
         review_texts = [self.preprocess_text(review['content']) for review in reviews]
         query_text = self.preprocess_text(query)
@@ -77,6 +143,9 @@ class SearchService:
         if not reviews:
             return []
 
+        if self.get_tfidf_index() is not None:
+            return self.score_with_tfidf_index(query, reviews)
+
         # Prepare texts
         review_texts = [self.preprocess_text(review['content']) for review in reviews]
         query_text = self.preprocess_text(query)
@@ -99,83 +168,176 @@ class SearchService:
             
         return reviews
 
-    def train_word2vec(self, reviews: List[Dict[str, Any]]):
-        """Train Word2Vec model on review texts"""
-        # Preprocess and tokenize reviews
-        tokenized_reviews = [simple_preprocess(review['content']) for review in reviews if review['content']]
-        
-        # Train Word2Vec model
-        self.word2vec_model = Word2Vec(
+    def train_word2vec(self, reviews: List[Dict[str, Any]]) -> Optional[Word2VecIndex]:
+        """
+        Train a throwaway Word2Vec model on the given reviews only.
+        Used when the corpus model (build_indexes.py word2vec) was not built.
+        """
+        tokenized_reviews = [tokens for tokens in (simple_preprocess(review['content'] or "") for review in reviews) if tokens]
+        if not tokenized_reviews:
+            return None
+
+        model = Word2Vec(
             sentences=tokenized_reviews,
             vector_size=100,
             window=5,
             min_count=1,
             workers=4
         )
-        
-        # Create review vectors
-        for review in reviews:
-            if review['content']:
-                tokens = simple_preprocess(review['content'])
-                if tokens:
-                    vector = np.mean([self.word2vec_model.wv[word] 
-                                    for word in tokens 
-                                    if word in self.word2vec_model.wv], axis=0)
-                    self.review_vectors[review['id']] = vector
+
+        review_ids = np.array([review['id'] for review in reviews], dtype=np.int64)
+        order = np.argsort(review_ids)
+        vectors = mean_vectors(model.wv, [reviews[i]['content'] or "" for i in order])
+        return Word2VecIndex(model.wv, vectors, review_ids[order])
 
     def calculate_word2vec_similarity(self, query: str, reviews: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Calculate similarity using Word2Vec embeddings"""
-        if not self.word2vec_model:
-            self.train_word2vec(reviews)
-            
-        query_tokens = simple_preprocess(query)
-        if not query_tokens:
-            return reviews
-            
-        # Calculate query vector
-        query_vector = np.mean([self.word2vec_model.wv[word] 
-                              for word in query_tokens 
-                              if word in self.word2vec_model.wv], axis=0)
-        
-        # Calculate similarities
-        for review in reviews:
-            if review['id'] in self.review_vectors:
-                review_vector = self.review_vectors[review['id']]
-                # cosine_similarity returns value in [-1,1], normalize to [0,1]
-                similarity = cosine_similarity([query_vector], [review_vector])[0][0]
-                review['relevance'] = float((similarity + 1) / 2)  # normalize to [0,1]
-            else:
-                review['relevance'] = 0.0
-                
+        if not reviews:
+            return []
+
+        index = self.get_word2vec_index() or self.train_word2vec(reviews)
+        if index is None:
+            similarities = np.zeros(len(reviews), dtype=np.float32)
+        else:
+            # Cosine similarity mapped from [-1,1] to [0,1]
+            similarities = index.score(
+                query,
+                [review['id'] for review in reviews],
+                [review['content'] for review in reviews]
+            )
+
+        for review, score in zip(reviews, similarities):
+            review['relevance'] = float(score)
+
         return reviews
 
-    def search_reviews(self, query: str, reviews: List[Dict[str, Any]], scoring_method: str = 'tfidf') -> List[Dict[str, Any]]:
+    def semantic_search_available(self) -> bool:
+        """Semantic search needs the corpus Word2Vec index"""
+        return self.get_word2vec_index() is not None
+
+    def semantic_search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Search and rank reviews based on selected scoring method.
+        Retrieve the k reviews closest to the query in Word2Vec space from the
+        whole corpus, without a keyword prefilter. Uses the ANN index when it
+        was built, otherwise an exact scan of the review matrix; the small
+        delta segment of recently updated reviews is always scanned exactly.
+        Returns (review_ids, relevance) with relevance in [0,1], best first.
+        """
+        index = self.get_word2vec_index()
+        query_vector = index.query_vector(query) if index is not None else None
+        if query_vector is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        delta = index.delta
+        n_delta = len(delta.review_ids) if delta is not None else 0
+        # Base hits replaced by delta rows are dropped, so fetch enough to still fill k
+        ann_index = self.get_ann_index()
+        if ann_index is not None:
+            rows, similarities = ann_index.search(index.vectors, query_vector, k + n_delta, SEMANTIC_N_PROBE)
+        else:
+            all_similarities = np.asarray(index.vectors @ query_vector, dtype=np.float32)
+            rows = self.top_k(all_similarities, k + n_delta)
+            similarities = all_similarities[rows]
+        review_ids = index.review_ids[rows]
+
+        if n_delta:
+            _, replaced = delta.lookup_rows(review_ids)
+            review_ids = np.concatenate([review_ids[~replaced], delta.review_ids])
+            similarities = np.concatenate([
+                similarities[~replaced], np.asarray(delta.vectors @ query_vector, dtype=np.float32)
+            ])
+            best = self.top_k(similarities, k)
+            review_ids, similarities = review_ids[best], similarities[best]
+
+        # cosine similarity in [-1,1], normalized to [0,1] like word2vec scoring
+        return review_ids, ((similarities + 1) / 2).astype(np.float32)
+
+    @staticmethod
+    def normalize_scoring_method(scoring_method: str) -> str:
+        """Unknown scoring methods default to tfidf"""
+        return scoring_method if scoring_method in SCORING_METHODS else 'tfidf'
+
+    def score_reviews(self, query: str, review_ids: List[int], texts: List[str], scoring_method: str = 'tfidf') -> np.ndarray:
+        """
+        Score reviews against the query and return the scores as a float32 vector
+        aligned with review_ids/texts.
         scoring_method: 'tfidf', 'jaccard', 'cosine', or 'word2vec'
+        ('semantic' scores given candidates like 'word2vec')
         """
-        if not reviews or not query:
-            return reviews
+        if not review_ids or not query:
+            return np.zeros(len(review_ids), dtype=np.float32)
 
+        scoring_method = self.normalize_scoring_method(scoring_method)
         if scoring_method == 'jaccard':
-            for review in reviews:
-                score = self.calculate_jaccard_similarity(query, review['content'])
-                review['relevance'] = score
-                review['scoring_method'] = 'jaccard'
-        elif scoring_method == 'cosine':
+            index = self.get_jaccard_index()
+            if index is not None:
+                return index.score(query, review_ids, texts)
+            return np.fromiter(
+                (self.calculate_jaccard_similarity(query, text) for text in texts),
+                dtype=np.float32,
+                count=len(texts)
+            )
+        if scoring_method in ('tfidf', 'cosine'):
+            index = self.get_tfidf_index()
+            if index is not None:
+                return index.score(query, review_ids, texts)
+        if scoring_method in ('word2vec', 'semantic'):
+            index = self.get_word2vec_index()
+            if index is not None:
+                return index.score(query, review_ids, texts)
+
+        # Methods without a vectorized path score lightweight review dicts
+        reviews = [{'id': review_id, 'content': text, 'relevance': 0.0}
+                   for review_id, text in zip(review_ids, texts)]
+        if scoring_method == 'cosine':
             reviews = self.calculate_cosine_similarity(query, reviews)
-            for review in reviews:
-                review['scoring_method'] = 'cosine'
-        elif scoring_method == 'word2vec':
+        elif scoring_method in ('word2vec', 'semantic'):
             reviews = self.calculate_word2vec_similarity(query, reviews)
-            for review in reviews:
-                review['scoring_method'] = 'word2vec'
-        else:  # default to tfidf
+        else:
             reviews = self.calculate_tfidf_similarity(query, reviews)
-            for review in reviews:
-                review['scoring_method'] = 'tfidf'
+        return np.array([review['relevance'] for review in reviews], dtype=np.float32)
+
+    @staticmethod
+    def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """
+        Indices of the k highest scores in descending order, ties broken by position
+        so that consecutive pages never overlap. Only the selected k entries are
+        fully sorted; the rest is handled by a linear-time partition.
+        """
+        n = len(scores)
+        if k <= 0 or n == 0:
+            return np.empty(0, dtype=np.int64)
+        scores = np.nan_to_num(np.asarray(scores, dtype=np.float64), nan=-np.inf)
+        if k < n:
+            threshold = np.partition(scores, n - k)[n - k]
+            above = np.flatnonzero(scores > threshold)
+            ties = np.flatnonzero(scores == threshold)[:k - len(above)]
+            candidates = np.concatenate([above, ties])
+        else:
+            candidates = np.arange(n)
+        order = np.lexsort((candidates, -scores[candidates]))
+        return candidates[order]
+
+    def search_reviews(self, query: str, reviews: List[Dict[str, Any]], scoring_method: str = 'tfidf') -> List[Dict[str, Any]]:
+        """
+        Search and rank reviews based on selected scoring method.
+        scoring_method: 'tfidf', 'jaccard', 'cosine', or 'word2vec'
+        """
+        if not reviews or not query:
+            return reviews
+
+        scoring_method = self.normalize_scoring_method(scoring_method)
+        scores = self.score_reviews(
+            query,
+            [review['id'] for review in reviews],
+            [review['content'] for review in reviews],
+            scoring_method
+        )
+        for review, score in zip(reviews, scores):
+            review['relevance'] = float(score)
+            review['scoring_method'] = scoring_method
 
         # Sort by relevance score in descending order
-        return sorted(reviews, key=lambda x: x['relevance'], reverse=True)
+        return [reviews[i] for i in self.top_k(scores, len(reviews))]
 
 search_service = SearchService()
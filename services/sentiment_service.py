@@ -0,0 +1,114 @@
+import multiprocessing
+import sqlite3
+from collections import deque
+from typing import Iterator, List, Tuple
+
+from .connection_service import DATABASE, connect_writable
+from .text_analysis_service import text_analysis_service
+
+# Sentiment scores of analyze_sentiment stored on every review, so searches
+# can filter and sort by them. NULL until scored (and again after the review
+# text changes).
+SENTIMENT_COLUMNS = ('polarity', 'subjectivity', 'intensity')
+
+SENTIMENT_INDEXES = (
+    # min_polarity range scans and sort=polarity pages (read backwards)
+    "CREATE INDEX IF NOT EXISTS idx_reviews_polarity ON reviews (polarity, id)",
+    # Reviews still to be scored
+    "CREATE INDEX IF NOT EXISTS idx_reviews_sentiment_pending ON reviews (id) WHERE polarity IS NULL"
+)
+
+SENTIMENT_TRIGGER = f"""
+    CREATE TRIGGER IF NOT EXISTS reviews_sentiment_reset AFTER UPDATE OF content ON reviews
+    WHEN old.content IS NOT new.content
+    BEGIN
+        UPDATE reviews SET {', '.join(f'{column} = NULL' for column in SENTIMENT_COLUMNS)} WHERE id = new.id;
+    END
+"""
+
+def add_sentiment_columns(con: sqlite3.Connection):
+    """Adds the sentiment columns, their indexes and the reset trigger to reviews."""
+    existing = {row[1] for row in con.execute("PRAGMA table_info(reviews)").fetchall()}
+    for column in SENTIMENT_COLUMNS:
+        if column not in existing:
+            con.execute(f"ALTER TABLE reviews ADD COLUMN {column} REAL")
+    for statement in SENTIMENT_INDEXES:
+        con.execute(statement)
+    con.execute(SENTIMENT_TRIGGER)
+
+def score_chunk(rows: List[Tuple[int, str]]) -> List[Tuple[float, float, float, int]]:
+    """
+    Worker task: TextBlob sentiment and intensity of (review_id, content) rows,
+    as (polarity, subjectivity, intensity, review_id) update parameters.
+    No spaCy pipeline is needed.
+    """
+    scores = []
+    for review_id, content in rows:
+        sentiment = text_analysis_service.analyze_sentiment(content, ('sentiment', 'intensity'))
+        scores.append((sentiment['polarity'], sentiment['subjectivity'], sentiment['intensity']['value'], review_id))
+    return scores
+
+def iter_unscored_chunks(con: sqlite3.Connection, chunk_size: int) -> Iterator[List[Tuple[int, str]]]:
+    """Streams reviews without sentiment scores in id order, chunk by chunk."""
+    last_id = -2**63
+    while True:
+        rows = con.execute("""
+            SELECT id, content
+            FROM reviews
+            WHERE polarity IS NULL AND id > ?
+            ORDER BY id
+            LIMIT ?
+        """, (last_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield rows
+
+def write_scores(con: sqlite3.Connection, scores: List[Tuple[float, float, float, int]]):
+    with con:
+        con.executemany(
+            f"UPDATE reviews SET {', '.join(f'{column} = ?' for column in SENTIMENT_COLUMNS)} WHERE id = ?",
+            scores
+        )
+
+def run_sentiment_scoring(database: str = DATABASE, workers: int = 1, chunk_size: int = 5000) -> int:
+    """
+    Scores every review whose sentiment columns are NULL (new, edited or never
+    scored) and writes the scores chunk by chunk, so an interrupted run simply
+    continues with the reviews still unscored. Chunks are fanned out to
+    `workers` processes with at most two chunks per worker in flight.
+    Returns the number of scored reviews.
+    """
+    from .migration_service import run_migrations
+
+    # The sentiment columns are added by a migration
+    run_migrations(database, analyze=False)
+    con = connect_writable(database)
+    try:
+        scored = 0
+        chunks = iter_unscored_chunks(con, chunk_size)
+        if workers <= 1:
+            for chunk in chunks:
+                scores = score_chunk(chunk)
+                write_scores(con, scores)
+                scored += len(scores)
+                print(f"Scored {scored} reviews")
+        else:
+            with multiprocessing.Pool(workers) as pool:
+                in_flight = deque()
+                for chunk in chunks:
+                    in_flight.append(pool.apply_async(score_chunk, (chunk,)))
+                    if len(in_flight) < workers * 2:
+                        continue
+                    scores = in_flight.popleft().get()
+                    write_scores(con, scores)
+                    scored += len(scores)
+                    print(f"Scored {scored} reviews")
+                while in_flight:
+                    scores = in_flight.popleft().get()
+                    write_scores(con, scores)
+                    scored += len(scores)
+                    print(f"Scored {scored} reviews")
+        return scored
+    finally:
+        con.close()
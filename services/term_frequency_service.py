@@ -0,0 +1,132 @@
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from wordcloud import STOPWORDS
+
+from .aggregate_service import STATE_TABLE, bump_data_version
+from .connection_service import DATABASE, connect_readonly, connect_writable, get_read_connection, table_exists
+
+TERM_TABLE = 'term_frequencies'
+# Terms kept per genre value (and for the whole corpus); a word cloud shows at most a few hundred
+TERMS_PER_GENRE = 1000
+# The same tokens WordCloud.process_text would keep
+WORD_PATTERN = re.compile(r"\w[\w']+")
+# While counting, each genre's counter is cut back to its PRUNE_FACTOR *
+# terms_per_genre most frequent terms every PRUNE_EVERY batches, so memory
+# stays bounded by the kept terms rather than the corpus vocabulary
+PRUNE_FACTOR = 10
+PRUNE_EVERY = 10
+
+# Word counts over every review, per games.genre value. genre = '' holds the
+# counts of the whole corpus.
+CREATE_TERM_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {TERM_TABLE} (
+        genre TEXT NOT NULL,
+        term TEXT NOT NULL,
+        frequency INTEGER NOT NULL,
+        PRIMARY KEY (genre, term)
+    ) WITHOUT ROWID
+"""
+
+def tokenize_terms(text: str) -> List[str]:
+    """Lowercased words of a review without stopwords, numbers and possessive 's."""
+    terms = []
+    for word in WORD_PATTERN.findall((text or "").lower()):
+        if word.endswith("'s"):
+            word = word[:-2]
+        if len(word) > 1 and not word.isdigit() and word not in STOPWORDS:
+            terms.append(word)
+    return terms
+
+def prune_counts(counts: Dict[str, Counter], keep: int):
+    """Cuts every counter with more than `keep` terms back to its `keep` most frequent ones."""
+    for genre, terms in counts.items():
+        if len(terms) > keep:
+            counts[genre] = Counter(dict(terms.most_common(keep)))
+
+def count_terms(database: str = DATABASE, batch_size: int = 10000,
+                terms_per_genre: int = TERMS_PER_GENRE) -> Dict[str, Counter]:
+    """
+    Streams every review once and counts its terms for the whole corpus ('')
+    and for each genre value of its game. Counters are pruned as they grow
+    (see PRUNE_FACTOR), so rare terms dropped early and seen again later are
+    undercounted; the terms_per_genre most frequent ones are far above the
+    cut and are counted exactly in practice.
+    """
+    con = connect_readonly(database)
+    try:
+        genres_by_app = defaultdict(set)
+        for app_id, genre in con.execute("SELECT app_id, genre FROM games WHERE genre IS NOT NULL AND genre != ''"):
+            genres_by_app[app_id].add(genre)
+
+        counts = defaultdict(Counter)
+        cur = con.cursor()
+        cur.execute("SELECT app_id, content FROM reviews")
+        batches = 0
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for app_id, content in rows:
+                terms = Counter(tokenize_terms(content))
+                if not terms:
+                    continue
+                counts[''].update(terms)
+                for genre in genres_by_app.get(app_id, ()):
+                    counts[genre].update(terms)
+            batches += 1
+            if batches % PRUNE_EVERY == 0:
+                prune_counts(counts, PRUNE_FACTOR * terms_per_genre)
+        return counts
+    finally:
+        con.close()
+
+def build_term_frequencies(database: str = DATABASE, terms_per_genre: int = TERMS_PER_GENRE,
+                           batch_size: int = 10000) -> int:
+    """
+    Recomputes the term frequency table over the whole corpus, keeping the
+    most frequent terms of each genre value. Bumps the aggregates'
+    data_version so cached word clouds are rendered again. Returns the
+    number of genre values (including the whole corpus).
+    """
+    counts = count_terms(database, batch_size, terms_per_genre)
+    con = connect_writable(database)
+    try:
+        with con:
+            con.execute(CREATE_TERM_TABLE)
+            con.execute(f"DELETE FROM {TERM_TABLE}")
+            for genre, terms in counts.items():
+                con.executemany(
+                    f"INSERT INTO {TERM_TABLE} (genre, term, frequency) VALUES (?, ?, ?)",
+                    ((genre, term, frequency) for term, frequency in terms.most_common(terms_per_genre))
+                )
+            if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (STATE_TABLE,)).fetchone():
+                bump_data_version(con)
+    finally:
+        con.close()
+    return len(counts)
+
+def term_frequencies_available(database: str = DATABASE) -> bool:
+    """Checks (cached for a while, see table_exists) whether the term frequency table exists."""
+    return table_exists(TERM_TABLE, database)
+
+def get_term_frequencies(genre: str = '', limit: int = 200, database: str = DATABASE) -> Optional[Dict[str, int]]:
+    """
+    {term: frequency} of the `limit` most frequent terms in all reviews, or in
+    reviews of games with exactly the genre value `genre` (as listed by
+    get_unique_genres). Values are matched exactly rather than by substring,
+    since summing the counts of several matching values would count the
+    reviews of a game listed under more than one of them repeatedly.
+    Returns None if the table was not built.
+    """
+    if not term_frequencies_available(database):
+        return None
+    query = f"""
+        SELECT term, frequency
+        FROM {TERM_TABLE}
+        WHERE genre = ?
+        ORDER BY frequency DESC, term
+        LIMIT ?
+    """
+    return dict(get_read_connection(database).execute(query, (genre, limit)).fetchall())
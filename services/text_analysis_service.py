@@ -1,25 +1,115 @@
+import copy
 import re
+import threading
 import spacy
-from typing import Dict, Any
+from spacy.language import Language
+from spacy.tokens import Doc
+from typing import Dict, Any, Iterable, List, Optional
 from textblob import TextBlob
 from collections import Counter
 
+from .analysis_cache_service import AnalysisCache, analysis_key
+from .gaming_lexicon_service import get_gaming_lexicon
+
+MODEL_NAME = 'en_core_web_sm'
+
+# Pipeline components needed by each kind of analysis; the rest of the
+# pipeline is disabled for that call. Entities need the parser only for
+# sentence boundaries (ent.sent), not the tagger or lemmatizer.
+ENTITY_PIPES = ('tok2vec', 'parser', 'ner')
+
+# Parts of analyze_text that can be requested separately, with the pipeline
+# components each one needs. Sentiment and intensity do not use spaCy.
+FEATURE_PIPES = {
+    'stats': ('tok2vec', 'parser'),  # word and sentence counts
+    'morphology': ('tok2vec', 'tagger', 'attribute_ruler', 'lemmatizer', 'parser'),  # per-token analysis and POS/dependency counts
+    'entities': ENTITY_PIPES,
+    'sentiment': (),
+    'intensity': ()
+}
+ALL_FEATURES = frozenset(FEATURE_PIPES)
+
+# Readable names of spaCy and gaming lexicon entity labels
+ENTITY_LABELS = {
+    'PERSON': 'Osoby',
+    'ORG': 'Organizacje',
+    'GPE': 'Lokalizacje',
+    'PRODUCT': 'Produkty',
+    'DATE': 'Daty',
+    'MONEY': 'Kwoty',
+    'GAME': 'Gry',
+    'DEVELOPER': 'Deweloperzy'
+}
+
+CAPS_WORD_PATTERN = re.compile(r'\b[A-Z]{2,}+\b')
+# Counted once each when they occur anywhere in the text (also inside words)
+INTENSITY_MODIFIERS = ('very', 'really', 'extremely', 'absolutely', 'completely')
+INTENSITY_MODIFIER_PATTERN = re.compile('|'.join(INTENSITY_MODIFIERS), re.IGNORECASE)
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+def load_nlp() -> Language:
+    """Load the shared spaCy model on first use (once per process)"""
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                try:
+                    _nlp = spacy.load(MODEL_NAME)
+                except OSError:
+                    print("Warning: English language model not found. Downloading...")
+                    import subprocess
+                    subprocess.run(["python", "-m", "spacy", "download", MODEL_NAME])
+                    subprocess.run(["pip", "install", "textblob"])
+                    _nlp = spacy.load(MODEL_NAME)
+    return _nlp
+
 class TextAnalysisService:
     def __init__(self):
-        """Initialize spaCy model"""
-        try:
-            self.nlp = spacy.load('en_core_web_sm')
-        except OSError:
-            print("Warning: English language model not found. Downloading...")
-            import subprocess
-            subprocess.run(["python", "-m", "spacy", "download", "en_core_web_sm"])
-            subprocess.run(["pip", "install", "textblob"])
-            self.nlp = spacy.load('en_core_web_sm')
-
-    def analyze_sentiment(self, text: str) -> Dict[str, Any]:
-        """Analyze sentiment of text using TextBlob."""
+        # Results of the public analysis methods, by hash of the text and the
+        # requested features (Steam reviews repeat the same short texts a lot)
+        self.cache = AnalysisCache()
+
+    @property
+    def nlp(self) -> Language:
+        """Shared spaCy pipeline, loaded lazily"""
+        return load_nlp()
+
+    def disabled_pipes(self, needed: Iterable[str]) -> List[str]:
+        """Names of the loaded pipeline components not in `needed`"""
+        needed = set(needed)
+        return [name for name in self.nlp.pipe_names if name not in needed]
+
+    def resolve_features(self, features: Optional[Iterable[str]]) -> frozenset:
+        """Validated feature set for analyze_text; None means all features"""
+        if features is None:
+            return ALL_FEATURES
+        features = frozenset(features)
+        unknown = features - ALL_FEATURES
+        if unknown:
+            raise ValueError(f"Unknown analysis features: {', '.join(sorted(unknown))}")
+        return features
+
+    def feature_pipes(self, features: Iterable[str]) -> set:
+        """Pipeline components needed by a resolved feature set"""
+        return {pipe for feature in features for pipe in FEATURE_PIPES[feature]}
+
+    def analyze_sentiment(self, text: str, features: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Analyze sentiment of text using TextBlob. With `features`, only the
+        requested parts of 'sentiment' (polarity, subjectivity, assessment) and
+        'intensity' are computed. Results are memoized by text.
+        """
+        features = self.resolve_features(features) & {'sentiment', 'intensity'}
+        return self.cache.get_or_compute(
+            analysis_key('sentiment', text, features),
+            lambda: self._analyze_sentiment(text, features)
+        )
+
+    def _analyze_sentiment(self, text: str, features: frozenset) -> Dict[str, Any]:
         if not text:
-            return {
+            result = {
                 'polarity': 0.0,
                 'subjectivity': 0.0,
                 'assessment': 'neutral',
@@ -30,16 +120,24 @@ class TextAnalysisService:
                     'label': 'neutral'
                 }
             }
+            if 'sentiment' not in features:
+                result = {'intensity': result['intensity']}
+            if 'intensity' not in features:
+                result.pop('intensity')
+            return result
 
-        blob = TextBlob(text)
-        polarity = blob.sentiment.polarity
-        subjectivity = blob.sentiment.subjectivity
+        result = {}
+        if 'sentiment' in features:
+            result.update(self._sentiment_scores(text))
+        if 'intensity' in features:
+            result['intensity'] = self._sentiment_intensity(text)
+        return result
 
-        # Calculate intensity based on word modifiers and punctuation
+    def _sentiment_intensity(self, text: str) -> Dict[str, Any]:
+        """Intensity of the text from exclamations, all-caps words and modifier words."""
         intensity_value = 0.0
         exclamation_count = text.count('!')
-        caps_words = len(re.findall(r'\b[A-Z]{2,}+\b', text))
-        intensity_modifiers = ['very', 'really', 'extremely', 'absolutely', 'completely']
+        caps_words = len(CAPS_WORD_PATTERN.findall(text))
         
         # Add intensity for exclamations (max 0.3)
         intensity_value += min(exclamation_count * 0.1, 0.3)
@@ -48,7 +146,7 @@ class TextAnalysisService:
         intensity_value += min(caps_words * 0.1, 0.3)
         
         # Add intensity for modifier words (max 0.4)
-        modifier_count = sum(1 for word in intensity_modifiers if word.lower() in text.lower())
+        modifier_count = len({word.lower() for word in INTENSITY_MODIFIER_PATTERN.findall(text)})
         intensity_value += min(modifier_count * 0.1, 0.4)
 
         # Determine intensity label
@@ -59,6 +157,18 @@ class TextAnalysisService:
         else:
             intensity_label = 'strong'
 
+        return {
+            'value': round(intensity_value, 2),
+            'label': intensity_label,
+            'percentage': round(intensity_value * 100, 1)
+        }
+
+    def _sentiment_scores(self, text: str) -> Dict[str, Any]:
+        """TextBlob polarity and subjectivity with the derived assessment."""
+        blob = TextBlob(text)
+        polarity = blob.sentiment.polarity
+        subjectivity = blob.sentiment.subjectivity
+
         # Determine sentiment assessment
         if polarity > 0.1:
             assessment = 'positive'
@@ -76,34 +186,29 @@ class TextAnalysisService:
             'subjectivity': round(subjectivity, 2),
             'assessment': assessment,
             'polarity_percentage': round(polarity_percentage, 1),
-            'subjectivity_percentage': round(subjectivity_percentage, 1),
-            'intensity': {
-                'value': round(intensity_value, 2),
-                'label': intensity_label,
-                'percentage': round(intensity_value * 100, 1)
-            }
+            'subjectivity_percentage': round(subjectivity_percentage, 1)
         }
 
-    def extract_named_entities(self, text: str) -> Dict[str, list]:
+    def extract_named_entities(self, text: str, doc: Doc = None) -> Dict[str, list]:
         """
         Extract named entities from text using spaCy.
         Returns a dictionary with entity types as keys and lists of entities as values.
+        An already parsed `doc` of the same text can be passed to skip parsing.
+        Results are memoized by text.
         """
-        doc = self.nlp(text)
+        return self.cache.get_or_compute(
+            analysis_key('entities', text, version=get_gaming_lexicon().version),
+            lambda: self._extract_named_entities(text, doc)
+        )
+
+    def _extract_named_entities(self, text: str, doc: Optional[Doc]) -> Dict[str, list]:
+        if doc is None:
+            doc = self.nlp(text, disable=self.disabled_pipes(ENTITY_PIPES))
         entities = {}
         
         for ent in doc.ents:
             # Convert spaCy labels to more readable names
-            label = {
-                'PERSON': 'Osoby',
-                'ORG': 'Organizacje',
-                'GPE': 'Lokalizacje',
-                'PRODUCT': 'Produkty',
-                'DATE': 'Daty',
-                'MONEY': 'Kwoty',
-                'GAME': 'Gry',
-                'DEVELOPER': 'Deweloperzy'
-            }.get(ent.label_, ent.label_)
+            label = ENTITY_LABELS.get(ent.label_, ent.label_)
             
             if label not in entities:
                 entities[label] = []
@@ -116,71 +221,91 @@ class TextAnalysisService:
                 'sentence': ent.sent.text.strip()
             })
         
-        # Add gaming-specific entity extraction
-        game_patterns = [
-            r'(?i)\b(steam|valve|epic games|gog|origin)\b',  # Gaming platforms
-            r'(?i)\b(dlc|expansion|patch|update)\b',         # Gaming terms
-            r'(?i)\b(fps|rpg|mmo|rts|moba)\b',              # Game genres
-            r'\$\d+(?:\.\d{2})?|\d+(?:\.\d{2})?\$',         # Price patterns
-            r'v\d+\.\d+(?:\.\d+)?'                          # Version numbers
-        ]
-        
-        # Add custom gaming entities
-        for pattern in game_patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-            for match in matches:
-                label = 'GAMING_TERM'
-                if label not in entities:
-                    entities[label] = []
-                entities[label].append({
-                    'text': match.group(),
-                    'start': match.start(),
-                    'end': match.end(),
-                    'sentence': text[max(0, match.start()-50):min(len(text), match.end()+50)].strip()
-                })
+        # Add gaming-specific entities (vocabulary, prices, versions, titles and studios)
+        for lexicon_label, start, end in get_gaming_lexicon().find(text):
+            label = ENTITY_LABELS.get(lexicon_label, lexicon_label)
+            if label not in entities:
+                entities[label] = []
+            entities[label].append({
+                'text': text[start:end],
+                'start': start,
+                'end': end,
+                'sentence': text[max(0, start-50):min(len(text), end+50)].strip()
+            })
         
         return entities
 
-    def analyze_text(self, text: str) -> Dict[str, Any]:
-        """Perform comprehensive text analysis including NER"""
+    def text_key(self, text: str, features: frozenset) -> str:
+        """Cache key of analyze_text; entity results also depend on the gaming lexicon"""
+        version = get_gaming_lexicon().version if 'entities' in features else ''
+        return analysis_key('text', text, features, version)
+
+    def analyze_text(self, text: str, doc: Doc = None, features: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Perform comprehensive text analysis including NER.
+        `features` limits the analysis to a subset of FEATURE_PIPES ('stats',
+        'morphology', 'entities', 'sentiment', 'intensity'); only the pipeline
+        components those need are run and only their keys are returned.
+        An already parsed `doc` of the same text (e.g. from nlp.pipe) can be passed to skip parsing.
+        Results are memoized by text and feature set.
+        """
+        features = self.resolve_features(features)
+        return self.cache.get_or_compute(
+            self.text_key(text, features),
+            lambda: self._analyze_text(text, doc, features)
+        )
+
+    def _analyze_text(self, text: str, doc: Optional[Doc], features: frozenset) -> Dict[str, Any]:
         if not text:
-            return {
-                'word_count': 0,
-                'avg_word_length': 0,
-                'sentence_count': 0,
-                'avg_sentence_length': 0,
-                'unique_words': 0,
-                'special_chars_percent': 0,
-                'caps_words_count': 0,
-                'morphological_analysis': [],
-                'summary_stats': {
+            analysis = {}
+            if 'stats' in features:
+                analysis.update({
+                    'word_count': 0,
+                    'avg_word_length': 0,
+                    'sentence_count': 0,
+                    'avg_sentence_length': 0,
+                    'unique_words': 0,
+                    'special_chars_percent': 0,
+                    'caps_words_count': 0
+                })
+            if 'morphology' in features:
+                analysis['morphological_analysis'] = []
+                analysis['summary_stats'] = {
                     'pos_counts': {},
                     'dep_counts': {},
                     'total_tokens': 0
-                },
-                'named_entities': {},
-                'sentiment': {
+                }
+            if 'entities' in features:
+                analysis['named_entities'] = {}
+            if 'sentiment' in features:
+                analysis['sentiment'] = {
                     'polarity': 0,
                     'subjectivity': 0,
                     'assessment': 'neutral'
                 }
-            }
+            return analysis
 
-        doc = self.nlp(text)
+        pipes = self.feature_pipes(features)
+        if doc is None and pipes:
+            doc = self.nlp(text, disable=self.disabled_pipes(pipes))
+        analysis = {}
         
         # Basic statistics
-        words = [token.text for token in doc if not token.is_punct and not token.is_space]
-        sentences = list(doc.sents)
-        
-        analysis = {
-            'word_count': len(words),
-            'avg_word_length': sum(len(word) for word in words) / len(words) if words else 0,
-            'sentence_count': len(sentences),
-            'avg_sentence_length': len(words) / len(sentences) if sentences else 0,
-            'unique_words': len(set(words)),
-            'special_chars_percent': len([c for c in text if not c.isalnum() and not c.isspace()]) / len(text) * 100 if text else 0,
-            'caps_words_count': len([w for w in words if w.isupper()]),
-            'morphological_analysis': [
+        if 'stats' in features:
+            words = [token.text for token in doc if not token.is_punct and not token.is_space]
+            sentences = list(doc.sents)
+            analysis.update({
+                'word_count': len(words),
+                'avg_word_length': sum(len(word) for word in words) / len(words) if words else 0,
+                'sentence_count': len(sentences),
+                'avg_sentence_length': len(words) / len(sentences) if sentences else 0,
+                'unique_words': len(set(words)),
+                'special_chars_percent': len([c for c in text if not c.isalnum() and not c.isspace()]) / len(text) * 100 if text else 0,
+                'caps_words_count': len([w for w in words if w.isupper()])
+            })
+
+        if 'morphology' in features:
+            analysis['morphological_analysis'] = [
                 {
                     'text': token.text,
                     'lemma': token.lemma_,
@@ -189,22 +314,63 @@ class TextAnalysisService:
                     'dep': token.dep_
                 }
                 for token in doc
-            ],
-            'summary_stats': {
+            ]
+            analysis['summary_stats'] = {
                 'pos_counts': dict(Counter(token.pos_ for token in doc)),
                 'dep_counts': dict(Counter(token.dep_ for token in doc)),
                 'total_tokens': len(doc)
             }
-        }
         
         # Add NER analysis
-        analysis['named_entities'] = self.extract_named_entities(text)
+        if 'entities' in features:
+            analysis['named_entities'] = self._extract_named_entities(text, doc)
         
         # Add sentiment analysis
-        analysis['sentiment'] = self.analyze_sentiment(text)
+        if 'sentiment' in features or 'intensity' in features:
+            analysis['sentiment'] = self._analyze_sentiment(text, features)
         
         return analysis
 
+    def analyze_many(self, texts: Iterable[str], features: Optional[Iterable[str]] = None,
+                     batch_size: int = 32) -> List[Dict[str, Any]]:
+        """
+        analyze_text for several texts, in order, with a single nlp.pipe pass
+        over the distinct texts that are not memoized yet. Each Doc is parsed
+        once with the components the requested features need and reused for
+        statistics, morphology and entities.
+        """
+        features = self.resolve_features(features)
+        texts = [text or "" for text in texts]
+        results = {}  # cache key -> analysis
+        pending = {}  # cache key -> text, for distinct texts still to analyze
+        keys = []
+        for text in texts:
+            key = self.text_key(text, features)
+            keys.append(key)
+            if key in results or key in pending:
+                continue
+            cached = self.cache.get(key)
+            if cached is None:
+                pending[key] = text
+            else:
+                results[key] = cached
+
+        pipes = self.feature_pipes(features)
+        if pipes and pending:
+            docs = self.nlp.pipe(pending.values(), disable=self.disabled_pipes(pipes), batch_size=batch_size)
+        else:
+            docs = (None for _ in pending)
+        for (key, text), doc in zip(pending.items(), docs):
+            results[key] = self._analyze_text(text, doc, features)
+            self.cache.put(key, results[key])
+        # Repeated texts get copies, so results can be modified independently
+        seen = set()
+        analyses = []
+        for key in keys:
+            analyses.append(copy.deepcopy(results[key]) if key in seen else results[key])
+            seen.add(key)
+        return analyses
+
     def _get_pos_description(self, pos: str) -> str:
         """Get user-friendly description of part of speech tags."""
         pos_map = {
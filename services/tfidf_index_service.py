@@ -0,0 +1,221 @@
+import os
+import pickle
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from .connection_service import DATABASE, connect_readonly
+from .index_update_service import (
+    check_rows, delta_path, files_signature, load_delta, merge_review_ids, remove_delta,
+    save_array, save_delta, score_with_delta
+)
+
+MODEL_DIR = 'data/search_models'
+
+# Same settings SearchService uses for its per-request vectorizer
+TFIDF_PARAMS = {
+    'ngram_range': (1, 3),
+    'max_features': 10000,
+    'sublinear_tf': True
+}
+
+def preprocess_text(text: str) -> str:
+    """Lowercases and normalizes whitespace, like SearchService.preprocess_text."""
+    if not text:
+        return ""
+    return " ".join(text.lower().split())
+
+def iter_review_texts(database: str = DATABASE, batch_size: int = 10000) -> Iterator[Tuple[List[int], List[str]]]:
+    """Streams (ids, texts) batches from the reviews table ordered by id."""
+    con = connect_readonly(database)
+    cur = con.cursor()
+    try:
+        cur.execute("SELECT id, content FROM reviews ORDER BY id")
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [row[0] for row in rows], [preprocess_text(row[1]) for row in rows]
+    finally:
+        cur.close()
+        con.close()
+
+def transform_texts(vectorizer: TfidfVectorizer, texts: Iterable[str], batch_size: int = 10000) -> sparse.csr_matrix:
+    """float32 document-term rows of the texts, transformed batch by batch."""
+    texts = iter(texts)
+    blocks = []
+    while True:
+        batch = [preprocess_text(text) for text in islice(texts, batch_size)]
+        if not batch:
+            break
+        blocks.append(vectorizer.transform(batch).astype(np.float32))
+    if not blocks:
+        return sparse.csr_matrix((0, len(vectorizer.vocabulary_)), dtype=np.float32)
+    matrix = sparse.vstack(blocks, format='csr')
+    matrix.sort_indices()
+    return matrix
+
+def merge_rows(matrix: sparse.csr_matrix, review_ids: np.ndarray,
+               new_matrix: sparse.csr_matrix, new_ids: np.ndarray) -> Tuple[sparse.csr_matrix, np.ndarray]:
+    """Rows of new_ids replace or extend those of review_ids; returns (matrix, ids) in id order."""
+    keep, order, merged_ids = merge_review_ids(review_ids, new_ids)
+    merged = sparse.vstack([matrix[keep], new_matrix], format='csr')[order]
+    merged.sort_indices()
+    return merged.astype(np.float32), merged_ids
+
+class TfidfIndex:
+    """
+    TF-IDF model fitted once over the whole corpus, together with the
+    L2-normalized CSR document-term matrix of every review.
+    Row i of the matrix belongs to review_ids[i]; review_ids is sorted.
+
+    The memory-mapped base matrix is only written by build and compact.
+    Reviews added or changed later go to a small delta segment (a TfidfIndex
+    of its own) whose rows take precedence over the base rows.
+    """
+
+    def __init__(self, vectorizer: TfidfVectorizer, matrix: sparse.csr_matrix, review_ids: np.ndarray,
+                 delta: Optional['TfidfIndex'] = None):
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+        self.review_ids = review_ids
+        self.delta = delta
+
+    @classmethod
+    def build(cls, database: str = DATABASE, batch_size: int = 10000) -> 'TfidfIndex':
+        """Fits the vectorizer over all reviews and transforms them batch by batch."""
+        vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
+        vectorizer.fit(text for _, texts in iter_review_texts(database, batch_size) for text in texts)
+        # stop_words_ holds every pruned term and is only useful for introspection
+        if hasattr(vectorizer, 'stop_words_'):
+            delattr(vectorizer, 'stop_words_')
+
+        ids, blocks = [], []
+        for batch_ids, texts in iter_review_texts(database, batch_size):
+            ids.extend(batch_ids)
+            blocks.append(vectorizer.transform(texts))
+
+        n_features = len(vectorizer.vocabulary_)
+        matrix = sparse.vstack(blocks, format='csr') if blocks else sparse.csr_matrix((0, n_features))
+        matrix.sort_indices()
+        return cls(vectorizer, matrix.astype(np.float32), np.asarray(ids, dtype=np.int64))
+
+    @staticmethod
+    def signature(model_dir: str = MODEL_DIR) -> tuple:
+        """Changes whenever the saved index (base or delta) is rewritten."""
+        return files_signature(os.path.join(model_dir, name) for name in (
+            'tfidf_vectorizer.pkl', 'tfidf_data.npy', 'tfidf_indices.npy', 'tfidf_indptr.npy',
+            'tfidf_ids.npy', 'tfidf_delta.npz'
+        ))
+
+    def save(self, model_dir: str = MODEL_DIR):
+        """
+        Writes the vectorizer (pickle) and the base CSR arrays (.npy, mmap-loadable),
+        then drops the delta segment, which the base now contains. Call on a
+        built or compacted index.
+        """
+        if self.delta is not None:
+            raise ValueError("Compact the index before saving its base")
+        os.makedirs(model_dir, exist_ok=True)
+        with open(os.path.join(model_dir, 'tfidf_vectorizer.pkl'), 'wb') as f:
+            pickle.dump(self.vectorizer, f, protocol=pickle.HIGHEST_PROTOCOL)
+        save_array(os.path.join(model_dir, 'tfidf_data.npy'), self.matrix.data)
+        save_array(os.path.join(model_dir, 'tfidf_indices.npy'), self.matrix.indices)
+        save_array(os.path.join(model_dir, 'tfidf_indptr.npy'), self.matrix.indptr)
+        save_array(os.path.join(model_dir, 'tfidf_ids.npy'), self.review_ids)
+        remove_delta(delta_path(model_dir, 'tfidf'))
+
+    def save_delta(self, model_dir: str = MODEL_DIR):
+        """Writes only the delta segment; the base files are left untouched."""
+        delta = self.delta
+        save_delta(delta_path(model_dir, 'tfidf'), data=delta.matrix.data, indices=delta.matrix.indices,
+                   indptr=delta.matrix.indptr, ids=delta.review_ids)
+
+    @classmethod
+    def load(cls, model_dir: str = MODEL_DIR, mmap: bool = True) -> Optional['TfidfIndex']:
+        """Loads a saved index, memory-mapping the matrix. Returns None if it was never built."""
+        vectorizer_path = os.path.join(model_dir, 'tfidf_vectorizer.pkl')
+        if not os.path.exists(vectorizer_path):
+            return None
+
+        mmap_mode = 'r' if mmap else None
+        with open(vectorizer_path, 'rb') as f:
+            vectorizer = pickle.load(f)
+        data = np.load(os.path.join(model_dir, 'tfidf_data.npy'), mmap_mode=mmap_mode)
+        indices = np.load(os.path.join(model_dir, 'tfidf_indices.npy'), mmap_mode=mmap_mode)
+        indptr = np.load(os.path.join(model_dir, 'tfidf_indptr.npy'), mmap_mode=mmap_mode)
+        ids_path = os.path.join(model_dir, 'tfidf_ids.npy')
+        review_ids = np.load(ids_path)
+        check_rows('TF-IDF', len(review_ids), len(indptr) - 1)
+        check_rows('TF-IDF', len(data), len(indices), int(indptr[-1]))
+
+        n_features = len(vectorizer.vocabulary_)
+        matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(review_ids), n_features), copy=False)
+        delta = None
+        arrays = load_delta(delta_path(model_dir, 'tfidf'), ids_path)
+        if arrays is not None:
+            check_rows('TF-IDF delta', len(arrays['ids']), len(arrays['indptr']) - 1)
+            delta_matrix = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                             shape=(len(arrays['ids']), n_features))
+            delta = cls(vectorizer, delta_matrix, arrays['ids'])
+        return cls(vectorizer, matrix, review_ids, delta)
+
+    def update(self, review_ids: np.ndarray, texts: Iterable[str], batch_size: int = 10000) -> 'TfidfIndex':
+        """
+        Index with the rows of the given sorted, unique review ids replaced or
+        added in the delta segment. Only these texts (in review_ids order) are
+        transformed and only the delta is merged, so the cost does not depend
+        on the corpus size; the vocabulary and IDF weights are kept.
+        """
+        new_matrix = transform_texts(self.vectorizer, texts, batch_size)
+        if self.delta is None:
+            delta_matrix, delta_ids = new_matrix, np.asarray(review_ids, dtype=np.int64)
+        else:
+            delta_matrix, delta_ids = merge_rows(self.delta.matrix, self.delta.review_ids, new_matrix, review_ids)
+        return TfidfIndex(self.vectorizer, self.matrix, self.review_ids,
+                          TfidfIndex(self.vectorizer, delta_matrix, delta_ids))
+
+    def compact(self) -> 'TfidfIndex':
+        """Index with the delta segment merged into the base (reads the whole base)."""
+        if self.delta is None:
+            return self
+        matrix, review_ids = merge_rows(self.matrix, self.review_ids, self.delta.matrix, self.delta.review_ids)
+        return TfidfIndex(self.vectorizer, matrix, review_ids)
+
+    def lookup_rows(self, review_ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Maps review ids to matrix rows. Returns (rows, found_mask)."""
+        ids = np.asarray(review_ids, dtype=np.int64)
+        rows = np.searchsorted(self.review_ids, ids)
+        rows = np.minimum(rows, max(len(self.review_ids) - 1, 0))
+        found = (self.review_ids[rows] == ids) if len(self.review_ids) else np.zeros(len(ids), dtype=bool)
+        return rows, found
+
+    def score(self, query: str, review_ids: Sequence[int], texts: Sequence[str] = None) -> np.ndarray:
+        """Cosine similarity between the query and the given reviews (see score_segment)."""
+        return score_with_delta(self, query, review_ids, texts)
+
+    def score_segment(self, query: str, review_ids: Sequence[int], texts: Sequence[str] = None) -> np.ndarray:
+        """
+        Cosine similarity between the query and the given reviews of this segment.
+        Only the query is transformed; indexed reviews are scored with a sparse
+        dot product against their precomputed rows. Reviews added after the
+        index was built are transformed on the fly when their texts are given.
+        """
+        scores = np.zeros(len(review_ids), dtype=np.float32)
+        if not len(review_ids):
+            return scores
+
+        query_vector = self.vectorizer.transform([preprocess_text(query)]).T
+        rows, found = self.lookup_rows(review_ids)
+        if found.any():
+            scores[found] = (self.matrix[rows[found]] @ query_vector).toarray().ravel()
+
+        missing = np.flatnonzero(~found)
+        if texts is not None and len(missing):
+            missing_matrix = self.vectorizer.transform([preprocess_text(texts[i]) for i in missing])
+            scores[missing] = (missing_matrix @ query_vector).toarray().ravel()
+
+        return scores
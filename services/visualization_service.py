@@ -1,5 +1,5 @@
 import io
-import sqlite3
+import re
 import matplotlib
 matplotlib.use('Agg')  # Use AGG backend
 import matplotlib.pyplot as plt
@@ -7,11 +7,18 @@ from flask import Response
 from typing import Dict, List
 import plotly.express as px
 import plotly.graph_objects as go
-from services.db_service import get_top_genres, get_top_publishers, get_top_developers
+from services.connection_service import DATABASE, get_read_connection
+from services.aggregate_service import get_top_counts
+from services.chart_cache_service import chart_cache
+from services.db_service import get_top_genres, get_top_publishers, get_top_developers, get_unique_genres
+from services.term_frequency_service import get_term_frequencies, term_frequencies_available
 from wordcloud import WordCloud
-import base64
+from PIL import features
 
-DATABASE = 'data/steam_reviews_with_authors.db'  # Fixed database name to match the one we're using
+# Word cloud image formats (WebP if Pillow was built with it) -> mimetype
+WORD_CLOUD_FORMATS = {'png': 'image/png'}
+if features.check('webp'):
+    WORD_CLOUD_FORMATS['webp'] = 'image/webp'
 
 class VisualizationService:
     def __init__(self):
@@ -19,12 +26,8 @@ class VisualizationService:
         self.colormap = 'YlOrBr'  # Yellow-Orange-Brown colormap
         self.database = DATABASE
 
-    def generate_word_cloud(self, text: str, width: int = 800, height: int = 400) -> str:
-        """Generate a word cloud from the given text and return as base64 image."""
-        if not text:
-            return ""
-            
-        wordcloud = WordCloud(
+    def _create_word_cloud(self, width: int, height: int) -> WordCloud:
+        return WordCloud(
             width=width,
             height=height,
             background_color=self.background_color,
@@ -32,59 +35,87 @@ class VisualizationService:
             min_font_size=10,
             max_font_size=60,
             prefer_horizontal=0.7
-        ).generate(text)
-
-        # Create a figure with the matching background color
-        fig = plt.figure(figsize=(width/100, height/100), facecolor=self.background_color)
-        ax = plt.Axes(fig, [0., 0., 1., 1.])
-        ax.set_axis_off()
-        fig.add_axes(ax)
-
-        # Display the word cloud
-        plt.imshow(wordcloud, interpolation='bilinear')
-        plt.axis('off')
-
-        # Convert plot to base64 string
-        img = io.BytesIO()
-        plt.savefig(img, format='png', facecolor=self.background_color, bbox_inches='tight', pad_inches=0)
-        plt.close()
-        img.seek(0)
-        
-        return base64.b64encode(img.getvalue()).decode()
+        )
+
+    def _render_image(self, wordcloud: WordCloud, image_format: str) -> bytes:
+        """Encodes a laid-out word cloud straight from its PIL image."""
+        buffer = io.BytesIO()
+        wordcloud.to_image().save(buffer, format=image_format.upper())
+        return buffer.getvalue()
+
+    def generate_word_cloud(self, text: str, width: int = 800, height: int = 400,
+                            image_format: str = 'png') -> bytes:
+        """Generate a word cloud from the given text and return the encoded image."""
+        if not text:
+            return b""
+            
+        wordcloud = self._create_word_cloud(width, height).generate(text)
+        return self._render_image(wordcloud, image_format)
+
+    def generate_word_cloud_from_frequencies(self, frequencies: Dict[str, int], width: int = 800,
+                                             height: int = 400, image_format: str = 'png') -> bytes:
+        """Generate a word cloud from precomputed term frequencies and return the encoded image."""
+        if not frequencies:
+            return b""
+
+        wordcloud = self._create_word_cloud(width, height).generate_from_frequencies(frequencies)
+        return self._render_image(wordcloud, image_format)
+
+    def get_word_cloud(self, genre: str = '', image_format: str = 'png') -> bytes:
+        """
+        Word cloud of all reviews, or of the reviews of a genre, as an encoded
+        image (see WORD_CLOUD_FORMATS). Uses the corpus-wide term frequencies
+        when they are built (rendered clouds of the listed genres are cached
+        until the data changes) and falls back to sampling review texts
+        otherwise.
+        """
+        if not term_frequencies_available(self.database):
+            text = self.get_reviews_text_by_genre(genre) if genre else self.get_all_reviews_text()
+            return self.generate_word_cloud(text, image_format=image_format)
+
+        render = lambda: self.generate_word_cloud_from_frequencies(
+            get_term_frequencies(genre, database=self.database), image_format=image_format
+        )
+        if genre and genre not in get_unique_genres():
+            return render()
+        name = f"word_cloud_{re.sub(r'[^a-z0-9]+', '_', genre.lower())}" if genre else 'word_cloud'
+        return chart_cache.get_or_render(name, image_format, render)
 
     def get_all_reviews_text(self) -> str:
         """Get concatenated text of all reviews."""
-        conn = sqlite3.connect(self.database)
-        cursor = conn.cursor()
+        cursor = get_read_connection(self.database).cursor()
         
         cursor.execute("SELECT content FROM reviews LIMIT 1000")  # Limit to prevent memory issues
         reviews = cursor.fetchall()
         
-        conn.close()
+        cursor.close()
         
         return " ".join([review[0] for review in reviews if review[0]])
 
     def get_reviews_text_by_genre(self, genre: str) -> str:
-        """Get concatenated text of reviews for games in a specific genre."""
-        conn = sqlite3.connect(self.database)
-        cursor = conn.cursor()
+        """Get concatenated text of reviews for games of a genre value (matched exactly, like get_term_frequencies)."""
+        cursor = get_read_connection(self.database).cursor()
         
         query = """
             SELECT r.content
             FROM reviews r
             JOIN games g ON r.app_id = g.app_id
-            WHERE g.genre LIKE ?
+            WHERE g.genre = ?
             LIMIT 1000
         """
-        cursor.execute(query, (f"%{genre}%",))
+        cursor.execute(query, (genre,))
         
         reviews = cursor.fetchall()
-        conn.close()
+        cursor.close()
         
         return " ".join([review[0] for review in reviews if review[0]])
 
 def get_top_authors(limit=10):
     """Pobiera Top 10 autorów według liczby recenzji."""
+    top = get_top_counts('author', limit)
+    if top is not None:
+        return [(row['name'], row['review_count']) for row in top]
+
     query = """
         SELECT author_id, COUNT(*) as review_count
         FROM reviews
@@ -92,13 +123,13 @@ def get_top_authors(limit=10):
         ORDER BY review_count DESC
         LIMIT ?
     """
-    con = sqlite3.connect(DATABASE)
-    cur = con.cursor()
+    cur = get_read_connection(DATABASE).cursor()
     cur.execute(query, (limit,))
     results = cur.fetchall()
-    con.close()
+    cur.close()
     return results
 
+@chart_cache.cached('top_authors', 'svg')
 def generate_top_authors_svg():
     """Generuje wykres słupkowy w formacie SVG."""
     # Pobierz dane
@@ -124,6 +155,7 @@ def generate_top_authors_svg():
 
     return svg_data
 
+@chart_cache.cached('top_genres', 'html')
 def create_top_genres_chart():
     data = get_top_genres()
     print("Creating genres chart with data:", data)
@@ -165,6 +197,7 @@ def create_top_genres_chart():
     )
     return fig.to_html(full_html=False, config={'displayModeBar': False})
 
+@chart_cache.cached('top_publishers', 'html')
 def create_top_publishers_chart():
     data = get_top_publishers()
     print("Creating publishers chart with data:", data)
@@ -206,6 +239,7 @@ def create_top_publishers_chart():
     )
     return fig.to_html(full_html=False, config={'displayModeBar': False})
 
+@chart_cache.cached('top_developers', 'html')
 def create_top_developers_chart():
     data = get_top_developers()
     print("Creating developers chart with data:", data)
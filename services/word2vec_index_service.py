@@ -0,0 +1,223 @@
+import os
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from gensim.models import KeyedVectors, Word2Vec
+from gensim.utils import simple_preprocess
+
+from .connection_service import DATABASE, connect_readonly
+from .index_update_service import (
+    check_rows, delta_path, files_signature, load_delta, merge_review_ids, remove_delta,
+    save_array, save_delta, score_with_delta
+)
+
+MODEL_DIR = 'data/search_models'
+
+WORD2VEC_PARAMS = {
+    'vector_size': 100,
+    'window': 5,
+    'min_count': 5,
+    'workers': 4
+}
+
+class ReviewSentences:
+    """
+    Restartable stream of tokenized reviews, so gensim can make several passes
+    over the corpus without holding it in memory.
+    """
+
+    def __init__(self, database: str = DATABASE, batch_size: int = 10000):
+        self.database = database
+        self.batch_size = batch_size
+
+    def __iter__(self) -> Iterator[List[str]]:
+        for _, texts in iter_review_batches(self.database, self.batch_size):
+            for text in texts:
+                tokens = simple_preprocess(text)
+                if tokens:
+                    yield tokens
+
+def iter_review_batches(database: str = DATABASE, batch_size: int = 10000) -> Iterator[Tuple[List[int], List[str]]]:
+    """Streams (ids, texts) batches from the reviews table ordered by id."""
+    con = connect_readonly(database)
+    cur = con.cursor()
+    try:
+        cur.execute("SELECT id, content FROM reviews ORDER BY id")
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [row[0] for row in rows], [row[1] or "" for row in rows]
+    finally:
+        cur.close()
+        con.close()
+
+def mean_vectors(wv: KeyedVectors, texts: Sequence[str]) -> np.ndarray:
+    """
+    L2-normalized mean word vector of each text, as a float32 (n, vector_size)
+    matrix. Texts without any known word get a zero row.
+    """
+    vectors = np.zeros((len(texts), wv.vector_size), dtype=np.float32)
+    for i, text in enumerate(texts):
+        keys = [token for token in simple_preprocess(text) if token in wv.key_to_index]
+        if keys:
+            vectors[i] = np.mean(wv[keys], axis=0)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+def merge_vectors(vectors: np.ndarray, review_ids: np.ndarray,
+                  new_vectors: np.ndarray, new_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows of new_ids replace or extend those of review_ids; returns (vectors, ids) in id order."""
+    keep, order, merged_ids = merge_review_ids(review_ids, new_ids)
+    merged = np.concatenate([np.asarray(vectors[keep], dtype=np.float32), new_vectors])[order]
+    return merged, merged_ids
+
+class Word2VecIndex:
+    """
+    Word2Vec vectors trained over the whole corpus, together with a dense
+    float32 matrix of normalized mean vectors, one row per review.
+    Row i of the matrix belongs to review_ids[i]; review_ids is sorted.
+
+    The memory-mapped base matrix (which the ANN index refers to) is only
+    written by build and compact. Reviews added or changed later go to a
+    small delta segment (a Word2VecIndex of its own) whose rows take
+    precedence over the base rows.
+    """
+
+    def __init__(self, wv: KeyedVectors, vectors: np.ndarray, review_ids: np.ndarray,
+                 delta: Optional['Word2VecIndex'] = None):
+        self.wv = wv
+        self.vectors = vectors
+        self.review_ids = review_ids
+        self.delta = delta
+
+    @classmethod
+    def build(cls, database: str = DATABASE, batch_size: int = 10000, **params) -> 'Word2VecIndex':
+        """Trains Word2Vec over all reviews and computes every review vector."""
+        model = Word2Vec(sentences=ReviewSentences(database, batch_size), **{**WORD2VEC_PARAMS, **params})
+        wv = model.wv
+
+        ids, blocks = [], []
+        for batch_ids, texts in iter_review_batches(database, batch_size):
+            ids.extend(batch_ids)
+            blocks.append(mean_vectors(wv, texts))
+
+        vectors = np.vstack(blocks) if blocks else np.zeros((0, wv.vector_size), dtype=np.float32)
+        return cls(wv, vectors, np.asarray(ids, dtype=np.int64))
+
+    @staticmethod
+    def signature(model_dir: str = MODEL_DIR) -> tuple:
+        """Changes whenever the saved index (base or delta) is rewritten."""
+        return files_signature(os.path.join(model_dir, name) for name in (
+            'word2vec.kv', 'word2vec_vectors.npy', 'word2vec_ids.npy', 'word2vec_delta.npz'
+        ))
+
+    def save(self, model_dir: str = MODEL_DIR, save_model: bool = True):
+        """
+        Writes the word vectors (unless save_model is False) and the base review
+        matrix, then drops the delta segment. Call on a built or compacted index.
+        """
+        if self.delta is not None:
+            raise ValueError("Compact the index before saving its base")
+        os.makedirs(model_dir, exist_ok=True)
+        if save_model:
+            self.wv.save(os.path.join(model_dir, 'word2vec.kv'))
+        save_array(os.path.join(model_dir, 'word2vec_vectors.npy'), self.vectors)
+        save_array(os.path.join(model_dir, 'word2vec_ids.npy'), self.review_ids)
+        remove_delta(delta_path(model_dir, 'word2vec'))
+
+    def save_delta(self, model_dir: str = MODEL_DIR):
+        """Writes only the delta segment; the base files are left untouched."""
+        save_delta(delta_path(model_dir, 'word2vec'), vectors=self.delta.vectors, ids=self.delta.review_ids)
+
+    @classmethod
+    def load(cls, model_dir: str = MODEL_DIR, mmap: bool = True) -> Optional['Word2VecIndex']:
+        """Loads a saved index with memory-mapped arrays. Returns None if it was never built."""
+        kv_path = os.path.join(model_dir, 'word2vec.kv')
+        if not os.path.exists(kv_path):
+            return None
+
+        mmap_mode = 'r' if mmap else None
+        wv = KeyedVectors.load(kv_path, mmap=mmap_mode)
+        vectors = np.load(os.path.join(model_dir, 'word2vec_vectors.npy'), mmap_mode=mmap_mode)
+        ids_path = os.path.join(model_dir, 'word2vec_ids.npy')
+        review_ids = np.load(ids_path)
+        check_rows('Word2Vec', len(review_ids), len(vectors))
+
+        delta = None
+        arrays = load_delta(delta_path(model_dir, 'word2vec'), ids_path)
+        if arrays is not None:
+            check_rows('Word2Vec delta', len(arrays['ids']), len(arrays['vectors']))
+            delta = cls(wv, arrays['vectors'], arrays['ids'])
+        return cls(wv, vectors, review_ids, delta)
+
+    def update(self, review_ids: np.ndarray, texts: Iterable[str], batch_size: int = 10000) -> 'Word2VecIndex':
+        """
+        Index with the rows of the given sorted, unique review ids replaced or
+        added in the delta segment. Only these texts (in review_ids order) are
+        vectorized and only the delta is merged; the word vectors are kept as
+        trained.
+        """
+        texts = iter(texts)
+        blocks = [
+            mean_vectors(self.wv, list(islice(texts, batch_size)))
+            for _ in range(0, len(review_ids), batch_size)
+        ]
+        new_vectors = np.concatenate(blocks) if blocks else np.zeros((0, self.wv.vector_size), dtype=np.float32)
+        review_ids = np.asarray(review_ids, dtype=np.int64)
+        if self.delta is None:
+            delta = Word2VecIndex(self.wv, new_vectors, review_ids)
+        else:
+            delta = Word2VecIndex(self.wv, *merge_vectors(self.delta.vectors, self.delta.review_ids,
+                                                          new_vectors, review_ids))
+        return Word2VecIndex(self.wv, self.vectors, self.review_ids, delta)
+
+    def compact(self) -> 'Word2VecIndex':
+        """Index with the delta segment merged into the base (reads the whole base)."""
+        if self.delta is None:
+            return self
+        return Word2VecIndex(self.wv, *merge_vectors(self.vectors, self.review_ids,
+                                                     self.delta.vectors, self.delta.review_ids))
+
+    def lookup_rows(self, review_ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Maps review ids to matrix rows. Returns (rows, found_mask)."""
+        ids = np.asarray(review_ids, dtype=np.int64)
+        if not len(self.review_ids):
+            return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+        rows = np.minimum(np.searchsorted(self.review_ids, ids), len(self.review_ids) - 1)
+        return rows, self.review_ids[rows] == ids
+
+    def query_vector(self, query: str) -> Optional[np.ndarray]:
+        """Normalized mean vector of the query, or None if no query word is known."""
+        vector = mean_vectors(self.wv, [query])[0]
+        return vector if vector.any() else None
+
+    def score(self, query: str, review_ids: Sequence[int], texts: Sequence[str] = None) -> np.ndarray:
+        """Cosine similarity between the query and the given reviews (see score_segment)."""
+        return score_with_delta(self, query, review_ids, texts)
+
+    def score_segment(self, query: str, review_ids: Sequence[int], texts: Sequence[str] = None) -> np.ndarray:
+        """
+        Cosine similarity between the query and the given reviews of this segment, mapped from
+        [-1, 1] to [0, 1] with one matrix-vector product. Reviews without any
+        known word score 0.0; reviews newer than the index are vectorized on
+        the fly when their texts are given.
+        """
+        scores = np.zeros(len(review_ids), dtype=np.float32)
+        query_vector = self.query_vector(query)
+        if query_vector is None or not len(review_ids):
+            return scores
+
+        candidate_vectors = np.zeros((len(review_ids), self.wv.vector_size), dtype=np.float32)
+        rows, found = self.lookup_rows(review_ids)
+        candidate_vectors[found] = self.vectors[rows[found]]
+        missing = np.flatnonzero(~found)
+        if texts is not None and len(missing):
+            candidate_vectors[missing] = mean_vectors(self.wv, [texts[i] for i in missing])
+
+        similarities = candidate_vectors @ query_vector
+        has_vector = candidate_vectors.any(axis=1)
+        scores[has_vector] = (similarities[has_vector] + 1) / 2
+        return scores